@@ -0,0 +1,126 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+DIRECTORIO_BENCHMARKS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIRECTORIO_BENCHMARKS)
+
+from benchmark import (  # noqa: E402
+    Estadisticas, comparar, entorno_servicio, percentil, reproducir_trafico, resumir
+)
+
+
+def _resultado(p95_ms=10.0, rps=100.0, escenario="reservas", concurrencia=20, peticiones=1000):
+    datos = {"peticiones": peticiones, "rps": rps, "p95_ms": p95_ms}
+    return {
+        "escenario": escenario,
+        "concurrencia": concurrencia,
+        "endpoints": {"GET citas:/citas/": dict(datos)},
+        "total": dict(datos),
+    }
+
+
+def test_percentil_por_rango_mas_cercano():
+    """Probar el percentil por rango más cercano en los bordes y con pocas muestras"""
+    valores = [float(v) for v in range(1, 101)]
+    assert [percentil(valores, p) for p in (50, 95, 99, 100)] == [50.0, 95.0, 99.0, 100.0]
+    assert percentil([0.01, 0.02, 0.03, 0.04], 50) == 0.02
+    assert percentil([0.01, 0.02, 0.03, 0.04], 95) == 0.04
+    assert percentil([0.5], 99) == 0.5
+    assert percentil([], 95) == 0.0
+
+
+def test_resumir_estadisticas():
+    """Probar el resumen en milisegundos, req/s y conteo de rechazos y errores"""
+    estadisticas = Estadisticas()
+    for segundos, estado in [(0.004, 200), (0.001, 201), (0.003, 409), (0.002, 500), (0.010, None)]:
+        estadisticas.registrar(segundos, estado)
+
+    assert resumir(estadisticas, 2.0) == {
+        "peticiones": 5,
+        "rechazadas": 1,
+        "errores": 2,
+        "rps": 2.5,
+        "p50_ms": 3.0,
+        "p95_ms": 10.0,
+        "p99_ms": 10.0,
+        "max_ms": 10.0,
+    }
+    assert resumir(Estadisticas(), 0)["rps"] == 0.0
+
+
+def test_comparar_con_linea_base():
+    """Probar el umbral de regresión de p95 y req/s y el rechazo de ejecuciones no equivalentes"""
+    base = _resultado()
+    assert comparar(base, _resultado(), 0.2) == []
+    # Dentro de la tolerancia
+    assert comparar(base, _resultado(p95_ms=11.9, rps=81.0), 0.2) == []
+
+    regresiones = comparar(base, _resultado(p95_ms=12.5, rps=70.0), 0.2)
+    assert regresiones == [
+        "GET citas:/citas/: p95 10.0 ms -> 12.5 ms",
+        "GET citas:/citas/: 100.0 req/s -> 70.0 req/s",
+        "TOTAL: p95 10.0 ms -> 12.5 ms",
+        "TOTAL: 100.0 req/s -> 70.0 req/s",
+    ]
+
+    # Endpoints sin muestras en la base o ausentes en la ejecución actual no se comparan
+    sin_muestras = _resultado(peticiones=0)
+    assert comparar(sin_muestras, _resultado(p95_ms=50.0), 0.2) == []
+    actual = _resultado(p95_ms=50.0)
+    actual["endpoints"] = {}
+    assert comparar(base, actual, 0.2) == ["TOTAL: p95 10.0 ms -> 50.0 ms"]
+
+    for distinta in (_resultado(escenario="reproducir"), _resultado(concurrencia=50)):
+        regresiones = comparar(base, distinta, 0.2)
+        assert len(regresiones) == 1
+        assert "solo se comparan ejecuciones equivalentes" in regresiones[0]
+
+
+def test_reproducir_trafico_de_ejemplo():
+    """Probar la lectura del tráfico grabado de ejemplo y que se repite en bucle"""
+    ruta = os.path.join(DIRECTORIO_BENCHMARKS, "trafico_ejemplo.jsonl")
+    peticiones = list(itertools.islice(reproducir_trafico(ruta), 14))
+
+    assert [p.nombre for p in peticiones[:7]] == [
+        "GET clientes:/clientes/",
+        "GET barberos:/barberos/",
+        "GET citas:/citas/",
+        "GET citas:/citas/?expandir",
+        "GET citas:/citas/barbero/{id}",
+        "GET citas:/disponibilidad",
+        "GET citas:/health",
+    ]
+    assert peticiones[0].params == {"limit": 50}
+    assert peticiones[6].params is None and peticiones[6].cuerpo is None
+    assert [p.nombre for p in peticiones[7:]] == [p.nombre for p in peticiones[:7]]
+
+
+def test_reproducir_trafico_normaliza_y_valida(tmp_path):
+    """Probar que el método se normaliza y que un archivo sin peticiones se rechaza"""
+    ruta = tmp_path / "trafico.jsonl"
+    ruta.write_text(
+        '{"servicio": "citas", "metodo": "post", "ruta": "/citas/", "cuerpo": {"cliente_id": 1}}\n\n',
+        encoding="utf-8"
+    )
+    peticion = next(reproducir_trafico(str(ruta)))
+    assert (peticion.metodo, peticion.nombre, peticion.cuerpo) == ("POST", "POST citas:/citas/", {"cliente_id": 1})
+
+    vacio = tmp_path / "vacio.jsonl"
+    vacio.write_text("\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        next(reproducir_trafico(str(vacio)))
+
+
+def test_entorno_servicio_lleva_token_de_eventos():
+    """Probar que los servicios levantados reciben el webhook junto con su token"""
+    urls = {"clientes": "http://127.0.0.1:1", "barberos": "http://127.0.0.1:2", "citas": "http://127.0.0.1:3"}
+    entorno = entorno_servicio("sqlite:///citas.db", urls, "secreto")
+
+    assert entorno["OUTBOX_WEBHOOK_URL"] == "http://127.0.0.1:3/eventos"
+    assert entorno["EVENTOS_TOKEN"] == "secreto"
+    assert entorno["DATABASE_URL"] == "sqlite:///citas.db"
+    assert entorno["CLIENTES_SERVICE_URL"] == urls["clientes"]
+    assert entorno["BARBEROS_SERVICE_URL"] == urls["barberos"]
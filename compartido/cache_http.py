@@ -0,0 +1,71 @@
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from .cache_compartido import CacheCompartido, cache_compartido
+
+# Segundos que un cliente HTTP puede reutilizar una respuesta sin revalidarla
+CACHE_CONTROL_MAX_AGE = int(os.getenv("CACHE_CONTROL_MAX_AGE", 0))
+# Vida de las respuestas guardadas; con CACHE_BACKEND=memoria acota cuánto tarda
+# en verse un cambio hecho por otro worker (con redis la invalidación es compartida)
+RESPUESTAS_CACHE_TTL = float(os.getenv("RESPUESTAS_CACHE_TTL", 5))
+
+_adaptadores: Dict[Any, TypeAdapter] = {}
+
+
+def serializar(esquema: Any, contenido: Any, cabeceras: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Serializar el contenido con su esquema y calcular su ETag"""
+    adaptador = _adaptadores.get(esquema)
+    if adaptador is None:
+        adaptador = _adaptadores[esquema] = TypeAdapter(esquema)
+    cuerpo = adaptador.dump_json(adaptador.validate_python(contenido, from_attributes=True))
+    return {
+        "cuerpo": cuerpo.decode(),
+        "etag": f'"{hashlib.sha1(cuerpo).hexdigest()}"',
+        "cabeceras": cabeceras or {},
+    }
+
+
+class CacheRespuestas:
+    """Respuestas JSON ya serializadas, con su ETag, en el cache compartido.
+
+    Cualquier escritura invalida el espacio completo (los listados dependen de
+    todos los registros); una lectura que empezó antes de la invalidación se
+    guarda con la versión anterior y ya no es visible.
+    """
+
+    ESPACIO = "respuestas"
+
+    def __init__(self, cache: CacheCompartido, ttl: float = RESPUESTAS_CACHE_TTL):
+        self.cache = cache
+        self.ttl = ttl
+
+    async def obtener(self, clave: str, cargar: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Respuesta guardada para la clave, o la que devuelva ``cargar`` (una sola vez por clave)"""
+        return await self.cache.obtener_o_calcular(self.ESPACIO, clave, cargar, self.ttl)
+
+    async def invalidar(self) -> None:
+        await self.cache.invalidar(self.ESPACIO)
+
+
+def clave_peticion(request: Request) -> str:
+    return f"{request.url.path}?{request.url.query}"
+
+
+def responder(request: Request, respuesta: Dict[str, Any]) -> Response:
+    """Responder 304 si el cliente ya tiene esta versión (If-None-Match) o el JSON completo"""
+    cabeceras = {"ETag": respuesta["etag"], "Cache-Control": f"private, max-age={CACHE_CONTROL_MAX_AGE}"}
+    etags = {etag.strip().removeprefix("W/") for etag in request.headers.get("if-none-match", "").split(",")}
+    if respuesta["etag"] in etags or "*" in etags:
+        return Response(status_code=304, headers=cabeceras)
+    return Response(
+        content=respuesta["cuerpo"],
+        media_type="application/json",
+        headers={**respuesta["cabeceras"], **cabeceras}
+    )
+
+
+cache_respuestas = CacheRespuestas(cache_compartido)
@@ -0,0 +1,110 @@
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+from .servicio import NOMBRE
+
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///./{NOMBRE}.db")
+
+# Para compatibilidad con Render (postgresql:// -> postgresql+psycopg2://)
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+def url_async(url: str) -> str:
+    """Convertir la URL síncrona (usada por las migraciones) al driver asíncrono"""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+# Los endpoints usan asyncpg (Postgres) o aiosqlite (local y pruebas)
+ASYNC_DATABASE_URL = url_async(DATABASE_URL)
+
+def _env_bool(nombre: str, por_defecto: bool) -> bool:
+    """Leer una variable de entorno booleana"""
+    valor = os.getenv(nombre)
+    if valor is None:
+        return por_defecto
+    return valor.strip().lower() in ("1", "true", "yes", "si", "on")
+
+# Configuración del pool de conexiones (ajustable por variables de entorno)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Render cierra las conexiones inactivas: reciclarlas antes evita errores tras periodos sin tráfico
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+# Tiempo máximo por sentencia en Postgres (0 = sin límite)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+def opciones_engine(url: str) -> Dict[str, Any]:
+    """Argumentos de create_async_engine según el motor y la configuración del pool"""
+    if url.startswith("sqlite"):
+        return {}
+
+    opciones: Dict[str, Any] = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith("postgresql"):
+        opciones["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return opciones
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **opciones_engine(ASYNC_DATABASE_URL))
+
+# expire_on_commit=False: tras confirmar, los objetos conservan los valores que
+# se acaban de escribir y las respuestas no necesitan volver a leerlos
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
+        yield db
+
+def get_sesiones() -> async_sessionmaker:
+    """Fábrica de sesiones para el trabajo que sigue tras responder (p. ej. exportar en streaming)"""
+    return SessionLocal
+
+
+async def actualizar_fila(db: AsyncSession, modelo: Any, entidad_id: int, valores: Dict[str, Any]) -> Optional[Any]:
+    """Actualizar una fila por ID y devolverla con un solo UPDATE ... RETURNING.
+
+    Devuelve ``None`` si la fila no existe. Si el motor no admite RETURNING
+    (SQLite anterior a 3.35) se lee la fila y se actualiza con el ORM.
+    """
+    if not valores:
+        return await db.get(modelo, entidad_id)
+    if not db.get_bind().dialect.update_returning:
+        entidad = await db.get(modelo, entidad_id)
+        if entidad is not None:
+            for campo, valor in valores.items():
+                setattr(entidad, campo, valor)
+            await db.flush()
+        return entidad
+    return await db.scalar(update(modelo).where(modelo.id == entidad_id).values(**valores).returning(modelo))
+
+
+def estadisticas_pool() -> Dict[str, Any]:
+    """Uso actual del pool de conexiones del engine"""
+    pool = engine.pool
+    estadisticas: Dict[str, Any] = {"clase": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        estadisticas.update(
+            tamano=pool.size(),
+            en_uso=pool.checkedout(),
+            disponibles=pool.checkedin(),
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    return estadisticas
@@ -0,0 +1,64 @@
+"""Aplicar las migraciones de la base de datos del servicio.
+
+Se ejecuta una vez por despliegue, antes de levantar uvicorn:
+
+    python -m app.migrate
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, pool, text
+
+from .database import DATABASE_URL
+from .servicio import CLAVE_BLOQUEO_MIGRACIONES, TABLAS_INICIALES
+
+DIRECTORIO_SERVICIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bases creadas antes de las migraciones (con Base.metadata.create_all) ya
+# tienen las tablas de TABLAS_INICIALES: se marcan con esta revisión en lugar de recrearlas
+REVISION_INICIAL = "0001"
+
+
+def configuracion_alembic() -> Config:
+    """Configuración de Alembic con rutas absolutas al directorio del servicio"""
+    config = Config(os.path.join(DIRECTORIO_SERVICIO, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(DIRECTORIO_SERVICIO, "migrations"))
+    config.attributes["configurar_logging"] = False
+    return config
+
+
+def migrar(url: str = DATABASE_URL, revision: str = "head") -> None:
+    """Llevar la base de datos a la revisión indicada"""
+    engine = create_engine(url, poolclass=pool.NullPool)
+    try:
+        with engine.connect() as connection:
+            postgres = connection.dialect.name == "postgresql"
+            if postgres:
+                connection.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": CLAVE_BLOQUEO_MIGRACIONES})
+                connection.commit()
+            try:
+                config = configuracion_alembic()
+                config.attributes["connection"] = connection
+                version_table = config.get_main_option("version_table")
+
+                tablas = inspect(connection).get_table_names()
+                connection.commit()
+                if version_table not in tablas and all(t in tablas for t in TABLAS_INICIALES):
+                    command.stamp(config, REVISION_INICIAL)
+                    connection.commit()
+
+                command.upgrade(config, revision)
+                connection.commit()
+            finally:
+                if postgres:
+                    connection.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": CLAVE_BLOQUEO_MIGRACIONES})
+                    connection.commit()
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    migrar()
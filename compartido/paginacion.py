@@ -0,0 +1,78 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Cabecera con el cursor de la página siguiente (el cuerpo sigue siendo una lista)
+CABECERA_CURSOR = "X-Next-Cursor"
+# Tamaño máximo de página de los listados; citas pide a clientes y barberos
+# páginas de hasta 1000 (su máximo de IDs por consulta)
+MAX_LIMIT = 1000
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    """Convertir los valores de la clave de orden en un token opaco"""
+    datos = json.dumps(list(valores), separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip("=")
+
+
+def decodificar_cursor(token: str, longitud: int) -> List[Any]:
+    """Recuperar los valores de un token generado por ``codificar_cursor``"""
+    try:
+        relleno = "=" * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    if not isinstance(valores, list) or len(valores) != longitud:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return valores
+
+
+def decodificar_cursor_id(token: str) -> int:
+    """Cursor de los listados ordenados solo por ID"""
+    (ultimo_id,) = decodificar_cursor(token, 1)
+    if not isinstance(ultimo_id, int):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return ultimo_id
+
+
+def validar_paginacion(skip: int, after: Optional[str]) -> None:
+    """El cursor y el desplazamiento son modos de paginación excluyentes"""
+    if after is not None and skip:
+        raise HTTPException(status_code=400, detail="No se puede combinar skip con after")
+
+
+async def obtener_pagina(
+    db: AsyncSession,
+    query: Select,
+    limit: int,
+    claves: Sequence[str],
+    filas_completas: bool = False
+) -> Tuple[List[Any], Optional[str]]:
+    """Ejecutar la consulta pidiendo una fila extra para saber si hay otra página.
+
+    La consulta debe venir ordenada por ``claves``; el cursor siguiente se
+    construye con los valores de esas columnas en la última fila devuelta.
+    Con ``filas_completas`` se devuelven filas con todas las entidades
+    seleccionadas y las claves se leen de la primera.
+    """
+    if limit <= 0:
+        return [], None
+    if filas_completas:
+        filas = list((await db.execute(query.limit(limit + 1))).all())
+    else:
+        filas = list((await db.scalars(query.limit(limit + 1))).all())
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    ultima = filas[-1][0] if filas_completas else filas[-1]
+    return filas, codificar_cursor([getattr(ultima, clave) for clave in claves])
+
+
+def agregar_cursor(response: Response, cursor: Optional[str]) -> None:
+    """Publicar el cursor de la página siguiente en la respuesta"""
+    if cursor is not None:
+        response.headers[CABECERA_CURSOR] = cursor
@@ -0,0 +1,88 @@
+"""Copiar los módulos compartidos de compartido/ a cada servicio.
+
+Cada servicio se construye y despliega desde su propio directorio (Docker y
+Render usan services/<servicio> como raíz), así que no puede importar un
+paquete común: los módulos se editan solo aquí y se copian a
+services/<servicio>/app/. Lo que cambia entre servicios vive en el
+app/servicio.py de cada uno.
+
+    python compartido/sincronizar.py              # actualizar las copias
+    python compartido/sincronizar.py --comprobar  # solo verificar (CI)
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+RAIZ = Path(__file__).resolve().parent.parent
+ORIGEN = RAIZ / "compartido"
+SERVICIOS = ("clientes", "barberos", "citas")
+
+# Módulo -> servicios que lo usan
+MODULOS: Dict[str, Tuple[str, ...]] = {
+    "cache_compartido": SERVICIOS,
+    "cache_http": ("clientes", "barberos"),
+    "database": SERVICIOS,
+    "exportacion": SERVICIOS,
+    "metricas": SERVICIOS,
+    "migrate": SERVICIOS,
+    "outbox": ("clientes", "barberos"),
+    "paginacion": SERVICIOS,
+    "perfilado": SERVICIOS,
+    "trazas": SERVICIOS,
+}
+
+CABECERA = "# Copia de compartido/{modulo}.py: editar el original y ejecutar python compartido/sincronizar.py\n"
+
+
+def contenido_esperado(modulo: str) -> str:
+    return CABECERA.format(modulo=modulo) + (ORIGEN / f"{modulo}.py").read_text(encoding="utf-8")
+
+
+def copias() -> List[Tuple[str, Path]]:
+    return [
+        (modulo, RAIZ / "services" / servicio / "app" / f"{modulo}.py")
+        for modulo, servicios in MODULOS.items()
+        for servicio in servicios
+    ]
+
+
+def desactualizadas() -> List[Path]:
+    """Copias que no coinciden con su original"""
+    return [
+        destino for modulo, destino in copias()
+        if not destino.exists() or destino.read_text(encoding="utf-8") != contenido_esperado(modulo)
+    ]
+
+
+def sincronizar() -> List[Path]:
+    """Reescribir las copias desactualizadas y devolverlas"""
+    cambiadas = desactualizadas()
+    for modulo, destino in copias():
+        if destino in cambiadas:
+            destino.write_text(contenido_esperado(modulo), encoding="utf-8")
+    return cambiadas
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comprobar", action="store_true", help="fallar si alguna copia difiere del original")
+    args = parser.parse_args(argv)
+
+    if args.comprobar:
+        pendientes = desactualizadas()
+        for destino in pendientes:
+            print(f"Desactualizada: {destino.relative_to(RAIZ)}", file=sys.stderr)
+        if pendientes:
+            print("Ejecute python compartido/sincronizar.py y confirme las copias", file=sys.stderr)
+            return 1
+        print(f"{len(copias())} copias al día")
+        return 0
+
+    for destino in sincronizar():
+        print(f"Actualizada: {destino.relative_to(RAIZ)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""Trazas distribuidas con propagación W3C Trace Context (cabecera ``traceparent``).
+
+Cada petición HTTP abre un span de servidor que continúa la traza recibida; las
+consultas SQL y las llamadas a otros servicios se registran como spans hijos,
+y el ``traceparent`` se envía en las llamadas salientes para que los spans de
+clientes, barberos y citas compartan el mismo ``trace_id``.
+
+Los spans terminados se escriben como líneas JSON en TRAZAS_ARCHIVO (un
+colector puede leer ese archivo) con TRAZAS_EXPORTADOR=archivo.
+"""
+import json
+import os
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .metricas import plantilla_ruta
+from .servicio import NOMBRE
+
+SERVICIO = NOMBRE
+# "ninguno" (por defecto), "archivo" (JSON por líneas) o "memoria" (pruebas)
+TRAZAS_EXPORTADOR = os.getenv("TRAZAS_EXPORTADOR", "ninguno").strip().lower()
+TRAZAS_ARCHIVO = os.getenv("TRAZAS_ARCHIVO", "trazas.jsonl")
+# Fracción de trazas nuevas que se registran (las recibidas respetan la decisión del origen)
+TRAZAS_MUESTREO = float(os.getenv("TRAZAS_MUESTREO", 1.0))
+# Spans acumulados antes de escribirlos en el archivo
+TRAZAS_TAMANO_LOTE = int(os.getenv("TRAZAS_TAMANO_LOTE", 100))
+TRAZAS_LONGITUD_SQL = 500
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """Operación medida dentro de una traza"""
+
+    __slots__ = ("trace_id", "span_id", "padre_id", "nombre", "tipo", "muestreado",
+                 "inicio", "fin", "atributos", "error")
+
+    def __init__(
+        self,
+        nombre: str,
+        tipo: str,
+        trace_id: str,
+        padre_id: Optional[str],
+        muestreado: bool,
+        atributos: Optional[Dict[str, Any]] = None
+    ):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.padre_id = padre_id
+        self.nombre = nombre
+        self.tipo = tipo
+        self.muestreado = muestreado
+        self.inicio = time.time_ns()
+        self.fin: Optional[int] = None
+        self.atributos: Dict[str, Any] = dict(atributos or {})
+        self.error: Optional[str] = None
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.muestreado else '00'}"
+
+    def terminar(self) -> None:
+        if self.fin is None:
+            self.fin = time.time_ns()
+            if self.muestreado:
+                exportador.exportar(self)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "servicio": SERVICIO,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "padre_id": self.padre_id,
+            "nombre": self.nombre,
+            "tipo": self.tipo,
+            "inicio_ns": self.inicio,
+            "duracion_ms": round(((self.fin or time.time_ns()) - self.inicio) / 1e6, 3),
+            "atributos": self.atributos,
+            "estado": "error" if self.error else "ok",
+            **({"error": self.error} if self.error else {}),
+        }
+
+
+class Exportador:
+    """Destino de los spans terminados según TRAZAS_EXPORTADOR"""
+
+    def __init__(self, tipo: str = TRAZAS_EXPORTADOR, ruta: str = TRAZAS_ARCHIVO, tamano_lote: int = TRAZAS_TAMANO_LOTE):
+        if tipo not in ("ninguno", "archivo", "memoria"):
+            raise ValueError(f"TRAZAS_EXPORTADOR desconocido: {tipo}")
+        self.tipo = tipo
+        self.ruta = ruta
+        self.tamano_lote = tamano_lote
+        self.spans: List[Dict[str, Any]] = []
+
+    @property
+    def activo(self) -> bool:
+        return self.tipo != "ninguno"
+
+    def exportar(self, span: Span) -> None:
+        self.spans.append(span.como_dict())
+        if self.tipo == "archivo" and len(self.spans) >= self.tamano_lote:
+            self.vaciar()
+
+    def vaciar(self) -> None:
+        """Escribir en el archivo los spans pendientes"""
+        if self.tipo != "archivo" or not self.spans:
+            return
+        pendientes, self.spans = self.spans, []
+        with open(self.ruta, "a", encoding="utf-8") as archivo:
+            for span in pendientes:
+                archivo.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+
+exportador = Exportador()
+
+_span_actual: ContextVar[Optional[Span]] = ContextVar("span_actual", default=None)
+
+
+def span_actual() -> Optional[Span]:
+    return _span_actual.get()
+
+
+def id_traza_actual() -> Optional[str]:
+    """``trace_id`` de la petición en curso, para correlacionar logs"""
+    span = _span_actual.get()
+    return span.trace_id if span is not None else None
+
+
+def extraer_traceparent(valor: Optional[str]):
+    """(trace_id, span_id padre, muestreado) de una cabecera traceparent válida, o ``None``"""
+    if not valor:
+        return None
+    coincidencia = _TRACEPARENT.match(valor.strip().lower())
+    if coincidencia is None or set(coincidencia.group(1)) == {"0"} or set(coincidencia.group(2)) == {"0"}:
+        return None
+    trace_id, padre_id, banderas = coincidencia.groups()
+    return trace_id, padre_id, bool(int(banderas, 16) & 1)
+
+
+def crear_span(nombre: str, tipo: str = "interno", atributos: Optional[Dict[str, Any]] = None,
+               traceparent: Optional[str] = None) -> Span:
+    """Span hijo del span actual, de la traza recibida en ``traceparent`` o raíz de una nueva"""
+    padre = _span_actual.get()
+    if padre is not None:
+        return Span(nombre, tipo, padre.trace_id, padre.span_id, padre.muestreado, atributos)
+    recibido = extraer_traceparent(traceparent)
+    if recibido is not None:
+        trace_id, padre_id, muestreado = recibido
+        return Span(nombre, tipo, trace_id, padre_id, muestreado, atributos)
+    return Span(nombre, tipo, secrets.token_hex(16), None, random.random() < TRAZAS_MUESTREO, atributos)
+
+
+@contextmanager
+def iniciar_span(nombre: str, tipo: str = "interno", atributos: Optional[Dict[str, Any]] = None) -> Iterator[Optional[Span]]:
+    """Medir un bloque como span hijo del actual (``None`` si las trazas están desactivadas)"""
+    if not exportador.activo:
+        yield None
+        return
+    span = crear_span(nombre, tipo, atributos)
+    token = _span_actual.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        span.error = type(error).__name__
+        raise
+    finally:
+        _span_actual.reset(token)
+        span.terminar()
+
+
+def cabeceras_propagacion(span: Optional[Span]) -> Dict[str, str]:
+    """Cabeceras para continuar la traza en el servicio llamado"""
+    return {"traceparent": span.traceparent()} if span is not None else {}
+
+
+def instrumentar_engine(engine: AsyncEngine) -> None:
+    """Registrar cada consulta SQL como span hijo del span en curso"""
+    sync_engine = engine.sync_engine
+    if getattr(sync_engine, "_trazas_instaladas", False):
+        return
+    sync_engine._trazas_instaladas = True
+    sistema = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+        if not exportador.activo or _span_actual.get() is None:
+            return
+        span = crear_span("db.consulta", "cliente", {
+            "db.system": sistema,
+            "db.statement": " ".join(sentencia.split())[:TRAZAS_LONGITUD_SQL],
+        })
+        conn.info.setdefault("trazas_spans", []).append(span)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+        spans = conn.info.get("trazas_spans")
+        if spans:
+            spans.pop().terminar()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(contexto):
+        spans = contexto.connection.info.get("trazas_spans") if contexto.connection is not None else None
+        if spans:
+            span = spans.pop()
+            span.error = type(contexto.original_exception).__name__
+            span.terminar()
+
+
+class MiddlewareTrazas:
+    """Middleware ASGI que abre el span de servidor de cada petición.
+
+    Continúa la traza de la cabecera ``traceparent`` entrante y devuelve el
+    ``trace_id`` en X-Trace-Id para buscar la traza desde el cliente o los logs.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not exportador.activo:
+            await self.app(scope, receive, send)
+            return
+
+        cabeceras = dict(scope.get("headers", ()))
+        traceparent = cabeceras.get(b"traceparent", b"").decode("latin-1")
+        metodo = scope["method"]
+        span = crear_span(metodo, "servidor", {"http.method": metodo, "http.target": scope["path"]}, traceparent)
+        token = _span_actual.set(span)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                span.atributos["http.status_code"] = mensaje["status"]
+                if mensaje["status"] >= 500:
+                    span.error = f"HTTP {mensaje['status']}"
+                mensaje = {
+                    **mensaje,
+                    "headers": [*mensaje.get("headers", ()), (b"x-trace-id", span.trace_id.encode())]
+                }
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        except BaseException as error:
+            span.error = type(error).__name__
+            raise
+        finally:
+            _span_actual.reset(token)
+            ruta = plantilla_ruta(scope)
+            span.nombre = f"{metodo} {ruta}"
+            span.atributos["http.route"] = ruta
+            span.terminar()
@@ -59,6 +59,9 @@ run_service_tests() {
 # Ejecutar pruebas para cada servicio
 all_passed=true
 
+# Los módulos de compartido/ deben estar copiados sin cambios en cada servicio
+python compartido/sincronizar.py --comprobar || all_passed=false
+
 run_service_tests "clientes" || all_passed=false
 run_service_tests "barberos" || all_passed=false
 run_service_tests "citas" || all_passed=false
@@ -1,78 +1,187 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import os
 
-from .database import engine, get_db, Base
+from .database import SessionLocal, actualizar_fila, engine, get_db, get_sesiones, estadisticas_pool
 from .models import Barbero
-from .schemas import BarberoCreate, BarberoUpdate, BarberoResponse
+from .cache_http import cache_respuestas, clave_peticion, responder, serializar
+from .exportacion import FormatoExportacion, exportar
+from .metricas import TIPO_CONTENIDO, MiddlewareMetricas, instrumentar_engine, registrar_pool, registro
+from .perfilado import MiddlewarePerfilado
+from . import trazas
+from .trazas import MiddlewareTrazas
+from .outbox import Despachador, TipoEvento, instantanea, registrar_evento
+from .paginacion import CABECERA_CURSOR, MAX_LIMIT, decodificar_cursor_id, obtener_pagina, validar_paginacion
+from .schemas import BarberoCreate, BarberoUpdate, BarberoResponse, ExistenciaRequest, ExistenciaResponse
 
-# Crear las tablas
-Base.metadata.create_all(bind=engine)
+# Las tablas se crean con las migraciones (python -m app.migrate), no al importar
+
+# Entrega de los eventos del outbox al servicio de citas (si OUTBOX_WEBHOOK_URL está configurada)
+# y purga de los antiguos
+despachador = Despachador(SessionLocal)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arrancar el despachador del outbox al iniciar y detenerlo al apagar"""
+    await despachador.iniciar()
+    yield
+    await despachador.detener()
+    trazas.exportador.vaciar()
 
 app = FastAPI(
     title="Servicio de Barberos - Barbería",
     description="API para gestionar barberos de la barbería",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# El perfilado queda dentro de las métricas, que crean el acumulador de consultas;
+# las trazas envuelven a ambos para que sus logs lleven el trace_id
+app.add_middleware(MiddlewarePerfilado)
+app.add_middleware(MiddlewareMetricas)
+app.add_middleware(MiddlewareTrazas)
+instrumentar_engine(engine)
+trazas.instrumentar_engine(engine)
+registrar_pool(estadisticas_pool)
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "barberos"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return PlainTextResponse(registro.exponer(), media_type=TIPO_CONTENIDO)
+
+@app.get("/health/pool")
+def estado_pool():
+    """Uso del pool de conexiones a la base de datos"""
+    return estadisticas_pool()
+
+# Máximo de IDs aceptados en las consultas por lote
+MAX_IDS_LOTE = 1000
+
+def _parsear_ids(ids: str) -> List[int]:
+    """Convertir un parámetro "1,2,3" en una lista de enteros"""
+    try:
+        valores = [int(valor) for valor in ids.split(",") if valor.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El parámetro ids debe ser una lista de enteros separados por comas")
+    if len(valores) > MAX_IDS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Se admiten como máximo {MAX_IDS_LOTE} ids por consulta")
+    return valores
+
 @app.get("/barberos/", response_model=List[BarberoResponse])
-def listar_barberos(skip: int = 0, limit: int = 100, activos_solo: bool = False, db: Session = Depends(get_db)):
-    """Obtener lista de todos los barberos"""
-    query = db.query(Barbero)
+async def listar_barberos(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_LIMIT),
+    after: Optional[str] = None,
+    activos_solo: bool = False,
+    ids: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener lista de todos los barberos (o de los indicados en ids=1,2,3).
+
+    Admite paginación por desplazamiento (skip) o por cursor (after); el cursor
+    de la página siguiente se devuelve en la cabecera X-Next-Cursor. La
+    respuesta lleva ETag y se sirve desde cache mientras no haya escrituras.
+    """
+    validar_paginacion(skip, after)
+
+    async def cargar():
+        query = select(Barbero).order_by(Barbero.id)
+        if activos_solo:
+            query = query.where(Barbero.activo == True)
+        if ids is not None:
+            query = query.where(Barbero.id.in_(_parsear_ids(ids)))
+        if after is not None:
+            ultimo_id = decodificar_cursor_id(after)
+            query = query.where(Barbero.id > ultimo_id)
+        barberos, siguiente = await obtener_pagina(db, query.offset(skip), limit, ["id"])
+        cabeceras = {CABECERA_CURSOR: siguiente} if siguiente is not None else None
+        return serializar(List[BarberoResponse], barberos, cabeceras)
+
+    return responder(request, await cache_respuestas.obtener(clave_peticion(request), cargar))
+
+@app.post("/barberos/exists", response_model=ExistenciaResponse)
+async def verificar_existencia_barberos(solicitud: ExistenciaRequest, db: AsyncSession = Depends(get_db)):
+    """Verificar con una sola consulta qué barberos de la lista existen"""
+    ids = set(solicitud.ids)
+    existentes = set()
+    if ids:
+        existentes = set(await db.scalars(select(Barbero.id).where(Barbero.id.in_(ids))))
+    return ExistenciaResponse(existentes=sorted(existentes), faltantes=sorted(ids - existentes))
+
+@app.get("/barberos/export")
+async def exportar_barberos(
+    formato: FormatoExportacion = FormatoExportacion.NDJSON,
+    activos_solo: bool = False,
+    sesiones: async_sessionmaker = Depends(get_sesiones)
+):
+    """Exportar los barberos en streaming (NDJSON o CSV)"""
+    query = select(Barbero).order_by(Barbero.id)
     if activos_solo:
-        query = query.filter(Barbero.activo == True)
-    barberos = query.offset(skip).limit(limit).all()
-    return barberos
+        query = query.where(Barbero.activo == True)
+    return exportar(sesiones, query, BarberoResponse, formato, "barberos")
 
 @app.get("/barberos/{barbero_id}", response_model=BarberoResponse)
-def obtener_barbero(barbero_id: int, db: Session = Depends(get_db)):
-    """Obtener un barbero por su ID"""
-    barbero = db.query(Barbero).filter(Barbero.id == barbero_id).first()
-    if barbero is None:
-        raise HTTPException(status_code=404, detail="Barbero no encontrado")
-    return barbero
+async def obtener_barbero(barbero_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Obtener un barbero por su ID (con ETag; If-None-Match responde 304)"""
+    async def cargar():
+        barbero = await db.get(Barbero, barbero_id)
+        if barbero is None:
+            raise HTTPException(status_code=404, detail="Barbero no encontrado")
+        return serializar(BarberoResponse, barbero)
+
+    return responder(request, await cache_respuestas.obtener(clave_peticion(request), cargar))
 
 @app.post("/barberos/", response_model=BarberoResponse, status_code=status.HTTP_201_CREATED)
-def crear_barbero(barbero: BarberoCreate, db: Session = Depends(get_db)):
+async def crear_barbero(barbero: BarberoCreate, db: AsyncSession = Depends(get_db)):
     """Crear un nuevo barbero"""
     nuevo_barbero = Barbero(**barbero.model_dump())
     db.add(nuevo_barbero)
-    db.commit()
-    db.refresh(nuevo_barbero)
+    # El INSERT ... RETURNING devuelve el ID; no hace falta volver a leer la fila
+    await db.flush()
+    registrar_evento(db, TipoEvento.CREADO, nuevo_barbero.id, instantanea(nuevo_barbero))
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return nuevo_barbero
 
 @app.put("/barberos/{barbero_id}", response_model=BarberoResponse)
-def actualizar_barbero(barbero_id: int, barbero: BarberoUpdate, db: Session = Depends(get_db)):
+async def actualizar_barbero(barbero_id: int, barbero: BarberoUpdate, db: AsyncSession = Depends(get_db)):
     """Actualizar un barbero existente"""
-    db_barbero = db.query(Barbero).filter(Barbero.id == barbero_id).first()
-    if db_barbero is None:
-        raise HTTPException(status_code=404, detail="Barbero no encontrado")
-
     # Actualizar solo los campos proporcionados
     update_data = barbero.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_barbero, field, value)
+    db_barbero = await actualizar_fila(db, Barbero, barbero_id, update_data)
+    if db_barbero is None:
+        raise HTTPException(status_code=404, detail="Barbero no encontrado")
 
-    db.commit()
-    db.refresh(db_barbero)
+    registrar_evento(
+        db, TipoEvento.ACTUALIZADO, barbero_id, {"campos": sorted(update_data), **instantanea(db_barbero)}
+    )
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return db_barbero
 
 @app.delete("/barberos/{barbero_id}", status_code=status.HTTP_204_NO_CONTENT)
-def eliminar_barbero(barbero_id: int, db: Session = Depends(get_db)):
+async def eliminar_barbero(barbero_id: int, db: AsyncSession = Depends(get_db)):
     """Eliminar un barbero (soft delete - marcarlo como inactivo)"""
-    db_barbero = db.query(Barbero).filter(Barbero.id == barbero_id).first()
+    # Soft delete: marcar como inactivo en lugar de eliminar
+    db_barbero = await actualizar_fila(db, Barbero, barbero_id, {"activo": False})
     if db_barbero is None:
         raise HTTPException(status_code=404, detail="Barbero no encontrado")
 
-    # Soft delete: marcar como inactivo en lugar de eliminar
-    db_barbero.activo = False
-    db.commit()
+    registrar_evento(db, TipoEvento.ELIMINADO, barbero_id, {"activo": False})
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return None
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+# Copia de compartido/metricas.py: editar el original y ejecutar python compartido/sincronizar.py
+"""Métricas del servicio en formato de texto de Prometheus (GET /metrics).
+
+Cada proceso lleva sus propios contadores: con varios workers de uvicorn,
+Prometheus debe consultar cada uno o agregarlos por instancia.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Match
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Cubetas por defecto de los clientes oficiales de Prometheus (segundos)
+CUBETAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+CUBETAS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica(ABC):
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+
+    def _clave(self, valores: Sequence[str]) -> Tuple[str, ...]:
+        if len(valores) != len(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}")
+        return tuple(str(valor) for valor in valores)
+
+    def _serie(self, sufijo: str, valores: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pares = list(zip(self.etiquetas, valores)) + list(extra)
+        if not pares:
+            return f"{self.nombre}{sufijo}"
+        texto = ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares)
+        return f"{self.nombre}{sufijo}{{{texto}}}"
+
+    @abstractmethod
+    def _muestras(self) -> List[str]:
+        """Líneas de muestras en formato de texto de Prometheus"""
+
+    def exponer(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}", *self._muestras()]
+
+
+class Contador(_Metrica):
+    """Valor que solo aumenta (peticiones, errores)"""
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def incrementar(self, *valores: str, cantidad: float = 1) -> None:
+        clave = self._clave(valores)
+        self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, *valores: str) -> float:
+        return self._valores.get(self._clave(valores), 0)
+
+    def _muestras(self) -> List[str]:
+        return [f"{self._serie('', clave)} {_formatear(valor)}" for clave, valor in sorted(self._valores.items())]
+
+
+class Medidor(Contador):
+    """Valor que sube y baja (peticiones en curso, conexiones del pool)"""
+    tipo = "gauge"
+
+    def fijar(self, *valores: str, valor: float) -> None:
+        self._valores[self._clave(valores)] = valor
+
+
+class Histograma(_Metrica):
+    """Distribución de observaciones en cubetas acumuladas, con suma y número de muestras"""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), cubetas: Sequence[float] = CUBETAS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.cubetas = tuple(sorted(cubetas))
+        # Por serie: [conteo por cubeta (no acumulado) + desbordamiento, suma]
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observar(self, *valores: str, valor: float) -> None:
+        clave = self._clave(valores)
+        serie = self._series.get(clave)
+        if serie is None:
+            serie = self._series[clave] = ([0] * (len(self.cubetas) + 1), [0.0])
+        serie[0][bisect_left(self.cubetas, valor)] += 1
+        serie[1][0] += valor
+
+    def conteo(self, *valores: str) -> int:
+        serie = self._series.get(self._clave(valores))
+        return sum(serie[0]) if serie else 0
+
+    def suma(self, *valores: str) -> float:
+        serie = self._series.get(self._clave(valores))
+        return serie[1][0] if serie else 0.0
+
+    def _muestras(self) -> List[str]:
+        lineas = []
+        for clave, (conteos, suma) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, conteo in zip((*self.cubetas, math.inf), conteos):
+                acumulado += conteo
+                lineas.append(f"{self._serie('_bucket', clave, (('le', _formatear(limite)),))} {acumulado}")
+            lineas.append(f"{self._serie('_sum', clave)} {_formatear(suma[0])}")
+            lineas.append(f"{self._serie('_count', clave)} {acumulado}")
+        return lineas
+
+
+class Registro:
+    """Conjunto de métricas del proceso y recolectores que se ejecutan antes de exponerlas"""
+
+    def __init__(self):
+        self._metricas: List[_Metrica] = []
+        self._recolectores: List[Callable[[], None]] = []
+
+    def agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def recolector(self, funcion: Callable[[], None]) -> Callable[[], None]:
+        """Registrar una función que actualiza medidores justo antes de cada consulta a /metrics"""
+        self._recolectores.append(funcion)
+        return funcion
+
+    def exponer(self) -> str:
+        for recolector in self._recolectores:
+            recolector()
+        lineas: List[str] = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+PETICIONES = registro.agregar(Contador(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")
+))
+LATENCIA = registro.agregar(Histograma(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route")
+))
+EN_CURSO = registro.agregar(Medidor(
+    "http_requests_in_progress", "Peticiones HTTP en curso", ("method",)
+))
+CONSULTAS_POR_PETICION = registro.agregar(Histograma(
+    "db_queries_per_request", "Consultas SQL ejecutadas por petición", ("route",), CUBETAS_CONSULTAS
+))
+TIEMPO_DB_POR_PETICION = registro.agregar(Histograma(
+    "db_time_per_request_seconds", "Tiempo total en la base de datos por petición", ("route",)
+))
+LATENCIA_CONSULTAS = registro.agregar(Histograma(
+    "db_query_duration_seconds", "Latencia de cada consulta SQL"
+))
+LATENCIA_DEPENDENCIAS = registro.agregar(Histograma(
+    "http_client_request_duration_seconds",
+    "Latencia de las llamadas HTTP a otros servicios",
+    ("dependency", "outcome")
+))
+POOL = registro.agregar(Medidor(
+    "db_pool_connections", "Conexiones del pool de la base de datos por estado", ("state",)
+))
+
+
+class ConsultasPeticion:
+    """Consultas SQL acumuladas durante la petición en curso.
+
+    ``perfil`` recibe además el detalle de cada sentencia cuando el perfilado
+    SQL está activo (ver app.perfilado).
+    """
+
+    __slots__ = ("cantidad", "segundos", "perfil")
+
+    def __init__(self):
+        self.cantidad = 0
+        self.segundos = 0.0
+        self.perfil = None
+
+    def registrar(self, sentencia: str, duracion: float) -> None:
+        self.cantidad += 1
+        self.segundos += duracion
+        if self.perfil is not None:
+            self.perfil.registrar(sentencia, duracion)
+
+
+_consultas_peticion: ContextVar[Optional[ConsultasPeticion]] = ContextVar("consultas_peticion", default=None)
+
+
+def consultas_actuales() -> Optional[ConsultasPeticion]:
+    """Acumulador de la petición en curso (``None`` fuera de una petición HTTP)"""
+    return _consultas_peticion.get()
+
+
+def instrumentar_engine(engine: AsyncEngine) -> None:
+    """Medir cada consulta del engine y sumarla a la petición que la ejecuta"""
+    sync_engine = engine.sync_engine
+    if getattr(sync_engine, "_metricas_instaladas", False):
+        return
+    sync_engine._metricas_instaladas = True
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+        inicios = conn.info.get("metricas_inicio")
+        if not inicios:
+            return
+        duracion = time.perf_counter() - inicios.pop()
+        LATENCIA_CONSULTAS.observar(valor=duracion)
+        peticion = _consultas_peticion.get()
+        if peticion is not None:
+            peticion.registrar(sentencia, duracion)
+
+
+def observar_dependencia(dependencia: str, resultado: str, segundos: float) -> None:
+    """Registrar una llamada saliente (resultado: código HTTP o ``error``)"""
+    LATENCIA_DEPENDENCIAS.observar(dependencia, resultado, valor=segundos)
+
+
+# Estado publicado en la etiqueta ``state`` y clave correspondiente en estadisticas_pool()
+ESTADOS_POOL = (("size", "tamano"), ("checked_out", "en_uso"), ("checked_in", "disponibles"), ("overflow", "overflow"))
+
+
+def registrar_pool(estadisticas: Callable[[], Dict]) -> None:
+    """Publicar el uso del pool de conexiones en cada consulta a /metrics"""
+
+    @registro.recolector
+    def _actualizar_pool():
+        datos = estadisticas()
+        for estado, clave in ESTADOS_POOL:
+            if clave in datos:
+                POOL.fijar(estado, valor=datos[clave])
+
+
+def plantilla_ruta(scope) -> str:
+    """Ruta declarada (p. ej. /citas/{cita_id}) para no crear una serie por cada ID"""
+    aplicacion = scope.get("app")
+    router = getattr(aplicacion, "router", None)
+    for ruta in getattr(router, "routes", ()):
+        coincidencia, _ = ruta.matches(scope)
+        if coincidencia == Match.FULL:
+            return getattr(ruta, "path", "sin_ruta")
+    return "sin_ruta"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mide cada petición HTTP y las consultas SQL que provoca"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        estado = 500
+        consultas = ConsultasPeticion()
+        token = _consultas_peticion.set(consultas)
+        EN_CURSO.incrementar(metodo)
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracion = time.perf_counter() - inicio
+            EN_CURSO.incrementar(metodo, cantidad=-1)
+            _consultas_peticion.reset(token)
+            ruta = plantilla_ruta(scope)
+            PETICIONES.incrementar(metodo, ruta, str(estado))
+            LATENCIA.observar(metodo, ruta, valor=duracion)
+            CONSULTAS_POR_PETICION.observar(ruta, valor=consultas.cantidad)
+            TIEMPO_DB_POR_PETICION.observar(ruta, valor=consultas.segundos)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Index, func, text
 from .database import Base
 
 class Barbero(Base):
@@ -10,3 +10,25 @@ class Barbero(Base):
     telefono = Column(String, nullable=False)
     activo = Column(Boolean, default=True)
 
+_FILTRO_PENDIENTES = text("enviado_en IS NULL")
+
+class EventoOutbox(Base):
+    """Cambios de barberos pendientes de notificar a otros servicios (outbox transaccional)"""
+    __tablename__ = "barberos_outbox"
+    __table_args__ = (
+        # El despachador solo recorre los eventos aún no enviados, en orden
+        Index(
+            "ix_barberos_outbox_pendientes",
+            "id",
+            postgresql_where=_FILTRO_PENDIENTES,
+            sqlite_where=_FILTRO_PENDIENTES
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String, nullable=False)
+    entidad_id = Column(Integer, nullable=False)
+    datos = Column(JSON, nullable=True)
+    creado_en = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    enviado_en = Column(DateTime(timezone=True), nullable=True)
+    intentos = Column(Integer, nullable=False, default=0, server_default=text("0"))
@@ -0,0 +1,243 @@
+# Copia de compartido/outbox.py: editar el original y ejecutar python compartido/sincronizar.py
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .metricas import Contador, observar_dependencia, registro
+from .models import EventoOutbox
+from .servicio import CAMPOS_REPLICADOS, ENTIDAD, NOMBRE
+from .trazas import cabeceras_propagacion, iniciar_span
+
+# Servicio que origina los eventos
+ORIGEN = NOMBRE
+# Destino de los eventos (p. ej. http://citas:8003/eventos); vacío = no se despachan
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "")
+# Secreto compartido con el consumidor (cabecera X-Eventos-Token)
+EVENTOS_TOKEN = os.getenv("EVENTOS_TOKEN", "")
+# Segundos entre revisiones del outbox cuando no hay avisos de escrituras
+OUTBOX_INTERVALO = float(os.getenv("OUTBOX_INTERVALO", 5))
+OUTBOX_TAMANO_LOTE = int(os.getenv("OUTBOX_TAMANO_LOTE", 100))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", 5))
+# Horas que se conservan los eventos ya enviados antes de purgarlos
+OUTBOX_RETENCION_HORAS = float(os.getenv("OUTBOX_RETENCION_HORAS", 24))
+# Horas que se conservan los eventos que el consumidor no ha aceptado; los
+# perdidos se recuperan con la resincronización completa de réplicas de citas
+OUTBOX_RETENCION_PENDIENTES_HORAS = float(os.getenv("OUTBOX_RETENCION_PENDIENTES_HORAS", 168))
+# Segundos entre purgas del outbox
+OUTBOX_INTERVALO_PURGA = float(os.getenv("OUTBOX_INTERVALO_PURGA", 3600))
+
+
+ERRORES = registro.agregar(Contador(
+    "outbox_errors_total", "Rondas del despachador del outbox que fallaron", ("operation",)
+))
+
+logger = logging.getLogger(__name__)
+
+
+class TipoEvento(str, Enum):
+    CREADO = f"{ENTIDAD}.creado"
+    ACTUALIZADO = f"{ENTIDAD}.actualizado"
+    ELIMINADO = f"{ENTIDAD}.eliminado"
+
+
+def instantanea(entidad: Any) -> Dict[str, Any]:
+    """Valores de los campos replicados, tomados de un modelo o de un dict"""
+    if isinstance(entidad, dict):
+        return {campo: entidad.get(campo) for campo in CAMPOS_REPLICADOS}
+    return {campo: getattr(entidad, campo) for campo in CAMPOS_REPLICADOS}
+
+
+def registrar_evento(
+    db: AsyncSession,
+    tipo: TipoEvento,
+    entidad_id: int,
+    datos: Optional[Dict[str, Any]] = None
+) -> None:
+    """Añadir un evento a la transacción en curso; se guarda solo si el cambio se confirma"""
+    db.add(EventoOutbox(tipo=tipo.value, entidad_id=entidad_id, datos=datos))
+
+
+async def registrar_eventos(
+    db: AsyncSession,
+    tipo: TipoEvento,
+    eventos: Iterable[Tuple[int, Optional[Dict[str, Any]]]]
+) -> None:
+    """Añadir con un solo INSERT un evento por cada par (ID, datos) (importaciones masivas)"""
+    filas = [{"tipo": tipo.value, "entidad_id": entidad_id, "datos": datos} for entidad_id, datos in eventos]
+    if filas:
+        await db.execute(insert(EventoOutbox), filas)
+
+
+def _serializar(evento: EventoOutbox) -> Dict[str, Any]:
+    return {
+        "id": evento.id,
+        "tipo": evento.tipo,
+        "entidad_id": evento.entidad_id,
+        "datos": evento.datos,
+        "creado_en": evento.creado_en.isoformat() if evento.creado_en else None,
+    }
+
+
+async def despachar_pendientes(
+    sesiones: async_sessionmaker,
+    enviar: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+    tamano_lote: int = OUTBOX_TAMANO_LOTE
+) -> int:
+    """Enviar el siguiente lote de eventos pendientes y marcarlos como enviados.
+
+    En Postgres las filas se bloquean con SKIP LOCKED, así que varios workers
+    pueden despachar a la vez sin enviar dos veces el mismo evento. Si el envío
+    falla, los eventos siguen pendientes y se reintentan en la siguiente ronda.
+    """
+    async with sesiones() as db:
+        eventos = (await db.scalars(
+            select(EventoOutbox)
+            .where(EventoOutbox.enviado_en.is_(None))
+            .order_by(EventoOutbox.id)
+            .limit(tamano_lote)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not eventos:
+            return 0
+
+        try:
+            await enviar([_serializar(evento) for evento in eventos])
+        except Exception:
+            for evento in eventos:
+                evento.intentos += 1
+            await db.commit()
+            raise
+
+        ahora = datetime.now(timezone.utc)
+        for evento in eventos:
+            evento.enviado_en = ahora
+        await db.commit()
+        return len(eventos)
+
+
+async def purgar_antiguos(
+    sesiones: async_sessionmaker,
+    retencion_horas: float = OUTBOX_RETENCION_HORAS,
+    retencion_pendientes_horas: float = OUTBOX_RETENCION_PENDIENTES_HORAS
+) -> int:
+    """Eliminar los eventos enviados hace más de ``retencion_horas`` y los
+    pendientes creados hace más de ``retencion_pendientes_horas``; devuelve cuántos"""
+    ahora = datetime.now(timezone.utc)
+    limite_enviados = ahora - timedelta(hours=retencion_horas)
+    limite_pendientes = ahora - timedelta(hours=retencion_pendientes_horas)
+    async with sesiones() as db:
+        resultado = await db.execute(delete(EventoOutbox).where(or_(
+            EventoOutbox.enviado_en < limite_enviados,
+            and_(EventoOutbox.enviado_en.is_(None), EventoOutbox.creado_en < limite_pendientes)
+        )))
+        await db.commit()
+        return resultado.rowcount
+
+
+class Despachador:
+    """Tareas en segundo plano que entregan los eventos del outbox al webhook configurado
+    y purgan los antiguos.
+
+    El despacho revisa el outbox cada OUTBOX_INTERVALO segundos, o en cuanto una
+    escritura avisa de que hay eventos nuevos. La purga corre aunque no haya
+    webhook, para que el outbox no crezca sin límite; en ese caso nadie enviará
+    los pendientes y se conservan lo mismo que los enviados.
+    """
+
+    def __init__(
+        self,
+        sesiones: async_sessionmaker,
+        url: str = OUTBOX_WEBHOOK_URL,
+        intervalo: float = OUTBOX_INTERVALO,
+        token: str = EVENTOS_TOKEN
+    ):
+        self.sesiones = sesiones
+        self.url = url
+        self.token = token
+        self.intervalo = intervalo
+        self._aviso: Optional[asyncio.Event] = None
+        self._tareas: List[asyncio.Task] = []
+        self._cliente: Optional[httpx.AsyncClient] = None
+
+    async def iniciar(self) -> None:
+        if self._tareas:
+            return
+        if self.url:
+            if not self.token:
+                # Citas rechaza los eventos sin token; no arrancar con un webhook que nadie puede autenticar
+                raise RuntimeError("OUTBOX_WEBHOOK_URL requiere EVENTOS_TOKEN")
+            self._aviso = asyncio.Event()
+            self._cliente = httpx.AsyncClient(timeout=OUTBOX_TIMEOUT)
+            self._tareas.append(asyncio.create_task(self._bucle()))
+        self._tareas.append(asyncio.create_task(self._bucle_purga()))
+
+    async def detener(self) -> None:
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def avisar(self) -> None:
+        """Despertar al despachador tras confirmar una escritura con eventos"""
+        if self._aviso is not None:
+            self._aviso.set()
+
+    async def enviar(self, eventos: List[Dict[str, Any]]) -> None:
+        cabeceras = {"X-Eventos-Token": self.token}
+        inicio = time.perf_counter()
+        atributos = {"http.method": "POST", "peer.service": "eventos", "eventos.cantidad": len(eventos)}
+        with iniciar_span("POST eventos", "cliente", atributos) as span:
+            try:
+                response = await self._cliente.post(
+                    self.url,
+                    json={"origen": ORIGEN, "eventos": eventos},
+                    headers={**cabeceras, **cabeceras_propagacion(span)}
+                )
+            except httpx.HTTPError as error:
+                observar_dependencia("eventos", "error", time.perf_counter() - inicio)
+                if span is not None:
+                    span.error = type(error).__name__
+                raise
+            if span is not None:
+                span.atributos["http.status_code"] = response.status_code
+        observar_dependencia("eventos", str(response.status_code), time.perf_counter() - inicio)
+        response.raise_for_status()
+
+    async def purgar(self) -> int:
+        retencion_pendientes = OUTBOX_RETENCION_PENDIENTES_HORAS if self.url else OUTBOX_RETENCION_HORAS
+        return await purgar_antiguos(self.sesiones, OUTBOX_RETENCION_HORAS, retencion_pendientes)
+
+    async def _bucle_purga(self) -> None:
+        while True:
+            try:
+                await self.purgar()
+            except Exception:
+                ERRORES.incrementar("purga")
+                logger.exception("No se pudieron purgar los eventos antiguos del outbox")
+            await asyncio.sleep(OUTBOX_INTERVALO_PURGA)
+
+    async def _bucle(self) -> None:
+        while True:
+            self._aviso.clear()
+            # Si el consumidor o la base de datos no responden se reintenta en la siguiente ronda
+            try:
+                while await despachar_pendientes(self.sesiones, self.enviar) == OUTBOX_TAMANO_LOTE:
+                    pass
+            except Exception:
+                ERRORES.incrementar("despacho")
+                logger.exception("No se pudieron despachar los eventos del outbox a %s", self.url)
+            try:
+                await asyncio.wait_for(self._aviso.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,152 @@
+# Copia de compartido/perfilado.py: editar el original y ejecutar python compartido/sincronizar.py
+"""Perfilado SQL por petición (opt-in con PERFILADO_SQL).
+
+Con el perfilado activo cada respuesta lleva el número de consultas y el tiempo
+en la base de datos (cabeceras Server-Timing y X-Consultas-SQL), y se escribe
+una línea JSON en el log con las sentencias más lentas y las repetidas, que
+suelen indicar un patrón N+1.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metricas import consultas_actuales, plantilla_ruta
+from .trazas import id_traza_actual
+
+# "false" (por defecto), "true" (todas las peticiones) o "cabecera" (solo las que
+# envían X-Perfilar-SQL: 1, útil para investigar en producción)
+PERFILADO_SQL = os.getenv("PERFILADO_SQL", "false").strip().lower()
+# Número de sentencias más lentas que se incluyen en el log
+PERFILADO_LENTAS = int(os.getenv("PERFILADO_LENTAS", 3))
+# Veces que debe repetirse una sentencia idéntica para marcarla como posible N+1
+PERFILADO_REPETICIONES = int(os.getenv("PERFILADO_REPETICIONES", 3))
+# Longitud máxima del SQL en el log
+PERFILADO_LONGITUD_SQL = 200
+
+CABECERA_ACTIVAR = b"x-perfilar-sql"
+
+logger = logging.getLogger(__name__)
+
+
+def _normalizar(sentencia: str) -> str:
+    return " ".join(sentencia.split())
+
+
+class PerfilSQL:
+    """Estadísticas por sentencia SQL (texto con parámetros sin sustituir) de una petición"""
+
+    def __init__(self):
+        self.sentencias: Dict[str, List[float]] = {}
+
+    def registrar(self, sentencia: str, duracion: float) -> None:
+        # [veces, tiempo total, tiempo máximo]
+        estadisticas = self.sentencias.setdefault(_normalizar(sentencia), [0, 0.0, 0.0])
+        estadisticas[0] += 1
+        estadisticas[1] += duracion
+        estadisticas[2] = max(estadisticas[2], duracion)
+
+    def lentas(self, cantidad: int = PERFILADO_LENTAS) -> List[Tuple[str, float]]:
+        """Sentencias con mayor tiempo máximo por ejecución"""
+        orden = sorted(self.sentencias.items(), key=lambda item: item[1][2], reverse=True)
+        return [(sentencia, estadisticas[2]) for sentencia, estadisticas in orden[:cantidad]]
+
+    def repetidas(self, minimo: int = PERFILADO_REPETICIONES) -> List[Tuple[str, int]]:
+        """Sentencias idénticas ejecutadas al menos ``minimo`` veces (posible N+1)"""
+        return sorted(
+            ((sentencia, int(estadisticas[0])) for sentencia, estadisticas in self.sentencias.items()
+             if estadisticas[0] >= minimo),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+
+def _sql(sentencia: str) -> str:
+    return sentencia[:PERFILADO_LONGITUD_SQL]
+
+
+def resumen(cantidad: int, segundos: float, perfil: PerfilSQL) -> Dict[str, Any]:
+    return {
+        "consultas": cantidad,
+        "tiempo_ms": round(segundos * 1000, 3),
+        "lentas": [
+            {"sql": _sql(sentencia), "ms": round(duracion * 1000, 3)} for sentencia, duracion in perfil.lentas()
+        ],
+        "repetidas": [{"sql": _sql(sentencia), "veces": veces} for sentencia, veces in perfil.repetidas()],
+    }
+
+
+def _configurar_log() -> None:
+    """Mostrar el log de perfilado aunque uvicorn solo configure sus propios loggers"""
+    if not logger.handlers:
+        manejador = logging.StreamHandler()
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(manejador)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class MiddlewarePerfilado:
+    """Middleware ASGI que adjunta a cada respuesta el perfil SQL de la petición.
+
+    Debe quedar dentro de MiddlewareMetricas, que crea el acumulador de consultas
+    de la petición. Las consultas hechas después de enviar las cabeceras (p. ej.
+    en exportaciones en streaming) solo aparecen en el log.
+    """
+
+    def __init__(self, app, modo: Optional[str] = None):
+        self.app = app
+        # Sin modo explícito se usa PERFILADO_SQL
+        self.modo = modo
+
+    def _activo(self, scope) -> bool:
+        modo = self.modo or PERFILADO_SQL
+        if modo == "cabecera":
+            activo = dict(scope.get("headers", ())).get(CABECERA_ACTIVAR) == b"1"
+        else:
+            activo = modo == "true"
+        if activo:
+            _configurar_log()
+        return activo
+
+    async def __call__(self, scope, receive, send):
+        peticion = consultas_actuales() if scope["type"] == "http" else None
+        if peticion is None or not self._activo(scope):
+            await self.app(scope, receive, send)
+            return
+
+        perfil = peticion.perfil = PerfilSQL()
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                cabeceras = list(mensaje.get("headers", ()))
+                cabeceras.append((b"x-consultas-sql", str(peticion.cantidad).encode()))
+                cabeceras.append((
+                    b"server-timing",
+                    f'db;dur={peticion.segundos * 1000:.3f};desc="{peticion.cantidad} consultas"'.encode()
+                ))
+                repetidas = sum(veces for _, veces in perfil.repetidas())
+                if repetidas:
+                    cabeceras.append((b"x-consultas-repetidas", str(repetidas).encode()))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            datos = {
+                "evento": "perfil_sql",
+                "trace_id": id_traza_actual(),
+                "metodo": scope["method"],
+                "ruta": plantilla_ruta(scope),
+                "estado": estado,
+                "duracion_ms": round((time.perf_counter() - inicio) * 1000, 3),
+                **resumen(peticion.cantidad, peticion.segundos, perfil),
+            }
+            nivel = logging.WARNING if datos["repetidas"] else logging.INFO
+            logger.log(nivel, json.dumps(datos, ensure_ascii=False))
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class BarberoBase(BaseModel):
     nombre: str
@@ -22,3 +22,10 @@ class BarberoResponse(BarberoBase):
     class Config:
         from_attributes = True
 
+
+class ExistenciaRequest(BaseModel):
+    ids: List[int] = Field(..., max_length=1000)
+
+class ExistenciaResponse(BaseModel):
+    existentes: List[int]
+    faltantes: List[int]
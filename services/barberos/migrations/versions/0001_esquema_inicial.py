@@ -0,0 +1,32 @@
+"""Esquema inicial de barberos
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-20 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "barberos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nombre", sa.String(), nullable=False),
+        sa.Column("especialidad", sa.String(), nullable=False),
+        sa.Column("telefono", sa.String(), nullable=False),
+        sa.Column("activo", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_barberos_id", "barberos", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_barberos_id", table_name="barberos")
+    op.drop_table("barberos")
@@ -0,0 +1,42 @@
+"""Outbox transaccional de eventos de barberos
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-12-05 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+FILTRO_PENDIENTES = sa.text("enviado_en IS NULL")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "barberos_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tipo", sa.String(), nullable=False),
+        sa.Column("entidad_id", sa.Integer(), nullable=False),
+        sa.Column("datos", sa.JSON(), nullable=True),
+        sa.Column("creado_en", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("enviado_en", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("intentos", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_barberos_outbox_pendientes",
+        "barberos_outbox",
+        ["id"],
+        postgresql_where=FILTRO_PENDIENTES,
+        sqlite_where=FILTRO_PENDIENTES,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_barberos_outbox_pendientes", table_name="barberos_outbox")
+    op.drop_table("barberos_outbox")
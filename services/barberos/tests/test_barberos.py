@@ -1,45 +1,54 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
+from unittest.mock import patch
 
-from app.main import app
-from app.database import Base, get_db
+from app.main import app, despachador
+from app.database import Base, get_db, get_sesiones
 from app.models import Barbero
+from app.cache_compartido import cache_compartido
 
 # Configurar base de datos de prueba en memoria
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+async def _crear_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.create_all)
+
+async def _eliminar_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.drop_all)
 
 @pytest.fixture
 def db_session():
-    """Crear una sesión de base de datos de prueba"""
-    Base.metadata.create_all(bind=engine)
-    session = TestingSessionLocal()
+    """Crear las tablas de prueba y devolver la fábrica de sesiones"""
+    asyncio.run(_crear_tablas())
     try:
-        yield session
+        yield TestingSessionLocal
     finally:
-        session.close()
-        Base.metadata.drop_all(bind=engine)
+        asyncio.run(_eliminar_tablas())
 
 @pytest.fixture
 def client(db_session):
     """Cliente de prueba para FastAPI"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    async def override_get_db():
+        async with db_session() as session:
+            yield session
 
     app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as test_client:
+    app.dependency_overrides[get_sesiones] = lambda: db_session
+    cache_compartido.limpiar()
+    # El despachador del outbox (la purga corre siempre) usa la base de prueba
+    with patch.object(despachador, "sesiones", db_session), TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
 
@@ -162,3 +171,198 @@ def test_eliminar_barbero_no_existente(client):
     response = client.delete("/barberos/999")
     assert response.status_code == 404
 
+
+def test_verificar_existencia_lote(client):
+    """Probar la verificación de existencia de varios barberos en una sola llamada"""
+    creado = client.post("/barberos/", json={
+        "nombre": "Carlos Rodríguez", "especialidad": "Cortes clásicos", "telefono": "3007654321"
+    }).json()
+
+    response = client.post("/barberos/exists", json={"ids": [999, creado["id"]]})
+    assert response.status_code == 200
+    assert response.json() == {"existentes": [creado["id"]], "faltantes": [999]}
+
+def test_listar_barberos_por_ids(client):
+    """Probar la consulta masiva de barberos con ids=1,2,3"""
+    ids = []
+    for i in range(3):
+        ids.append(client.post("/barberos/", json={
+            "nombre": f"Barbero {i}", "especialidad": "Cortes", "telefono": "3007654321"
+        }).json()["id"])
+
+    response = client.get(f"/barberos/?ids={ids[1]},{ids[2]}")
+    assert response.status_code == 200
+    assert [b["id"] for b in response.json()] == [ids[1], ids[2]]
+
+def test_migraciones_coinciden_con_modelos(tmp_path):
+    """Probar que las migraciones crean el mismo esquema que los modelos"""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from app.migrate import migrar
+
+    url = f"sqlite:///{tmp_path / 'migrado.db'}"
+    migrar(url)
+    migrar(url)  # idempotente
+
+    def solo_tablas_del_servicio(nombre, tipo, padre):
+        return tipo != "table" or nombre in Base.metadata.tables
+
+    motor = create_engine(url)
+    with motor.connect() as conexion:
+        contexto = MigrationContext.configure(conexion, opts={"include_name": solo_tablas_del_servicio})
+        diferencias = compare_metadata(contexto, Base.metadata)
+    motor.dispose()
+    assert diferencias == []
+
+def test_migraciones_adoptan_base_existente(tmp_path):
+    """Probar que una base creada antes de las migraciones se marca y actualiza sin recrear tablas"""
+    from sqlalchemy import inspect, text
+    from app.migrate import migrar, REVISION_INICIAL, configuracion_alembic
+
+    url = f"sqlite:///{tmp_path / 'existente.db'}"
+    version_table = configuracion_alembic().get_main_option("version_table")
+
+    # Simular una base creada con create_all: esquema inicial sin tabla de versiones
+    migrar(url, revision=REVISION_INICIAL)
+    motor = create_engine(url)
+    with motor.begin() as conexion:
+        conexion.execute(text(f"DROP TABLE {version_table}"))
+
+    migrar(url)
+    with motor.connect() as conexion:
+        assert version_table in inspect(conexion).get_table_names()
+        assert conexion.execute(text(f"SELECT version_num FROM {version_table}")).scalar() is not None
+    motor.dispose()
+
+def test_estado_pool(client):
+    """Probar el endpoint con las estadísticas del pool de conexiones"""
+    response = client.get("/health/pool")
+    assert response.status_code == 200
+    assert "clase" in response.json()
+
+def test_opciones_engine_postgres():
+    """Probar que la configuración del pool se aplica a Postgres y no a SQLite"""
+    from app import database
+
+    with patch.object(database, "DB_POOL_SIZE", 20), patch.object(database, "DB_STATEMENT_TIMEOUT_MS", 5000):
+        opciones = database.opciones_engine("postgresql+asyncpg://u:p@db/barberia")
+    assert opciones["pool_size"] == 20
+    assert opciones["pool_pre_ping"] is True
+    assert opciones["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert "pool_size" not in database.opciones_engine("sqlite+aiosqlite:///./local.db")
+    assert database.url_async("postgresql://u:p@db/barberia") == "postgresql+asyncpg://u:p@db/barberia"
+
+def test_listar_barberos_con_cursor(client):
+    """Probar la paginación por cursor con la cabecera X-Next-Cursor"""
+    for i in range(3):
+        client.post("/barberos/", json={
+            "nombre": f"Barbero {i}", "especialidad": "Cortes", "telefono": "3007654321"
+        })
+
+    primera = client.get("/barberos/?limit=2")
+    assert len(primera.json()) == 2
+    cursor = primera.headers["X-Next-Cursor"]
+
+    segunda = client.get(f"/barberos/?limit=2&after={cursor}")
+    assert len(segunda.json()) == 1
+    assert "X-Next-Cursor" not in segunda.headers
+    assert segunda.json()[0]["id"] > primera.json()[-1]["id"]
+
+def test_exportar_barberos_activos(client):
+    """Probar la exportación en streaming de barberos activos"""
+    import json
+
+    client.post("/barberos/", json={"nombre": "Activo", "especialidad": "Cortes", "telefono": "1"})
+    client.post("/barberos/", json={"nombre": "Inactivo", "especialidad": "Cortes", "telefono": "2", "activo": False})
+
+    response = client.get("/barberos/export?activos_solo=true")
+    assert response.status_code == 200
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["nombre"] for f in filas] == ["Activo"]
+
+def test_etag_y_get_condicional(client):
+    """Probar el ETag, la respuesta 304 y la invalidación del cache al escribir"""
+    barbero = client.post("/barberos/", json={
+        "nombre": "Carlos", "especialidad": "Cortes", "telefono": "3001112233"
+    }).json()
+
+    lista = client.get("/barberos/", params={"activos_solo": True})
+    etag = lista.headers["ETag"]
+    response = client.get("/barberos/", params={"activos_solo": True}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # El soft delete invalida el cache y el barbero deja de listarse como activo
+    client.delete(f"/barberos/{barbero['id']}")
+    response = client.get("/barberos/", params={"activos_solo": True}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+def test_outbox_registra_baja_de_barbero(client):
+    """Probar que el soft delete deja un evento en el outbox en la misma transacción"""
+    from app.outbox import despachar_pendientes
+
+    barbero = client.post("/barberos/", json={
+        "nombre": "Carlos", "especialidad": "Cortes", "telefono": "3001112233"
+    }).json()
+    client.delete(f"/barberos/{barbero['id']}")
+
+    enviados = []
+
+    async def enviar(eventos):
+        enviados.extend(eventos)
+
+    assert asyncio.run(despachar_pendientes(TestingSessionLocal, enviar)) == 2
+    assert [(e["tipo"], e["datos"]) for e in enviados] == [
+        ("barbero.creado", {"nombre": "Carlos", "especialidad": "Cortes", "telefono": "3001112233", "activo": True}),
+        ("barbero.eliminado", {"activo": False}),
+    ]
+
+def test_metricas_prometheus(client):
+    """Probar que /metrics agrupa las peticiones por plantilla de ruta y cuenta sus consultas SQL"""
+    from app import metricas
+
+    metricas.instrumentar_engine(engine)
+    ruta = "/barberos/{barbero_id}"
+    antes = metricas.PETICIONES.valor("GET", ruta, "404")
+    consultas_antes = metricas.CONSULTAS_POR_PETICION.suma(ruta)
+    client.get("/barberos/999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert metricas.PETICIONES.valor("GET", ruta, "404") == antes + 1
+    assert metricas.CONSULTAS_POR_PETICION.suma(ruta) == consultas_antes + 1
+    assert f'http_requests_total{{method="GET",route="{ruta}",status="404"}}' in response.text
+    assert "# TYPE db_query_duration_seconds histogram" in response.text
+
+def test_escrituras_sin_relectura(client):
+    """Probar que actualizar y dar de baja usan UPDATE ... RETURNING, con alternativa sin RETURNING"""
+    from app import metricas
+
+    metricas.instrumentar_engine(engine)
+    barbero = client.post("/barberos/", json={
+        "nombre": "Carlos", "especialidad": "Cortes", "telefono": "3001112233"
+    }).json()
+    ruta = "/barberos/{barbero_id}"
+    consultas_antes = metricas.CONSULTAS_POR_PETICION.suma(ruta)
+    response = client.put(f"/barberos/{barbero['id']}", json={"especialidad": "Barba"})
+    assert response.status_code == 200
+    assert response.json()["especialidad"] == "Barba"
+    # UPDATE ... RETURNING y el evento del outbox, sin SELECT previo ni relectura
+    assert metricas.CONSULTAS_POR_PETICION.suma(ruta) == consultas_antes + 2
+
+    # Motores sin UPDATE ... RETURNING (SQLite < 3.35): se lee la fila y se actualiza con el ORM
+    with patch.object(engine.sync_engine.dialect, "update_returning", False):
+        response = client.put(f"/barberos/{barbero['id']}", json={"nombre": "Carlos R."})
+        assert client.delete(f"/barberos/{barbero['id']}").status_code == 204
+        assert client.delete("/barberos/999").status_code == 404
+    assert response.json() == {**barbero, "nombre": "Carlos R.", "especialidad": "Barba"}
+    assert client.get(f"/barberos/{barbero['id']}").json()["activo"] is False
+
+def test_listado_limita_el_tamano_de_pagina(client):
+    """Probar que limit se acota entre 1 y MAX_LIMIT"""
+    from app.paginacion import MAX_LIMIT
+
+    assert client.get("/barberos/", params={"limit": MAX_LIMIT}).status_code == 200
+    assert client.get("/barberos/", params={"limit": MAX_LIMIT + 1}).status_code == 422
+    assert client.get("/barberos/", params={"limit": 0}).status_code == 422
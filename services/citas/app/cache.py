@@ -0,0 +1,78 @@
+import os
+from typing import Dict, Iterable, Optional
+
+from .cache_compartido import CACHE_MAX_ENTRADAS, BackendMemoria, CacheCompartido, cache_compartido
+
+# Tiempo de vida (segundos) de respuestas positivas ("existe") y negativas ("no existe")
+CACHE_TTL_POSITIVO = float(os.getenv("CACHE_TTL_POSITIVO", 300))
+CACHE_TTL_NEGATIVO = float(os.getenv("CACHE_TTL_NEGATIVO", 30))
+
+
+class CacheExistencia:
+    """Cache con TTL para saber si un cliente o barbero existe en su servicio.
+
+    Guarda las entradas en el cache compartido (espacio ``existencia:<tipo>``),
+    así que con CACHE_BACKEND=redis todos los workers ven las mismas entradas e
+    invalidaciones.
+    """
+
+    def __init__(
+        self,
+        ttl_positivo: float = CACHE_TTL_POSITIVO,
+        ttl_negativo: float = CACHE_TTL_NEGATIVO,
+        max_entradas: int = CACHE_MAX_ENTRADAS,
+        cache: Optional[CacheCompartido] = None
+    ):
+        self.ttl_positivo = ttl_positivo
+        self.ttl_negativo = ttl_negativo
+        self.cache = cache if cache is not None else CacheCompartido(BackendMemoria(max_entradas))
+        self.hits = 0
+        self.misses = 0
+
+    async def obtener(self, tipo: str, entidad_id: int) -> Optional[bool]:
+        """Devolver el valor guardado o ``None`` si no está o ya expiró"""
+        valor = await self.cache.obtener(f"existencia:{tipo}", entidad_id)
+        if valor is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bool(valor)
+
+    async def obtener_varios(self, tipo: str, ids: Iterable[int]) -> Dict[int, bool]:
+        """Valores guardados de varios IDs con una sola lectura del backend (los ausentes no aparecen)"""
+        ids = list(ids)
+        encontrados = await self.cache.obtener_varios(f"existencia:{tipo}", ids)
+        self.hits += len(encontrados)
+        self.misses += len(ids) - len(encontrados)
+        return {entidad_id: bool(valor) for entidad_id, valor in encontrados.items()}
+
+    def _ttl(self, existe: bool) -> float:
+        return self.ttl_positivo if existe else self.ttl_negativo
+
+    async def guardar(self, tipo: str, entidad_id: int, existe: bool) -> None:
+        """Guardar el resultado de una verificación con su TTL"""
+        await self.cache.guardar(f"existencia:{tipo}", entidad_id, existe, self._ttl(existe))
+
+    async def guardar_varios(self, tipo: str, resultados: Dict[int, bool]) -> None:
+        """Guardar varias verificaciones con una sola escritura al backend"""
+        await self.cache.guardar_varios(
+            f"existencia:{tipo}",
+            ((entidad_id, existe, self._ttl(existe)) for entidad_id, existe in resultados.items())
+        )
+
+    async def invalidar(self, tipo: str, entidad_id: Optional[int] = None) -> None:
+        """Eliminar una entrada, o todas las de un tipo si no se indica ID"""
+        await self.cache.invalidar(f"existencia:{tipo}", entidad_id)
+
+    def limpiar(self) -> None:
+        """Vaciar el cache local y reiniciar los contadores"""
+        self.cache.limpiar()
+        self.hits = 0
+        self.misses = 0
+
+    def estadisticas(self) -> Dict[str, Optional[int]]:
+        """Contadores de uso del cache (las entradas solo se conocen con el backend en memoria)"""
+        return {"entradas": self.cache.backend.entradas(), "hits": self.hits, "misses": self.misses}
+
+
+cache_existencia = CacheExistencia(cache=cache_compartido)
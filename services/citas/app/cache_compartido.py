@@ -0,0 +1,303 @@
+# Copia de compartido/cache_compartido.py: editar el original y ejecutar python compartido/sincronizar.py
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .servicio import NOMBRE
+
+# Backend del cache: "memoria" (por proceso) o "redis" (compartido entre workers e instancias)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Prefijo de las claves, para compartir un mismo Redis entre servicios
+CACHE_PREFIJO = os.getenv("CACHE_PREFIJO", NOMBRE)
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", 10000))
+# Segundos que un proceso espera a que otro termine de calcular la misma clave
+CACHE_ESPERA_CALCULO = float(os.getenv("CACHE_ESPERA_CALCULO", 2.0))
+
+
+class BackendMemoria:
+    """LRU con TTL dentro del proceso; guarda los objetos sin serializar"""
+
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._versiones: Dict[str, int] = {}
+
+    async def obtener(self, clave: str) -> Optional[Any]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[1] <= time.monotonic():
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada[0]
+
+    async def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_entradas <= 0:
+            return
+        self._entradas[clave] = (valor, time.monotonic() + ttl)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    async def obtener_varios(self, claves: List[str]) -> List[Optional[Any]]:
+        return [await self.obtener(clave) for clave in claves]
+
+    async def guardar_varios(self, entradas: List[Tuple[str, Any, float]]) -> None:
+        for clave, valor, ttl in entradas:
+            await self.guardar(clave, valor, ttl)
+
+    async def borrar(self, clave: str) -> None:
+        self._entradas.pop(clave, None)
+
+    async def version(self, espacio: str) -> int:
+        return self._versiones.get(espacio, 0)
+
+    async def nueva_version(self, espacio: str) -> int:
+        self._versiones[espacio] = self._versiones.get(espacio, 0) + 1
+        return self._versiones[espacio]
+
+    async def bloquear(self, clave: str, ttl: float) -> bool:
+        # Dentro de un proceso basta el single-flight de CacheCompartido
+        return True
+
+    async def liberar(self, clave: str) -> None:
+        return None
+
+    def entradas(self) -> Optional[int]:
+        return len(self._entradas)
+
+    def limpiar(self) -> None:
+        self._entradas.clear()
+        self._versiones.clear()
+
+
+class BackendRedis:
+    """Backend sobre cualquier servidor con protocolo Redis (valores en JSON).
+
+    Si Redis no responde, las lecturas cuentan como fallo de cache y las
+    escrituras se omiten: el servicio sigue funcionando sin cache.
+    """
+
+    def __init__(self, cliente: Any = None, url: str = REDIS_URL):
+        if cliente is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as error:
+                raise RuntimeError("CACHE_BACKEND=redis requiere el paquete redis") from error
+            cliente = redis.from_url(url)
+        self.cliente = cliente
+
+    async def obtener(self, clave: str) -> Optional[Any]:
+        try:
+            valor = await self.cliente.get(clave)
+        except Exception:
+            return None
+        return None if valor is None else json.loads(valor)
+
+    async def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        try:
+            await self.cliente.set(clave, json.dumps(valor), px=int(ttl * 1000))
+        except Exception:
+            pass
+
+    async def obtener_varios(self, claves: List[str]) -> List[Optional[Any]]:
+        """Leer varias claves con un solo MGET"""
+        if not claves:
+            return []
+        try:
+            valores = await self.cliente.mget(claves)
+        except Exception:
+            return [None] * len(claves)
+        return [None if valor is None else json.loads(valor) for valor in valores]
+
+    async def guardar_varios(self, entradas: List[Tuple[str, Any, float]]) -> None:
+        """Guardar varias claves con sus TTL en un solo viaje (pipeline sin transacción)"""
+        entradas = [(clave, valor, ttl) for clave, valor, ttl in entradas if ttl > 0]
+        if not entradas:
+            return
+        try:
+            async with self.cliente.pipeline(transaction=False) as pipeline:
+                for clave, valor, ttl in entradas:
+                    pipeline.set(clave, json.dumps(valor), px=int(ttl * 1000))
+                await pipeline.execute()
+        except Exception:
+            pass
+
+    async def borrar(self, clave: str) -> None:
+        try:
+            await self.cliente.delete(clave)
+        except Exception:
+            pass
+
+    async def version(self, espacio: str) -> int:
+        try:
+            valor = await self.cliente.get(espacio)
+            if valor is None:
+                # Una versión nueva basada en el reloj nunca coincide con una
+                # anterior, aunque Redis haya expulsado la clave de versión
+                await self.cliente.set(espacio, time.time_ns() // 1_000_000, nx=True)
+                valor = await self.cliente.get(espacio)
+            return int(valor)
+        except Exception:
+            return 0
+
+    async def nueva_version(self, espacio: str) -> int:
+        try:
+            await self.cliente.set(espacio, time.time_ns() // 1_000_000, nx=True)
+            return int(await self.cliente.incr(espacio))
+        except Exception:
+            return 0
+
+    async def bloquear(self, clave: str, ttl: float) -> bool:
+        try:
+            return bool(await self.cliente.set(clave, 1, nx=True, px=int(ttl * 1000)))
+        except Exception:
+            return True
+
+    async def liberar(self, clave: str) -> None:
+        await self.borrar(clave)
+
+    def entradas(self) -> Optional[int]:
+        return None
+
+    def limpiar(self) -> None:
+        return None
+
+
+class CacheCompartido:
+    """Cache con TTL, invalidación por espacio de nombres y protección contra estampidas.
+
+    Cada espacio tiene una versión que forma parte de las claves: invalidar un
+    espacio es incrementar su versión, y las entradas anteriores dejan de ser
+    visibles en todos los procesos sin tener que buscarlas.
+    """
+
+    def __init__(self, backend: Any, prefijo: str = CACHE_PREFIJO):
+        self.backend = backend
+        self.prefijo = prefijo
+        self._calculos: Dict[str, asyncio.Future] = {}
+
+    def _espacio(self, espacio: str) -> str:
+        return f"{self.prefijo}:v:{espacio}"
+
+    def _clave(self, espacio: str, version: int, clave: Any) -> str:
+        return f"{self.prefijo}:{espacio}:{version}:{clave}"
+
+    async def version(self, espacio: str) -> int:
+        return await self.backend.version(self._espacio(espacio))
+
+    async def obtener(self, espacio: str, clave: Any) -> Optional[Any]:
+        version = await self.version(espacio)
+        return await self.backend.obtener(self._clave(espacio, version, clave))
+
+    async def guardar(self, espacio: str, clave: Any, valor: Any, ttl: float) -> None:
+        version = await self.version(espacio)
+        await self.backend.guardar(self._clave(espacio, version, clave), valor, ttl)
+
+    async def obtener_varios(self, espacio: str, claves: Iterable[Any]) -> Dict[Any, Any]:
+        """Valores guardados de varias claves (las ausentes no aparecen), leyendo la versión una vez"""
+        claves = list(claves)
+        if not claves:
+            return {}
+        version = await self.version(espacio)
+        valores = await self.backend.obtener_varios([self._clave(espacio, version, clave) for clave in claves])
+        return {clave: valor for clave, valor in zip(claves, valores) if valor is not None}
+
+    async def guardar_varios(self, espacio: str, entradas: Iterable[Tuple[Any, Any, float]]) -> None:
+        """Guardar varios pares (clave, valor, ttl) del mismo espacio, leyendo la versión una vez"""
+        entradas = list(entradas)
+        if not entradas:
+            return
+        version = await self.version(espacio)
+        await self.backend.guardar_varios([
+            (self._clave(espacio, version, clave), valor, ttl) for clave, valor, ttl in entradas
+        ])
+
+    async def invalidar(self, espacio: str, clave: Any = None) -> int:
+        """Invalidar una clave, o el espacio completo si no se indica; devuelve la versión vigente"""
+        if clave is None:
+            return await self.backend.nueva_version(self._espacio(espacio))
+        version = await self.version(espacio)
+        await self.backend.borrar(self._clave(espacio, version, clave))
+        return version
+
+    async def obtener_o_calcular(
+        self,
+        espacio: str,
+        clave: Any,
+        calcular: Callable[[], Awaitable[Any]],
+        ttl: float
+    ) -> Any:
+        """Devolver el valor guardado o calcularlo una sola vez aunque lo pidan muchos a la vez.
+
+        El valor se guarda con la versión leída antes de calcularlo, así que si el
+        espacio se invalida mientras tanto el resultado no queda visible.
+        """
+        version = await self.version(espacio)
+        completa = self._clave(espacio, version, clave)
+        valor = await self.backend.obtener(completa)
+        if valor is not None:
+            return valor
+
+        en_curso = self._calculos.get(completa)
+        if en_curso is not None:
+            return await asyncio.shield(en_curso)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._calculos[completa] = futuro
+        try:
+            valor = await self._calcular_una_vez(completa, calcular, ttl)
+        except BaseException as error:
+            if isinstance(error, asyncio.CancelledError):
+                futuro.cancel()
+            else:
+                futuro.set_exception(error)
+                futuro.exception()  # evitar el aviso si nadie más lo esperaba
+            raise
+        else:
+            futuro.set_result(valor)
+            return valor
+        finally:
+            del self._calculos[completa]
+
+    async def _calcular_una_vez(self, completa: str, calcular: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        """Calcular el valor, o esperar a que otro proceso que ya lo está calculando lo publique"""
+        bloqueo = f"{completa}:calculando"
+        bloqueado = await self.backend.bloquear(bloqueo, CACHE_ESPERA_CALCULO)
+        if not bloqueado:
+            loop = asyncio.get_running_loop()
+            limite = loop.time() + CACHE_ESPERA_CALCULO
+            while loop.time() < limite:
+                await asyncio.sleep(0.05)
+                valor = await self.backend.obtener(completa)
+                if valor is not None:
+                    return valor
+        try:
+            valor = await calcular()
+            if valor is not None:
+                await self.backend.guardar(completa, valor, ttl)
+            return valor
+        finally:
+            if bloqueado:
+                await self.backend.liberar(bloqueo)
+
+    def limpiar(self) -> None:
+        self.backend.limpiar()
+
+
+def crear_backend(nombre: str = CACHE_BACKEND) -> Any:
+    if nombre == "redis":
+        return BackendRedis()
+    if nombre == "memoria":
+        return BackendMemoria()
+    raise ValueError(f"CACHE_BACKEND desconocido: {nombre}")
+
+
+cache_compartido = CacheCompartido(crear_backend())
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from enum import Enum
+from typing import Dict
+
+# Fallos consecutivos antes de abrir el circuito
+CB_UMBRAL_FALLOS = int(os.getenv("CB_UMBRAL_FALLOS", 5))
+# Segundos que el circuito permanece abierto antes de dejar pasar una prueba
+CB_TIEMPO_RECUPERACION = float(os.getenv("CB_TIEMPO_RECUPERACION", 30.0))
+# Llamadas de prueba simultáneas permitidas en estado semiabierto
+CB_MAX_PRUEBAS = int(os.getenv("CB_MAX_PRUEBAS", 1))
+
+# "open": si una dependencia falla se permite la operación (comportamiento histórico)
+# "closed": si una dependencia falla se rechaza la operación con 503
+DEPENDENCIAS_FAIL_MODE = os.getenv("DEPENDENCIAS_FAIL_MODE", "open").strip().lower()
+
+
+def fail_closed() -> bool:
+    """Indica si las dependencias caídas deben rechazar la operación"""
+    return DEPENDENCIAS_FAIL_MODE == "closed"
+
+
+class EstadoCircuito(str, Enum):
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+
+class CircuitBreaker:
+    """Circuit breaker por dependencia (cerrado / abierto / semiabierto)"""
+
+    def __init__(
+        self,
+        nombre: str,
+        umbral_fallos: int = CB_UMBRAL_FALLOS,
+        tiempo_recuperacion: float = CB_TIEMPO_RECUPERACION,
+        max_pruebas: int = CB_MAX_PRUEBAS
+    ):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_recuperacion = tiempo_recuperacion
+        self.max_pruebas = max_pruebas
+        self._lock = threading.Lock()
+        self._estado = EstadoCircuito.CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._pruebas_en_curso = 0
+
+    @property
+    def estado(self) -> EstadoCircuito:
+        with self._lock:
+            self._actualizar_estado()
+            return self._estado
+
+    def _actualizar_estado(self) -> None:
+        if (
+            self._estado == EstadoCircuito.ABIERTO
+            and time.monotonic() - self._abierto_desde >= self.tiempo_recuperacion
+        ):
+            self._estado = EstadoCircuito.SEMIABIERTO
+            self._pruebas_en_curso = 0
+
+    def permitir(self) -> bool:
+        """Indica si se puede llamar a la dependencia ahora"""
+        with self._lock:
+            self._actualizar_estado()
+            if self._estado == EstadoCircuito.CERRADO:
+                return True
+            if self._estado == EstadoCircuito.SEMIABIERTO and self._pruebas_en_curso < self.max_pruebas:
+                self._pruebas_en_curso += 1
+                return True
+            return False
+
+    def liberar(self) -> None:
+        """Devolver un permiso de prueba sin registrar resultado (p. ej. llamada cancelada)"""
+        with self._lock:
+            if self._pruebas_en_curso > 0:
+                self._pruebas_en_curso -= 1
+
+    def registrar_exito(self) -> None:
+        """Registrar una llamada correcta: el circuito se cierra"""
+        with self._lock:
+            self._estado = EstadoCircuito.CERRADO
+            self._fallos = 0
+            self._pruebas_en_curso = 0
+
+    def registrar_fallo(self) -> None:
+        """Registrar una llamada fallida y abrir el circuito si se supera el umbral"""
+        with self._lock:
+            self._fallos += 1
+            if self._estado == EstadoCircuito.SEMIABIERTO or self._fallos >= self.umbral_fallos:
+                self._estado = EstadoCircuito.ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._pruebas_en_curso = 0
+
+    def reiniciar(self) -> None:
+        """Volver al estado inicial"""
+        with self._lock:
+            self._estado = EstadoCircuito.CERRADO
+            self._fallos = 0
+            self._pruebas_en_curso = 0
+
+    def estado_actual(self) -> Dict[str, object]:
+        """Resumen del circuito para el endpoint de salud"""
+        with self._lock:
+            self._actualizar_estado()
+            return {"estado": self._estado.value, "fallos": self._fallos}
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    "cliente": CircuitBreaker("clientes"),
+    "barbero": CircuitBreaker("barberos"),
+}
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from .cache import cache_existencia
+from .cache_compartido import cache_compartido
+from .circuit_breaker import breakers, fail_closed
+from .http_client import obtener_cliente_http, timeout_para
+from .metricas import observar_dependencia
+from .trazas import cabeceras_propagacion, iniciar_span
+
+# URLs de otros microservicios (pueden configurarse con variables de entorno)
+CLIENTES_SERVICE_URL = os.getenv("CLIENTES_SERVICE_URL", "http://clientes:8001")
+BARBEROS_SERVICE_URL = os.getenv("BARBEROS_SERVICE_URL", "http://barberos:8002")
+
+URLS_SERVICIOS = {
+    "cliente": CLIENTES_SERVICE_URL,
+    "barbero": BARBEROS_SERVICE_URL,
+}
+
+# Máximo de IDs por llamada a los endpoints /exists
+MAX_IDS_LOTE = 1000
+
+
+def dependencia_no_disponible(tipo: str) -> bool:
+    """Aplicar el modo de fallo configurado cuando un servicio no responde"""
+    if fail_closed():
+        raise HTTPException(
+            status_code=503,
+            detail=f"El servicio de {tipo}s no está disponible"
+        )
+    # Fail-open: permitir la operación
+    return True
+
+
+async def llamar_servicio(tipo: str, metodo: str, ruta: str, **kwargs) -> Optional[httpx.Response]:
+    """Llamar a un microservicio a través de su circuit breaker.
+
+    Devuelve ``None`` si el circuito está abierto o la llamada falla (error de
+    red, timeout o respuesta 5xx).
+    """
+    breaker = breakers[tipo]
+    if not breaker.permitir():
+        return None
+
+    inicio = time.perf_counter()
+    atributos = {"http.method": metodo, "http.target": ruta, "peer.service": f"{tipo}s"}
+    with iniciar_span(f"{metodo} {tipo}s", "cliente", atributos) as span:
+        try:
+            client = obtener_cliente_http()
+            response = await client.request(
+                metodo,
+                f"{URLS_SERVICIOS[tipo]}{ruta}",
+                timeout=timeout_para(f"{tipo}s"),
+                headers={**kwargs.pop("headers", {}), **cabeceras_propagacion(span)},
+                **kwargs
+            )
+        except asyncio.CancelledError:
+            breaker.liberar()
+            raise
+        except httpx.HTTPError as error:
+            observar_dependencia(f"{tipo}s", "error", time.perf_counter() - inicio)
+            if span is not None:
+                span.error = type(error).__name__
+            breaker.registrar_fallo()
+            return None
+        if span is not None:
+            span.atributos["http.status_code"] = response.status_code
+    observar_dependencia(f"{tipo}s", str(response.status_code), time.perf_counter() - inicio)
+
+    if response.status_code >= 500:
+        breaker.registrar_fallo()
+        return None
+    breaker.registrar_exito()
+    return response
+
+
+async def verificar_entidad(tipo: str, entidad_id: int) -> bool:
+    """Consultar (con cache y circuit breaker) si una entidad existe en su microservicio"""
+    en_cache = await cache_existencia.obtener(tipo, entidad_id)
+    if en_cache is not None:
+        return en_cache
+
+    response = await llamar_servicio(tipo, "GET", f"/{tipo}s/{entidad_id}")
+    if response is None:
+        return dependencia_no_disponible(tipo)
+
+    # Solo se guardan respuestas definitivas: existe (200) o no existe (404)
+    if response.status_code in (200, 404):
+        await cache_existencia.guardar(tipo, entidad_id, response.status_code == 200)
+    return response.status_code == 200
+
+
+async def verificar_entidades(tipo: str, ids: Iterable[int]) -> Dict[int, bool]:
+    """Verificar la existencia de varias entidades con una llamada /exists por lote.
+
+    El cache se consulta y se actualiza con una operación por lote (MGET y
+    pipeline en Redis), no con una por ID.
+    """
+    unicos = list(dict.fromkeys(ids))
+    resultado = await cache_existencia.obtener_varios(tipo, unicos)
+    pendientes = [entidad_id for entidad_id in unicos if entidad_id not in resultado]
+
+    for inicio in range(0, len(pendientes), MAX_IDS_LOTE):
+        lote = pendientes[inicio:inicio + MAX_IDS_LOTE]
+        response = await llamar_servicio(tipo, "POST", f"/{tipo}s/exists", json={"ids": lote})
+        if response is None or response.status_code != 200:
+            disponible = dependencia_no_disponible(tipo)
+            resultado.update(dict.fromkeys(lote, disponible))
+            continue
+
+        existentes = set(response.json()["existentes"])
+        verificados = {entidad_id: entidad_id in existentes for entidad_id in lote}
+        await cache_existencia.guardar_varios(tipo, verificados)
+        resultado.update(verificados)
+    return resultado
+
+
+# Catálogo de barberos activos usado por la búsqueda de disponibilidad
+CATALOGO_BARBEROS_TTL = float(os.getenv("CATALOGO_BARBEROS_TTL", 60))
+# Último catálogo obtenido en este proceso, por si el servicio de barberos cae
+_ultimo_catalogo: Dict[str, Optional[List[dict]]] = {"barberos": None}
+
+
+async def _descargar_barberos_activos() -> Optional[List[dict]]:
+    """Recorrer todas las páginas de barberos activos; ``None`` si el servicio falla"""
+    barberos: List[dict] = []
+    params = {"activos_solo": "true", "limit": MAX_IDS_LOTE}
+    while True:
+        response = await llamar_servicio("barbero", "GET", "/barberos/", params=params)
+        if response is None or response.status_code != 200:
+            return None
+        barberos.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return barberos
+        params = {"activos_solo": "true", "limit": MAX_IDS_LOTE, "after": cursor}
+
+
+async def obtener_barberos_activos() -> List[dict]:
+    """Barberos activos (id, nombre, especialidad), en el cache compartido durante CATALOGO_BARBEROS_TTL segundos.
+
+    Si el servicio de barberos no responde se usa el último catálogo conocido;
+    sin ninguno se responde 503.
+    """
+    barberos = await cache_compartido.obtener_o_calcular(
+        "catalogo", "barberos_activos", _descargar_barberos_activos, CATALOGO_BARBEROS_TTL
+    )
+    if barberos is None:
+        barberos = _ultimo_catalogo["barberos"]
+        if barberos is None:
+            raise HTTPException(
+                status_code=503,
+                detail="El servicio de barberos no está disponible"
+            )
+        return barberos
+    _ultimo_catalogo["barberos"] = barberos
+    return barberos
+
+
+async def invalidar_catalogo_barberos() -> None:
+    await cache_compartido.invalidar("catalogo")
@@ -0,0 +1,222 @@
+import os
+import time as reloj
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache_compartido import CacheCompartido, cache_compartido
+from .horarios import DURACION_CITA_MINUTOS, minutos
+from .models import Cita, ESTADOS_ACTIVOS
+
+# Granularidad de la agenda: cada bit del mapa de un día representa un bloque
+SLOT_MINUTOS = int(os.getenv("DISPONIBILIDAD_SLOT_MINUTOS", 15))
+SLOTS_POR_DIA = 24 * 60 // SLOT_MINUTOS
+# Segundos tras los que un día se reconstruye desde la base de datos, para
+# recoger cambios hechos por otros workers o instancias
+DISPONIBILIDAD_TTL = float(os.getenv("DISPONIBILIDAD_TTL", 60))
+# Días distintos que se mantienen en memoria
+DISPONIBILIDAD_MAX_DIAS = int(os.getenv("DISPONIBILIDAD_MAX_DIAS", 366))
+
+
+def mascara(hora: time, duracion: int = DURACION_CITA_MINUTOS) -> int:
+    """Bits de los bloques ocupados por una cita que empieza a ``hora``"""
+    inicio = minutos(hora) // SLOT_MINUTOS
+    fin = min(-(-(minutos(hora) + max(duracion, 1)) // SLOT_MINUTOS), SLOTS_POR_DIA)
+    return ((1 << (fin - inicio)) - 1) << inicio
+
+
+def formatear_slot(slot: int) -> str:
+    """Hora de inicio de un bloque en formato HH:MM (el fin del día es 24:00)"""
+    total = slot * SLOT_MINUTOS
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+def intervalos_libres(ocupado: int, desde: int, hasta: int, minimo: int = 1) -> List[Tuple[int, int]]:
+    """Rangos [inicio, fin) de bloques libres consecutivos dentro de [desde, hasta)"""
+    libres = []
+    inicio = None
+    for slot in range(desde, hasta):
+        if not ocupado >> slot & 1:
+            if inicio is None:
+                inicio = slot
+        elif inicio is not None:
+            libres.append((inicio, slot))
+            inicio = None
+    if inicio is not None:
+        libres.append((inicio, hasta))
+    return [(a, b) for a, b in libres if b - a >= minimo]
+
+
+@dataclass
+class DiaOcupacion:
+    cargado_en: float
+    # Versión del espacio "disponibilidad:<fecha>" del cache compartido al cargar el día
+    version: int = 0
+    # barbero_id -> {cita_id: máscara de bloques}
+    citas: Dict[int, Dict[int, int]] = field(default_factory=dict)
+
+    def ocupacion(self, barbero_id: int) -> int:
+        resultado = 0
+        for bits in self.citas.get(barbero_id, {}).values():
+            resultado |= bits
+        return resultado
+
+
+def espacio_dia(fecha: date) -> str:
+    return f"disponibilidad:{fecha.isoformat()}"
+
+
+class IndiceDisponibilidad:
+    """Índice en memoria de bloques ocupados por barbero y día.
+
+    Cada día se carga de la base de datos la primera vez que se consulta y se
+    mantiene actualizado con las altas, cambios y cancelaciones de este proceso.
+    Cada escritura incrementa la versión del día en el cache compartido, de modo
+    que los demás workers recargan ese día en su siguiente consulta.
+    """
+
+    def __init__(
+        self,
+        cache: CacheCompartido,
+        ttl: float = DISPONIBILIDAD_TTL,
+        max_dias: int = DISPONIBILIDAD_MAX_DIAS
+    ):
+        self.cache = cache
+        self.ttl = ttl
+        self.max_dias = max_dias
+        self._dias: "OrderedDict[date, DiaOcupacion]" = OrderedDict()
+        self._ubicacion: Dict[int, Tuple[date, int]] = {}
+
+    async def dia(self, db: AsyncSession, fecha: date) -> DiaOcupacion:
+        """Ocupación de un día, reconstruyéndola si no está, expiró u otro proceso la cambió"""
+        version = await self.cache.version(espacio_dia(fecha))
+        dia = self._dias.get(fecha)
+        if dia is not None and dia.version == version and reloj.monotonic() - dia.cargado_en < self.ttl:
+            self._dias.move_to_end(fecha)
+            return dia
+
+        filas = await db.execute(
+            select(Cita.id, Cita.barbero_id, Cita.hora, Cita.duracion_minutos).where(
+                Cita.fecha == fecha,
+                Cita.estado.in_(ESTADOS_ACTIVOS)
+            )
+        )
+        # Si hubo escrituras durante la carga, la versión ya no coincide y el día se recargará
+        dia = DiaOcupacion(cargado_en=reloj.monotonic(), version=version)
+        self._descartar(fecha)
+        for cita_id, barbero_id, hora, duracion in filas:
+            dia.citas.setdefault(barbero_id, {})[cita_id] = mascara(hora, duracion)
+            self._ubicacion[cita_id] = (fecha, barbero_id)
+        self._dias[fecha] = dia
+        while len(self._dias) > self.max_dias:
+            self._descartar(next(iter(self._dias)))
+        return dia
+
+    async def registrar(
+        self,
+        cita_id: int,
+        barbero_id: int,
+        fecha: date,
+        hora: time,
+        duracion: int,
+        estado: str,
+        fecha_anterior: Optional[date] = None
+    ) -> None:
+        """Reflejar el estado actual de una cita tras crearla, modificarla o cancelarla.
+
+        ``fecha_anterior`` es el día que ocupaba la cita antes de moverla: se
+        publica aunque este proceso no lo tenga cargado, para que los demás
+        workers liberen sus bloques.
+        """
+        afectadas = self._aplicar(cita_id, barbero_id, fecha, hora, duracion, estado)
+        if fecha_anterior is not None:
+            afectadas.add(fecha_anterior)
+        for afectada in sorted(afectadas):
+            await self._publicar(afectada)
+
+    async def registrar_lote(self, citas: Iterable[Tuple[int, int, date, time, int, str]]) -> None:
+        """Reflejar varias citas (mismos campos que ``registrar``) publicando cada día afectado una sola vez"""
+        fechas: Set[date] = set()
+        for cita in citas:
+            fechas |= self._aplicar(*cita)
+        for afectada in sorted(fechas):
+            await self._publicar(afectada)
+
+    def _aplicar(self, cita_id: int, barbero_id: int, fecha: date, hora: time, duracion: int, estado: str) -> Set[date]:
+        """Actualizar el índice local y devolver los días cuya versión hay que publicar"""
+        anterior = self._ubicacion.get(cita_id)
+        self.quitar(cita_id)
+        dia = self._dias.get(fecha)
+        if dia is not None and estado in ESTADOS_ACTIVOS:
+            dia.citas.setdefault(barbero_id, {})[cita_id] = mascara(hora, duracion)
+            self._ubicacion[cita_id] = (fecha, barbero_id)
+        return {fecha} if anterior is None else {fecha, anterior[0]}
+
+    async def _publicar(self, fecha: date) -> None:
+        """Incrementar la versión del día; el índice local sigue vigente si nadie más escribió"""
+        version = await self.cache.invalidar(espacio_dia(fecha))
+        dia = self._dias.get(fecha)
+        if dia is None:
+            return
+        if dia.version == version - 1:
+            dia.version = version
+        else:
+            self._descartar(fecha)
+
+    def quitar(self, cita_id: int) -> None:
+        """Liberar los bloques de una cita"""
+        ubicacion = self._ubicacion.pop(cita_id, None)
+        if ubicacion is None:
+            return
+        fecha, barbero_id = ubicacion
+        dia = self._dias.get(fecha)
+        if dia is not None:
+            dia.citas.get(barbero_id, {}).pop(cita_id, None)
+
+    def limpiar(self) -> None:
+        self._dias.clear()
+        self._ubicacion.clear()
+
+    def _descartar(self, fecha: date) -> None:
+        dia = self._dias.pop(fecha, None)
+        if dia is None:
+            return
+        for citas in dia.citas.values():
+            for cita_id in citas:
+                self._ubicacion.pop(cita_id, None)
+
+
+def slots_consulta(desde: Optional[time], hasta: Optional[time]) -> Tuple[int, int]:
+    """Convertir el rango de horas pedido a bloques completos [inicio, fin)"""
+    inicio = 0 if desde is None else -(-minutos(desde) // SLOT_MINUTOS)
+    fin = SLOTS_POR_DIA if hasta is None else minutos(hasta) // SLOT_MINUTOS
+    return inicio, fin
+
+
+def disponibles(
+    dia: DiaOcupacion,
+    barberos: Iterable[dict],
+    inicio: int,
+    fin: int,
+    duracion: int
+) -> List[dict]:
+    """Barberos con al menos un hueco de ``duracion`` minutos en [inicio, fin)"""
+    minimo = max(1, -(-duracion // SLOT_MINUTOS))
+    resultado = []
+    for barbero in barberos:
+        libres = intervalos_libres(dia.ocupacion(barbero["id"]), inicio, fin, minimo)
+        if libres:
+            resultado.append({
+                "barbero_id": barbero["id"],
+                "nombre": barbero.get("nombre"),
+                "especialidad": barbero.get("especialidad"),
+                "libre": [{"desde": formatear_slot(a), "hasta": formatear_slot(b)} for a, b in libres],
+            })
+    return resultado
+
+
+indice_disponibilidad = IndiceDisponibilidad(cache_compartido)
@@ -0,0 +1,61 @@
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import cache_existencia
+from .dependencias import invalidar_catalogo_barberos
+from .replicas import aplicar_cambio
+from .schemas import EventoEntrante
+
+# Secreto compartido con los servicios que publican eventos (cabecera X-Eventos-Token);
+# sin él POST /eventos queda desactivado
+EVENTOS_TOKEN = os.getenv("EVENTOS_TOKEN", "")
+
+ENTIDADES = ("cliente", "barbero")
+ACCIONES = ("creado", "actualizado", "eliminado")
+
+
+def _clasificar(evento: EventoEntrante) -> Optional[Tuple[str, str]]:
+    """(entidad, acción) del evento, o ``None`` si el tipo no se reconoce"""
+    entidad, _, accion = evento.tipo.partition(".")
+    if entidad not in ENTIDADES or accion not in ACCIONES:
+        return None
+    return entidad, accion
+
+
+async def _actualizar_caches(entidad: str, accion: str, entidad_id: int) -> None:
+    if accion == "creado":
+        # Evita rechazar citas por una respuesta negativa guardada antes del alta
+        await cache_existencia.guardar(entidad, entidad_id, True)
+    elif accion == "eliminado" and entidad == "cliente":
+        await cache_existencia.guardar(entidad, entidad_id, False)
+    else:
+        await cache_existencia.invalidar(entidad, entidad_id)
+
+    if entidad == "barbero":
+        # Alta, cambio o baja de un barbero cambian el catálogo de disponibilidad
+        await invalidar_catalogo_barberos()
+
+
+async def aplicar_eventos(db: AsyncSession, eventos: List[EventoEntrante]) -> Tuple[int, int]:
+    """Aplicar un lote de eventos de clientes o barberos; devuelve (procesados, ignorados).
+
+    Las réplicas se actualizan en una sola transacción y los caches después de
+    confirmarla. Aplicar dos veces el mismo evento, o uno más antiguo que el
+    último aplicado, no tiene efecto, así que las entregas repetidas o
+    desordenadas del outbox son seguras.
+    """
+    reconocidos = []
+    for evento in eventos:
+        clasificacion = _clasificar(evento)
+        if clasificacion is not None:
+            reconocidos.append((evento, *clasificacion))
+
+    for evento, entidad, accion in reconocidos:
+        await aplicar_cambio(db, entidad, accion, evento.entidad_id, evento.id, evento.datos)
+    await db.commit()
+
+    for evento, entidad, accion in reconocidos:
+        await _actualizar_caches(entidad, accion, evento.entidad_id)
+    return len(reconocidos), len(eventos) - len(reconocidos)
@@ -0,0 +1,134 @@
+import json
+import os
+from bisect import bisect_left, insort
+from datetime import date, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Cita, ESTADOS_ACTIVOS
+
+# Duración (en minutos) de una cita cuyo servicio no tiene una duración propia
+DURACION_CITA_MINUTOS = int(os.getenv("DURACION_CITA_MINUTOS", 30))
+# Duración máxima admitida: acota cuánto antes de una cita puede empezar otra que la pise
+DURACION_MAXIMA_MINUTOS = 480
+MINUTOS_DIA = 24 * 60
+
+# Duración por defecto de cada servicio (el nombre se compara sin mayúsculas);
+# DURACIONES_SERVICIO='{"tinte": 60}' añade o sustituye entradas
+DURACIONES_SERVICIO: Dict[str, int] = {
+    "corte": 30,
+    "corte de cabello": 30,
+    "barba": 15,
+    "arreglo de barba": 15,
+    "afeitado": 20,
+    "corte y barba": 45,
+    **{clave.lower(): valor for clave, valor in json.loads(os.getenv("DURACIONES_SERVICIO", "{}")).items()},
+}
+
+FIN_FUERA_DEL_DIA = "La cita debe terminar el mismo día"
+
+
+def minutos(hora: time) -> int:
+    return hora.hour * 60 + hora.minute
+
+
+def hora_de(minuto: int) -> time:
+    return time(minuto // 60, minuto % 60)
+
+
+def duracion_servicio(servicio: str) -> int:
+    """Duración por defecto de un servicio"""
+    return DURACIONES_SERVICIO.get(servicio.strip().lower(), DURACION_CITA_MINUTOS)
+
+
+def con_duracion(datos: dict) -> dict:
+    """Completar la duración de una cita con la de su servicio cuando no se indica"""
+    if datos.get("duracion_minutos") is None:
+        datos["duracion_minutos"] = duracion_servicio(datos["servicio"])
+    return datos
+
+
+def intervalo(hora: time, duracion: int) -> Tuple[int, int]:
+    """Minutos [inicio, fin) del día que ocupa una cita; falla si pasa de medianoche"""
+    inicio = minutos(hora)
+    fin = inicio + duracion
+    if fin > MINUTOS_DIA:
+        raise ValueError(FIN_FUERA_DEL_DIA)
+    return inicio, fin
+
+
+async def buscar_solapamiento(
+    db: AsyncSession,
+    barbero_id: int,
+    fecha: date,
+    hora: time,
+    duracion: int,
+    excluir_id: Optional[int] = None
+) -> Optional[int]:
+    """ID de una cita activa del barbero que se solape con la indicada, si la hay.
+
+    Solo pueden solaparse citas que empiecen antes del fin de la nueva y no más
+    de DURACION_MAXIMA_MINUTOS antes de su inicio, así que basta un rango sobre
+    el índice (barbero_id, fecha, hora) en lugar de recorrer todo el día.
+    """
+    inicio, fin = intervalo(hora, duracion)
+    query = select(Cita.id, Cita.hora, Cita.duracion_minutos).where(
+        Cita.barbero_id == barbero_id,
+        Cita.fecha == fecha,
+        Cita.estado.in_(ESTADOS_ACTIVOS)
+    )
+    if inicio > DURACION_MAXIMA_MINUTOS:
+        query = query.where(Cita.hora > hora_de(inicio - DURACION_MAXIMA_MINUTOS))
+    if fin < MINUTOS_DIA:
+        query = query.where(Cita.hora < hora_de(fin))
+    if excluir_id is not None:
+        query = query.where(Cita.id != excluir_id)
+
+    for cita_id, hora_cita, duracion_cita in await db.execute(query):
+        if minutos(hora_cita) + duracion_cita > inicio:
+            return cita_id
+    return None
+
+
+# Origen de los intervalos de citas ya guardadas (los del lote llevan su índice)
+GUARDADA = -1
+
+# (inicio, fin, origen)
+Intervalo = Tuple[int, int, int]
+
+
+class AgendaBarberos:
+    """Intervalos ocupados por barbero y día, ordenados por inicio, para validar lotes"""
+
+    def __init__(self):
+        self._agendas: Dict[Tuple[int, date], List[Intervalo]] = {}
+
+    async def cargar(self, db: AsyncSession, pares: Iterable[Tuple[int, date]]) -> None:
+        """Leer con una sola consulta las citas activas de los pares (barbero, fecha)"""
+        pares = list(set(pares))
+        if not pares:
+            return
+        filas = await db.execute(
+            select(Cita.barbero_id, Cita.fecha, Cita.hora, Cita.duracion_minutos).where(
+                tuple_(Cita.barbero_id, Cita.fecha).in_(pares),
+                Cita.estado.in_(ESTADOS_ACTIVOS)
+            )
+        )
+        for barbero_id, fecha, hora, duracion in filas:
+            inicio = minutos(hora)
+            insort(self._agendas.setdefault((barbero_id, fecha), []), (inicio, inicio + duracion, GUARDADA))
+
+    def conflicto(self, barbero_id: int, fecha: date, inicio: int, fin: int) -> Optional[Intervalo]:
+        """Primer intervalo ocupado que se solapa con [inicio, fin)"""
+        agenda = self._agendas.get((barbero_id, fecha), [])
+        desde = bisect_left(agenda, (inicio - DURACION_MAXIMA_MINUTOS + 1,))
+        hasta = bisect_left(agenda, (fin,))
+        for ocupado in agenda[desde:hasta]:
+            if ocupado[1] > inicio:
+                return ocupado
+        return None
+
+    def reservar(self, barbero_id: int, fecha: date, inicio: int, fin: int, indice: int) -> None:
+        insort(self._agendas.setdefault((barbero_id, fecha), []), (inicio, fin, indice))
@@ -0,0 +1,77 @@
+import os
+from typing import Optional
+
+import httpx
+
+
+def _env_bool(nombre: str, por_defecto: bool = False) -> bool:
+    """Leer una variable de entorno booleana"""
+    valor = os.getenv(nombre)
+    if valor is None:
+        return por_defecto
+    return valor.strip().lower() in ("1", "true", "yes", "si", "on")
+
+
+# Límites del pool de conexiones (keep-alive) hacia los otros microservicios
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30.0))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 2.0))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2.0))
+
+# HTTP/2 solo se negocia sobre TLS (ALPN) y requiere el paquete h2
+HTTP2_ENABLED = _env_bool("HTTP2_ENABLED")
+
+# Timeout total de lectura por servicio destino
+TIMEOUTS_SERVICIOS = {
+    "clientes": float(os.getenv("CLIENTES_TIMEOUT", 5.0)),
+    "barberos": float(os.getenv("BARBEROS_TIMEOUT", 5.0)),
+}
+
+_cliente_http: Optional[httpx.AsyncClient] = None
+
+
+def timeout_para(servicio: str) -> httpx.Timeout:
+    """Timeout configurado para llamadas a un servicio destino"""
+    lectura = TIMEOUTS_SERVICIOS.get(servicio, 5.0)
+    return httpx.Timeout(lectura, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+
+def crear_cliente_http() -> httpx.AsyncClient:
+    """Crear un cliente HTTP con pool de conexiones persistentes"""
+    limites = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+    return httpx.AsyncClient(limits=limites, http2=http2, timeout=timeout_para(""))
+
+
+async def iniciar_cliente_http() -> httpx.AsyncClient:
+    """Crear el cliente compartido al iniciar la aplicación"""
+    global _cliente_http
+    if _cliente_http is None or _cliente_http.is_closed:
+        _cliente_http = crear_cliente_http()
+    return _cliente_http
+
+
+async def cerrar_cliente_http() -> None:
+    """Cerrar el cliente compartido y liberar sus conexiones"""
+    global _cliente_http
+    if _cliente_http is not None:
+        await _cliente_http.aclose()
+        _cliente_http = None
+
+
+def obtener_cliente_http() -> httpx.AsyncClient:
+    """Obtener el cliente compartido (se crea si la aplicación no lo inició)"""
+    global _cliente_http
+    if _cliente_http is None or _cliente_http.is_closed:
+        _cliente_http = crear_cliente_http()
+    return _cliente_http
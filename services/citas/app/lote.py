@@ -0,0 +1,118 @@
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .horarios import GUARDADA, AgendaBarberos, con_duracion, intervalo
+from .models import Cita, ESTADOS_ACTIVOS
+from .schemas import CitaCreate, CitaResponse, ResultadoCitaLote
+
+# Máximo de citas aceptadas en una sola petición de carga masiva
+MAX_CITAS_LOTE = 1000
+
+HORARIO_OCUPADO = "El barbero ya tiene una cita en ese horario"
+
+
+def es_conflicto_horario(error: IntegrityError) -> bool:
+    """Indica si el error proviene del índice único o de la exclusión de solapamientos"""
+    mensaje = str(error.orig)
+    return (
+        "uq_citas_barbero_horario_activo" in mensaje
+        or "ex_citas_barbero_solapamiento" in mensaje
+        or "citas.barbero_id, citas.fecha, citas.hora" in mensaje
+    )
+
+
+async def crear_citas_en_lote(
+    db: AsyncSession,
+    citas: List[CitaCreate],
+    clientes_existentes: Dict[int, bool],
+    barberos_existentes: Dict[int, bool]
+) -> List[ResultadoCitaLote]:
+    """Validar e insertar un lote de citas en una sola transacción.
+
+    Los solapamientos se detectan a la vez contra la base de datos (una
+    consulta) y dentro del propio lote (la primera cita gana).
+    """
+    filas = [con_duracion(cita.model_dump()) for cita in citas]
+    errores: Dict[int, str] = {}
+    for indice, cita in enumerate(citas):
+        if not clientes_existentes.get(cita.cliente_id, True):
+            errores[indice] = "El cliente especificado no existe"
+        elif not barberos_existentes.get(cita.barbero_id, True):
+            errores[indice] = "El barbero especificado no existe"
+
+    activas = [
+        indice for indice, cita in enumerate(citas)
+        if indice not in errores and cita.estado.value in ESTADOS_ACTIVOS
+    ]
+    agenda = AgendaBarberos()
+    await agenda.cargar(db, ((citas[i].barbero_id, citas[i].fecha) for i in activas))
+    for indice in activas:
+        cita = citas[indice]
+        try:
+            inicio, fin = intervalo(cita.hora, filas[indice]["duracion_minutos"])
+        except ValueError as error:
+            errores[indice] = str(error)
+            continue
+        ocupado = agenda.conflicto(cita.barbero_id, cita.fecha, inicio, fin)
+        if ocupado is None:
+            agenda.reservar(cita.barbero_id, cita.fecha, inicio, fin, indice)
+        elif ocupado[2] == GUARDADA:
+            errores[indice] = HORARIO_OCUPADO
+        else:
+            errores[indice] = f"{HORARIO_OCUPADO} (conflicto con la cita {ocupado[2]} del lote)"
+
+    validas = [indice for indice in range(len(citas)) if indice not in errores]
+    creadas: Dict[int, CitaResponse] = {}
+    if validas:
+        try:
+            creadas = await _insertar(db, filas, validas)
+        except IntegrityError as error:
+            await db.rollback()
+            if not es_conflicto_horario(error):
+                raise
+            # Otra petición ocupó un horario entre la consulta y la inserción:
+            # reintentar cita a cita para rechazar solo las afectadas
+            creadas, conflictos = await _insertar_una_a_una(db, filas, validas)
+            errores.update(dict.fromkeys(conflictos, HORARIO_OCUPADO))
+
+    return [
+        ResultadoCitaLote(indice=indice, creada=True, cita=creadas[indice])
+        if indice in creadas
+        else ResultadoCitaLote(indice=indice, creada=False, detalle=errores.get(indice))
+        for indice in range(len(citas))
+    ]
+
+
+async def _insertar(db: AsyncSession, filas: List[dict], indices: List[int]) -> Dict[int, CitaResponse]:
+    """Insertar todas las citas con un solo INSERT ... RETURNING"""
+    insertadas = await db.scalars(
+        insert(Cita).returning(Cita, sort_by_parameter_order=True), [filas[indice] for indice in indices]
+    )
+    respuestas = [CitaResponse.model_validate(cita) for cita in insertadas]
+    await db.commit()
+    return dict(zip(indices, respuestas))
+
+
+async def _insertar_una_a_una(
+    db: AsyncSession,
+    filas: List[dict],
+    indices: List[int]
+) -> Tuple[Dict[int, CitaResponse], List[int]]:
+    creadas: Dict[int, CitaResponse] = {}
+    conflictos: List[int] = []
+    for indice in indices:
+        try:
+            async with db.begin_nested():
+                cita = Cita(**filas[indice])
+                db.add(cita)
+            creadas[indice] = CitaResponse.model_validate(cita)
+        except IntegrityError as error:
+            if not es_conflicto_horario(error):
+                await db.rollback()
+                raise
+            conflictos.append(indice)
+    await db.commit()
+    return creadas, conflictos
@@ -1,166 +1,483 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
 import os
-import httpx
-from datetime import date
+from datetime import date, time
 
-from .database import engine, get_db, Base
-from .models import Cita, EstadoCita
-from .schemas import CitaCreate, CitaUpdate, CitaResponse
+from .database import SessionLocal, actualizar_fila, engine, get_db, get_sesiones, estadisticas_pool
+from .models import Cita, EstadoCita, ESTADOS_ACTIVOS
+from .exportacion import FormatoExportacion, exportar
+from .paginacion import MAX_LIMIT, agregar_cursor, decodificar_cursor, obtener_pagina, validar_paginacion
+from .schemas import (
+    CitaCreate, CitaUpdate, CitaResponse, CitaExpandida, CitaLoteResponse, DisponibilidadBarbero,
+    LoteEventos, ResultadoEventos, ResultadoSincronizacion, TipoEntidad
+)
+from .http_client import iniciar_cliente_http, cerrar_cliente_http
+from .validaciones import consultar_en_paralelo, validar_en_paralelo
+from .lote import HORARIO_OCUPADO, MAX_CITAS_LOTE, crear_citas_en_lote, es_conflicto_horario
+from .cache import cache_existencia
+from .circuit_breaker import breakers
+from .dependencias import (
+    invalidar_catalogo_barberos, obtener_barberos_activos, verificar_entidad, verificar_entidades
+)
+from .eventos import EVENTOS_TOKEN, aplicar_eventos
+from .metricas import TIPO_CONTENIDO, MiddlewareMetricas, instrumentar_engine, registrar_pool, registro
+from .perfilado import MiddlewarePerfilado
+from . import trazas
+from .trazas import MiddlewareTrazas
+from .replicas import (
+    REPLICAS_SINCRONIZAR_AL_INICIAR, citas_expandidas, expandir_consulta, sincronizar_todo
+)
+from .disponibilidad import disponibles, indice_disponibilidad, slots_consulta
+from .horarios import DURACION_CITA_MINUTOS, buscar_solapamiento, con_duracion, duracion_servicio
 
-# Crear las tablas
-Base.metadata.create_all(bind=engine)
+# Las tablas se crean con las migraciones (python -m app.migrate), no al importar
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Abrir el pool HTTP compartido al iniciar y cerrarlo al apagar"""
+    await iniciar_cliente_http()
+    indice_disponibilidad.limpiar()
+    sincronizacion = None
+    if REPLICAS_SINCRONIZAR_AL_INICIAR:
+        sincronizacion = asyncio.create_task(sincronizar_todo(SessionLocal))
+    yield
+    if sincronizacion is not None:
+        sincronizacion.cancel()
+        await asyncio.gather(sincronizacion, return_exceptions=True)
+    await cerrar_cliente_http()
+    trazas.exportador.vaciar()
 
 app = FastAPI(
     title="Servicio de Citas - Barbería",
     description="API para gestionar citas de la barbería",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
-
-# URLs de otros microservicios (pueden configurarse con variables de entorno)
-CLIENTES_SERVICE_URL = os.getenv("CLIENTES_SERVICE_URL", "http://clientes:8001")
-BARBEROS_SERVICE_URL = os.getenv("BARBEROS_SERVICE_URL", "http://barberos:8002")
+# El perfilado queda dentro de las métricas, que crean el acumulador de consultas;
+# las trazas envuelven a ambos para que sus logs lleven el trace_id
+app.add_middleware(MiddlewarePerfilado)
+app.add_middleware(MiddlewareMetricas)
+app.add_middleware(MiddlewareTrazas)
+instrumentar_engine(engine)
+trazas.instrumentar_engine(engine)
+registrar_pool(estadisticas_pool)
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "citas"}
+    return {
+        "status": "healthy",
+        "service": "citas",
+        "dependencias": {
+            breaker.nombre: breaker.estado_actual() for breaker in breakers.values()
+        }
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return PlainTextResponse(registro.exponer(), media_type=TIPO_CONTENIDO)
+
+@app.get("/health/pool")
+def estado_pool():
+    """Uso del pool de conexiones a la base de datos"""
+    return estadisticas_pool()
 
 async def verificar_cliente_existe(cliente_id: int):
     """Verificar si un cliente existe en el servicio de clientes"""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{CLIENTES_SERVICE_URL}/clientes/{cliente_id}", timeout=5.0)
-            return response.status_code == 200
-    except:
-        # Si el servicio no está disponible, permitir la operación
-        return True
+    return await verificar_entidad(TipoEntidad.CLIENTE.value, cliente_id)
 
 async def verificar_barbero_existe(barbero_id: int):
     """Verificar si un barbero existe en el servicio de barberos"""
+    return await verificar_entidad(TipoEntidad.BARBERO.value, barbero_id)
+
+async def verificar_clientes_existen(ids: List[int]) -> Dict[int, bool]:
+    """Verificar en lote qué clientes existen en el servicio de clientes"""
+    return await verificar_entidades(TipoEntidad.CLIENTE.value, ids)
+
+async def verificar_barberos_existen(ids: List[int]) -> Dict[int, bool]:
+    """Verificar en lote qué barberos existen en el servicio de barberos"""
+    return await verificar_entidades(TipoEntidad.BARBERO.value, ids)
+
+async def listar_barberos_activos() -> List[dict]:
+    """Obtener el catálogo de barberos activos del servicio de barberos"""
+    return await obtener_barberos_activos()
+
+def requerir_token_interno(x_eventos_token: Optional[str] = Header(None)) -> None:
+    """Exigir EVENTOS_TOKEN en los endpoints internos (eventos, réplicas y caches)"""
+    if not EVENTOS_TOKEN:
+        # Sin secreto configurado cualquiera podría escribir en las réplicas o vaciar los caches
+        raise HTTPException(status_code=503, detail="Esta operación requiere EVENTOS_TOKEN")
+    if x_eventos_token is None or not hmac.compare_digest(x_eventos_token, EVENTOS_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de eventos inválido")
+
+@app.get("/cache/estadisticas")
+def estadisticas_cache():
+    """Obtener los contadores del cache de existencia"""
+    return cache_existencia.estadisticas()
+
+@app.delete(
+    "/cache/{tipo}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(requerir_token_interno)]
+)
+async def invalidar_cache_tipo(tipo: TipoEntidad):
+    """Invalidar todas las entradas de un tipo (cliente o barbero; este incluye el catálogo)"""
+    await cache_existencia.invalidar(tipo.value)
+    if tipo == TipoEntidad.BARBERO:
+        await invalidar_catalogo_barberos()
+    return None
+
+@app.delete(
+    "/cache/{tipo}/{entidad_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(requerir_token_interno)]
+)
+async def invalidar_cache_entidad(tipo: TipoEntidad, entidad_id: int):
+    """Invalidar la entrada de un cliente o barbero (p. ej. tras eliminarlo)"""
+    await cache_existencia.invalidar(tipo.value, entidad_id)
+    return None
+
+@app.post("/eventos", response_model=ResultadoEventos, dependencies=[Depends(requerir_token_interno)])
+async def recibir_eventos(lote: LoteEventos, db: AsyncSession = Depends(get_db)):
+    """Recibir los eventos del outbox de clientes y barberos y actualizar réplicas y caches"""
+    procesados, ignorados = await aplicar_eventos(db, lote.eventos)
+    return ResultadoEventos(procesados=procesados, ignorados=ignorados)
+
+@app.post(
+    "/replicas/sincronizar", response_model=ResultadoSincronizacion, dependencies=[Depends(requerir_token_interno)]
+)
+async def sincronizar_replicas():
+    """Copiar todos los clientes y barberos a las réplicas locales (carga inicial o reparación).
+
+    Un valor nulo indica que ese servicio no respondió.
+    """
+    return await sincronizar_todo(SessionLocal)
+
+async def _validar_horario(db: AsyncSession, cita, excluir_id: Optional[int] = None) -> None:
+    """Rechazar una cita activa que se solape con otra del mismo barbero"""
+    estado = getattr(cita.estado, "value", cita.estado)
+    if estado not in ESTADOS_ACTIVOS:
+        return
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{BARBEROS_SERVICE_URL}/barberos/{barbero_id}", timeout=5.0)
-            return response.status_code == 200
-    except:
-        # Si el servicio no está disponible, permitir la operación
-        return True
-
-@app.get("/citas/", response_model=List[CitaResponse])
-def listar_citas(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Obtener lista de todas las citas"""
-    citas = db.query(Cita).offset(skip).limit(limit).all()
-    return citas
+        ocupada = await buscar_solapamiento(
+            db, cita.barbero_id, cita.fecha, cita.hora, cita.duracion_minutos, excluir_id=excluir_id
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if ocupada is not None:
+        raise HTTPException(status_code=400, detail=HORARIO_OCUPADO)
+
+async def _leer_cita(db: AsyncSession, cita_id: int, completa: bool):
+    """Leer la cita (o solo su ID si ``completa`` es falso) y cerrar la transacción de
+    lectura, para que la conexión vuelva al pool mientras se esperan otras validaciones"""
+    if completa:
+        cita = await db.get(Cita, cita_id)
+    else:
+        cita = await db.scalar(select(Cita.id).where(Cita.id == cita_id))
+    # Con expire_on_commit=False la cita leída sigue siendo utilizable
+    await db.commit()
+    return cita
+
+async def _confirmar_horario(db: AsyncSession) -> None:
+    """Confirmar la transacción traduciendo un horario ocupado a un error 400"""
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if es_conflicto_horario(error):
+            raise HTTPException(status_code=400, detail=HORARIO_OCUPADO)
+        raise
+
+def _datos_disponibilidad(cita):
+    estado = getattr(cita.estado, "value", cita.estado)
+    return cita.id, cita.barbero_id, cita.fecha, cita.hora, cita.duracion_minutos, estado
+
+async def _registrar_disponibilidad(cita, fecha_anterior: Optional[date] = None) -> None:
+    """Actualizar el índice de disponibilidad con el estado confirmado de una cita"""
+    await indice_disponibilidad.registrar(*_datos_disponibilidad(cita), fecha_anterior=fecha_anterior)
+
+# Campos que cambian el horario ocupado por una cita y obligan a comprobar solapamientos
+CAMPOS_HORARIO = {"barbero_id", "fecha", "hora", "duracion_minutos", "estado"}
+
+# Orden de agenda usado por los listados y sus cursores
+ORDEN_AGENDA = (Cita.fecha, Cita.hora, Cita.id)
+CLAVES_AGENDA = ["fecha", "hora", "id"]
+
+def decodificar_cursor_agenda(token: str) -> Tuple[date, time, int]:
+    """Cursor de los listados de citas ordenados por (fecha, hora, id)"""
+    fecha, hora, cita_id = decodificar_cursor(token, 3)
+    try:
+        if not isinstance(cita_id, int):
+            raise ValueError(cita_id)
+        return date.fromisoformat(fecha), time.fromisoformat(hora), cita_id
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+async def _pagina_citas(db: AsyncSession, response: Response, query, limit: int, expandir: bool):
+    """Página de citas con su cursor; con ``expandir`` une las réplicas en la misma consulta"""
+    if not expandir:
+        citas, siguiente = await obtener_pagina(db, query, limit, CLAVES_AGENDA)
+        agregar_cursor(response, siguiente)
+        return citas
+    filas, siguiente = await obtener_pagina(
+        db, expandir_consulta(query), limit, CLAVES_AGENDA, filas_completas=True
+    )
+    agregar_cursor(response, siguiente)
+    return citas_expandidas(filas)
+
+@app.get("/citas/", response_model=List[CitaExpandida], response_model_exclude_unset=True)
+async def listar_citas(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_LIMIT),
+    after: Optional[str] = None,
+    expandir: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener lista de todas las citas ordenadas por fecha y hora.
+
+    Admite paginación por desplazamiento (skip) o por cursor (after); el cursor
+    de la página siguiente se devuelve en la cabecera X-Next-Cursor. Con
+    expandir=true cada cita incluye los datos de su cliente y su barbero.
+    """
+    validar_paginacion(skip, after)
+    query = select(Cita).order_by(*ORDEN_AGENDA)
+    if after is not None:
+        query = query.where(tuple_(*ORDEN_AGENDA) > decodificar_cursor_agenda(after))
+    return await _pagina_citas(db, response, query.offset(skip), limit, expandir)
+
+@app.get("/citas/export")
+async def exportar_citas(
+    formato: FormatoExportacion = FormatoExportacion.NDJSON,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    barbero_id: Optional[int] = None,
+    sesiones: async_sessionmaker = Depends(get_sesiones)
+):
+    """Exportar las citas en streaming (NDJSON o CSV), filtrando por fechas y barbero"""
+    query = select(Cita).order_by(*ORDEN_AGENDA)
+    if desde is not None:
+        query = query.where(Cita.fecha >= desde)
+    if hasta is not None:
+        query = query.where(Cita.fecha <= hasta)
+    if barbero_id is not None:
+        query = query.where(Cita.barbero_id == barbero_id)
+    return exportar(sesiones, query, CitaResponse, formato, "citas")
 
 @app.get("/citas/{cita_id}", response_model=CitaResponse)
-def obtener_cita(cita_id: int, db: Session = Depends(get_db)):
+async def obtener_cita(cita_id: int, db: AsyncSession = Depends(get_db)):
     """Obtener una cita por su ID"""
-    cita = db.query(Cita).filter(Cita.id == cita_id).first()
+    cita = await db.get(Cita, cita_id)
     if cita is None:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     return cita
 
-@app.get("/citas/barbero/{barbero_id}", response_model=List[CitaResponse])
-def listar_citas_por_barbero(barbero_id: int, db: Session = Depends(get_db)):
-    """Obtener todas las citas de un barbero específico"""
-    citas = db.query(Cita).filter(Cita.barbero_id == barbero_id).all()
-    return citas
+def _consulta_agenda(
+    filtro,
+    desde: Optional[date],
+    hasta: Optional[date],
+    estado: Optional[EstadoCita],
+    after: Optional[str]
+):
+    """Citas que cumplen ``filtro`` en orden de agenda, con filtros de fecha y estado"""
+    query = select(Cita).where(filtro).order_by(*ORDEN_AGENDA)
+    if desde is not None:
+        query = query.where(Cita.fecha >= desde)
+    if hasta is not None:
+        query = query.where(Cita.fecha <= hasta)
+    if estado is not None:
+        query = query.where(Cita.estado == estado.value)
+    if after is not None:
+        query = query.where(tuple_(*ORDEN_AGENDA) > decodificar_cursor_agenda(after))
+    return query
+
+@app.get("/citas/barbero/{barbero_id}", response_model=List[CitaExpandida], response_model_exclude_unset=True)
+async def listar_citas_por_barbero(
+    barbero_id: int,
+    response: Response,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    estado: Optional[EstadoCita] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_LIMIT),
+    after: Optional[str] = None,
+    expandir: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener la agenda de un barbero, filtrando por fechas y estado.
+
+    Admite paginación por desplazamiento (skip) o por cursor (after); el cursor
+    de la página siguiente se devuelve en la cabecera X-Next-Cursor. Con
+    expandir=true cada cita incluye los datos de su cliente y su barbero.
+    """
+    validar_paginacion(skip, after)
+    query = _consulta_agenda(Cita.barbero_id == barbero_id, desde, hasta, estado, after)
+    return await _pagina_citas(db, response, query.offset(skip), limit, expandir)
+
+@app.get("/citas/cliente/{cliente_id}", response_model=List[CitaExpandida], response_model_exclude_unset=True)
+async def listar_citas_por_cliente(
+    cliente_id: int,
+    response: Response,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    estado: Optional[EstadoCita] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_LIMIT),
+    after: Optional[str] = None,
+    expandir: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener las citas de un cliente, filtrando por fechas y estado.
+
+    Admite paginación por desplazamiento (skip) o por cursor (after); el cursor
+    de la página siguiente se devuelve en la cabecera X-Next-Cursor. Con
+    expandir=true cada cita incluye los datos de su cliente y su barbero.
+    """
+    validar_paginacion(skip, after)
+    query = _consulta_agenda(Cita.cliente_id == cliente_id, desde, hasta, estado, after)
+    return await _pagina_citas(db, response, query.offset(skip), limit, expandir)
 
-@app.get("/citas/cliente/{cliente_id}", response_model=List[CitaResponse])
-def listar_citas_por_cliente(cliente_id: int, db: Session = Depends(get_db)):
-    """Obtener todas las citas de un cliente específico"""
-    citas = db.query(Cita).filter(Cita.cliente_id == cliente_id).all()
-    return citas
+@app.get("/disponibilidad", response_model=List[DisponibilidadBarbero])
+async def buscar_disponibilidad(
+    fecha: date,
+    desde: Optional[time] = None,
+    hasta: Optional[time] = None,
+    especialidad: Optional[str] = None,
+    duracion: int = DURACION_CITA_MINUTOS,
+    db: AsyncSession = Depends(get_db)
+):
+    """Barberos activos con huecos libres en una fecha, opcionalmente entre dos horas.
+
+    Se responde desde un índice en memoria de bloques ocupados por barbero y
+    día; los huecos más cortos que ``duracion`` minutos se omiten.
+    """
+    inicio, fin = slots_consulta(desde, hasta)
+    if inicio >= fin:
+        raise HTTPException(status_code=400, detail="El rango de horas no es válido")
+    if duracion <= 0:
+        raise HTTPException(status_code=400, detail="La duración debe ser mayor que cero")
+
+    barberos = await listar_barberos_activos()
+    if especialidad is not None:
+        buscada = especialidad.strip().lower()
+        barberos = [b for b in barberos if (b.get("especialidad") or "").strip().lower() == buscada]
+    if not barberos:
+        return []
+
+    dia = await indice_disponibilidad.dia(db, fecha)
+    return disponibles(dia, barberos, inicio, fin, duracion)
 
 @app.post("/citas/", response_model=CitaResponse, status_code=status.HTTP_201_CREATED)
-async def crear_cita(cita: CitaCreate, db: Session = Depends(get_db)):
+async def crear_cita(cita: CitaCreate, db: AsyncSession = Depends(get_db)):
     """Crear una nueva cita"""
-    # Verificar que el cliente exista
-    if not await verificar_cliente_existe(cita.cliente_id):
-        raise HTTPException(status_code=400, detail="El cliente especificado no existe")
-
-    # Verificar que el barbero exista
-    if not await verificar_barbero_existe(cita.barbero_id):
-        raise HTTPException(status_code=400, detail="El barbero especificado no existe")
-
-    # Verificar disponibilidad del barbero en esa fecha y hora
-    cita_existente = db.query(Cita).filter(
-        Cita.barbero_id == cita.barbero_id,
-        Cita.fecha == cita.fecha,
-        Cita.hora == cita.hora,
-        Cita.estado.in_([EstadoCita.PENDIENTE.value, EstadoCita.CONFIRMADA.value])
-    ).first()
-
-    if cita_existente:
+    # Verificar en paralelo que el cliente y el barbero existan
+    await validar_en_paralelo([
+        (verificar_cliente_existe(cita.cliente_id), "El cliente especificado no existe"),
+        (verificar_barbero_existe(cita.barbero_id), "El barbero especificado no existe"),
+    ])
+
+    # Búsqueda por rango de solapamientos; en PostgreSQL la restricción de
+    # exclusión garantiza además que dos peticiones concurrentes no se pisen
+    nueva_cita = Cita(**con_duracion(cita.model_dump()))
+    await _validar_horario(db, nueva_cita)
+    db.add(nueva_cita)
+    # El INSERT ... RETURNING del commit rellena el ID; la fila no se vuelve a leer
+    await _confirmar_horario(db)
+    await _registrar_disponibilidad(nueva_cita)
+    return nueva_cita
+
+@app.post("/citas/bulk", response_model=CitaLoteResponse)
+async def crear_citas_lote(citas: List[CitaCreate], db: AsyncSession = Depends(get_db)):
+    """Crear varias citas en una sola transacción, con un resultado por cita"""
+    if len(citas) > MAX_CITAS_LOTE:
         raise HTTPException(
             status_code=400,
-            detail="El barbero ya tiene una cita en ese horario"
+            detail=f"Se admiten como máximo {MAX_CITAS_LOTE} citas por lote"
         )
 
-    nueva_cita = Cita(**cita.model_dump())
-    db.add(nueva_cita)
-    db.commit()
-    db.refresh(nueva_cita)
-    return nueva_cita
+    # Verificar en lote (y en paralelo) todos los clientes y barberos distintos
+    clientes, barberos = await consultar_en_paralelo(
+        verificar_clientes_existen([cita.cliente_id for cita in citas]),
+        verificar_barberos_existen([cita.barbero_id for cita in citas]),
+    )
+
+    resultados = await crear_citas_en_lote(db, citas, clientes, barberos)
+    # Una sola invalidación del cache compartido por día afectado, no una por cita
+    await indice_disponibilidad.registrar_lote(
+        _datos_disponibilidad(resultado.cita) for resultado in resultados if resultado.cita is not None
+    )
+    creadas = sum(1 for resultado in resultados if resultado.creada)
+    return CitaLoteResponse(creadas=creadas, rechazadas=len(resultados) - creadas, resultados=resultados)
 
 @app.put("/citas/{cita_id}", response_model=CitaResponse)
-async def actualizar_cita(cita_id: int, cita: CitaUpdate, db: Session = Depends(get_db)):
+async def actualizar_cita(cita_id: int, cita: CitaUpdate, db: AsyncSession = Depends(get_db)):
     """Actualizar una cita existente"""
-    db_cita = db.query(Cita).filter(Cita.id == cita_id).first()
-    if db_cita is None:
-        raise HTTPException(status_code=404, detail="Cita no encontrada")
-
     # Actualizar solo los campos proporcionados
     update_data = cita.model_dump(exclude_unset=True)
 
-    # Si se actualiza el cliente, verificar que exista
-    if "cliente_id" in update_data:
-        if not await verificar_cliente_existe(update_data["cliente_id"]):
-            raise HTTPException(status_code=400, detail="El cliente especificado no existe")
+    # Si cambia el servicio sin indicar duración, se aplica la del nuevo servicio
+    if update_data.get("duracion_minutos") is None:
+        update_data.pop("duracion_minutos", None)
+        if "servicio" in update_data:
+            update_data["duracion_minutos"] = duracion_servicio(update_data["servicio"])
 
-    # Si se actualiza el barbero, verificar que exista
+    # Si se actualiza el cliente o el barbero, verificar en paralelo que existan
+    validaciones = []
+    if "cliente_id" in update_data:
+        validaciones.append(
+            (verificar_cliente_existe(update_data["cliente_id"]), "El cliente especificado no existe")
+        )
     if "barbero_id" in update_data:
-        if not await verificar_barbero_existe(update_data["barbero_id"]):
-            raise HTTPException(status_code=400, detail="El barbero especificado no existe")
-
-    # Verificar disponibilidad si se cambia fecha, hora o barbero
-    if any(k in update_data for k in ["fecha", "hora", "barbero_id"]):
-        nueva_fecha = update_data.get("fecha", db_cita.fecha)
-        nueva_hora = update_data.get("hora", db_cita.hora)
-        nuevo_barbero = update_data.get("barbero_id", db_cita.barbero_id)
-
-        cita_conflicto = db.query(Cita).filter(
-            Cita.barbero_id == nuevo_barbero,
-            Cita.fecha == nueva_fecha,
-            Cita.hora == nueva_hora,
-            Cita.id != cita_id,
-            Cita.estado.in_([EstadoCita.PENDIENTE.value, EstadoCita.CONFIRMADA.value])
-        ).first()
-
-        if cita_conflicto:
-            raise HTTPException(
-                status_code=400,
-                detail="El barbero ya tiene una cita en ese horario"
-            )
-
-    for field, value in update_data.items():
-        setattr(db_cita, field, value)
-
-    db.commit()
-    db.refresh(db_cita)
+        validaciones.append(
+            (verificar_barbero_existe(update_data["barbero_id"]), "El barbero especificado no existe")
+        )
+
+    # La cita se lee mientras se validan cliente y barbero, sin bloquear la fila ni
+    # retener la conexión durante las llamadas remotas; un ID inexistente responde
+    # 404 aunque alguna validación falle
+    cambia_horario = bool(update_data.keys() & CAMPOS_HORARIO)
+    db_cita, validacion = await asyncio.gather(
+        _leer_cita(db, cita_id, completa=cambia_horario),
+        validar_en_paralelo(validaciones),
+        return_exceptions=True
+    )
+    if isinstance(db_cita, BaseException):
+        raise db_cita
+    if db_cita is None:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    if isinstance(validacion, BaseException):
+        raise validacion
+
+    if cambia_horario:
+        # Día que la cita deja libre si se mueve; hay que publicarlo también
+        fecha_anterior = db_cita.fecha
+        # Los solapamientos se comprueban con la cita ya combinada
+        for field, value in update_data.items():
+            setattr(db_cita, field, value)
+        await _validar_horario(db, db_cita, excluir_id=cita_id)
+    else:
+        # Sin cambios de horario basta el UPDATE ... RETURNING, una vez validado
+        db_cita = await actualizar_fila(db, Cita, cita_id, update_data)
+        if db_cita is None:
+            raise HTTPException(status_code=404, detail="Cita no encontrada")
+        fecha_anterior = None
+    await _confirmar_horario(db)
+    await _registrar_disponibilidad(db_cita, fecha_anterior)
     return db_cita
 
 @app.delete("/citas/{cita_id}", status_code=status.HTTP_204_NO_CONTENT)
-def eliminar_cita(cita_id: int, db: Session = Depends(get_db)):
+async def eliminar_cita(cita_id: int, db: AsyncSession = Depends(get_db)):
     """Cancelar una cita (cambiar estado a cancelada)"""
-    db_cita = db.query(Cita).filter(Cita.id == cita_id).first()
+    # Marcar como cancelada en lugar de eliminar
+    db_cita = await actualizar_fila(db, Cita, cita_id, {"estado": EstadoCita.CANCELADA.value})
     if db_cita is None:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
-
-    # Marcar como cancelada en lugar de eliminar
-    db_cita.estado = EstadoCita.CANCELADA.value
-    db.commit()
+    await db.commit()
+    await _registrar_disponibilidad(db_cita)
     return None
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Time, Enum
+from sqlalchemy import Column, Integer, String, Boolean, Date, Time, DateTime, Enum, Index, func, text, true
 from .database import Base
 import enum
 
@@ -8,8 +8,30 @@ class EstadoCita(str, enum.Enum):
     COMPLETADA = "completada"
     CANCELADA = "cancelada"
 
+# Estados que ocupan el horario de un barbero
+ESTADOS_ACTIVOS = (EstadoCita.PENDIENTE.value, EstadoCita.CONFIRMADA.value)
+_FILTRO_ACTIVAS = text("estado IN ('pendiente', 'confirmada')")
+
 class Cita(Base):
     __tablename__ = "citas"
+    __table_args__ = (
+        # Búsqueda de solapamientos y agenda por barbero (paginada por fecha, hora, id)
+        Index("ix_citas_barbero_agenda", "barbero_id", "fecha", "hora", "id"),
+        # Agenda por cliente
+        Index("ix_citas_cliente_agenda", "cliente_id", "fecha", "hora", "id"),
+        # Orden del listado general y paginación por cursor
+        Index("ix_citas_fecha_hora_id", "fecha", "hora", "id"),
+        # Un barbero no puede tener dos citas activas en el mismo horario
+        Index(
+            "uq_citas_barbero_horario_activo",
+            "barbero_id", "fecha", "hora",
+            unique=True,
+            postgresql_where=_FILTRO_ACTIVAS,
+            sqlite_where=_FILTRO_ACTIVAS
+        ),
+        # En PostgreSQL la migración 0004 añade además la restricción de exclusión
+        # ex_citas_barbero_solapamiento, que impide solapar intervalos de citas activas
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     cliente_id = Column(Integer, nullable=False)
@@ -17,5 +39,34 @@ class Cita(Base):
     fecha = Column(Date, nullable=False)
     hora = Column(Time, nullable=False)
     servicio = Column(String, nullable=False)
+    duracion_minutos = Column(Integer, nullable=False, default=30, server_default=text("30"))
     estado = Column(String, default=EstadoCita.PENDIENTE.value)
 
+
+class ClienteReplica(Base):
+    """Copia local de los campos de clientes que citas necesita para sus listados.
+
+    Se mantiene con los eventos del servicio de clientes (POST /eventos) y con
+    la sincronización completa (POST /replicas/sincronizar). ``evento_id`` es el
+    último evento aplicado, para descartar eventos que lleguen fuera de orden.
+    """
+    __tablename__ = "citas_clientes_replica"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    nombre = Column(String, nullable=False)
+    telefono = Column(String, nullable=True)
+    activo = Column(Boolean, nullable=False, default=True, server_default=true())
+    evento_id = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    actualizado_en = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+class BarberoReplica(Base):
+    """Copia local de los campos de barberos que citas necesita para sus listados"""
+    __tablename__ = "citas_barberos_replica"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    nombre = Column(String, nullable=False)
+    especialidad = Column(String, nullable=True)
+    telefono = Column(String, nullable=True)
+    activo = Column(Boolean, nullable=False, default=True, server_default=true())
+    evento_id = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    actualizado_en = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,168 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import Select, func, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .cache import cache_existencia
+from .dependencias import MAX_IDS_LOTE, invalidar_catalogo_barberos, llamar_servicio
+from .models import BarberoReplica, Cita, ClienteReplica
+from .schemas import BarberoResumen, CitaExpandida, ClienteResumen
+
+# Sincronizar las réplicas en segundo plano al arrancar (útil tras desplegar por primera vez)
+REPLICAS_SINCRONIZAR_AL_INICIAR = os.getenv("REPLICAS_SINCRONIZAR_AL_INICIAR", "false").lower() == "true"
+
+MODELOS = {"cliente": ClienteReplica, "barbero": BarberoReplica}
+# Campos copiados de cada servicio (los mismos que publican sus eventos)
+CAMPOS = {
+    "cliente": ("nombre", "telefono"),
+    "barbero": ("nombre", "especialidad", "telefono", "activo"),
+}
+
+
+def _upsert(dialecto: str, tipo: str, filas: List[Dict[str, Any]], evento_id: Optional[int] = None):
+    """INSERT ... ON CONFLICT (id) DO UPDATE con los campos presentes en las filas.
+
+    Con ``evento_id`` la fila existente solo se actualiza si el evento es más
+    reciente que el último aplicado; sin él (sincronización completa) siempre se
+    actualiza y se conserva el ``evento_id`` guardado.
+    """
+    modelo = MODELOS[tipo]
+    modulo = postgresql if dialecto == "postgresql" else sqlite
+    sentencia = modulo.insert(modelo).values(filas)
+    columnas = {campo: sentencia.excluded[campo] for campo in filas[0] if campo != "id"}
+    columnas["actualizado_en"] = func.now()
+    condicion = None
+    if evento_id is not None:
+        condicion = modelo.evento_id < sentencia.excluded.evento_id
+    return sentencia.on_conflict_do_update(index_elements=["id"], set_=columnas, where=condicion)
+
+
+async def aplicar_cambio(
+    db: AsyncSession,
+    tipo: str,
+    accion: str,
+    entidad_id: int,
+    evento_id: int,
+    datos: Optional[Dict[str, Any]]
+) -> None:
+    """Reflejar en la réplica un evento de alta, cambio o baja (sin confirmar la transacción)"""
+    modelo = MODELOS[tipo]
+    if accion == "eliminado":
+        # Se conserva la fila para que las citas antiguas sigan mostrando el nombre
+        await db.execute(
+            update(modelo)
+            .where(modelo.id == entidad_id, modelo.evento_id < evento_id)
+            .values(activo=False, evento_id=evento_id, actualizado_en=func.now())
+        )
+        return
+
+    datos = datos or {}
+    if "nombre" not in datos:
+        # Evento sin los campos replicados: lo corregirá la próxima sincronización
+        return
+    fila = {campo: datos[campo] for campo in CAMPOS[tipo] if campo in datos}
+    fila.update(id=entidad_id, evento_id=evento_id)
+    fila.setdefault("activo", True)
+    await db.execute(_upsert(db.get_bind().dialect.name, tipo, [fila], evento_id))
+
+
+async def _descargar_pagina(tipo: str, after: Optional[str]):
+    params = {"limit": MAX_IDS_LOTE}
+    if after is not None:
+        params["after"] = after
+    response = await llamar_servicio(tipo, "GET", f"/{tipo}s/", params=params)
+    if response is None or response.status_code != 200:
+        return None
+    return response.json(), response.headers.get("X-Next-Cursor")
+
+
+async def sincronizar(db: AsyncSession, tipo: str) -> Optional[int]:
+    """Copiar todos los registros del servicio a la réplica, página a página.
+
+    Al terminar, las réplicas activas que ya no existen en el servicio (borradas
+    sin que llegara su evento) se marcan como inactivas. Devuelve cuántos se
+    copiaron, o ``None`` si el servicio no responde (lo ya copiado se conserva
+    y no se desactiva nada).
+    """
+    dialecto = db.get_bind().dialect.name
+    modelo = MODELOS[tipo]
+    # Las filas que reciban eventos durante la sincronización no están en la
+    # instantánea, pero no deben desactivarse
+    ultimo_evento = await db.scalar(select(func.coalesce(func.max(modelo.evento_id), 0)))
+    vistos: Set[int] = set()
+    total = 0
+    after = None
+    while True:
+        pagina = await _descargar_pagina(tipo, after)
+        if pagina is None:
+            return None
+        registros, after = pagina
+        if registros:
+            filas = [
+                {"id": registro["id"], **{campo: registro.get(campo) for campo in CAMPOS[tipo]}}
+                for registro in registros
+            ]
+            if tipo == "cliente":
+                for fila in filas:
+                    fila["activo"] = True
+            await db.execute(_upsert(dialecto, tipo, filas))
+            await db.commit()
+            vistos.update(fila["id"] for fila in filas)
+            total += len(filas)
+        if not after:
+            await _desactivar_ausentes(db, tipo, vistos, ultimo_evento)
+            return total
+
+
+async def _desactivar_ausentes(db: AsyncSession, tipo: str, vistos: Set[int], ultimo_evento: int) -> int:
+    """Marcar como inactivas las réplicas que no aparecieron en una sincronización completa"""
+    modelo = MODELOS[tipo]
+    activos = await db.scalars(
+        select(modelo.id).where(modelo.activo == true(), modelo.evento_id <= ultimo_evento)
+    )
+    ausentes = [replica_id for replica_id in activos if replica_id not in vistos]
+    for inicio in range(0, len(ausentes), MAX_IDS_LOTE):
+        await db.execute(
+            update(modelo)
+            .where(modelo.id.in_(ausentes[inicio:inicio + MAX_IDS_LOTE]), modelo.evento_id <= ultimo_evento)
+            .values(activo=False, actualizado_en=func.now())
+        )
+    await db.commit()
+
+    # Igual que un evento de baja: que el cache de existencia no los siga dando por válidos
+    for replica_id in ausentes:
+        if tipo == "cliente":
+            await cache_existencia.guardar(tipo, replica_id, False)
+        else:
+            await cache_existencia.invalidar(tipo, replica_id)
+    if ausentes and tipo == "barbero":
+        await invalidar_catalogo_barberos()
+    return len(ausentes)
+
+
+async def sincronizar_todo(sesiones: async_sessionmaker) -> Dict[str, Optional[int]]:
+    """Sincronizar las réplicas de clientes y barberos"""
+    async with sesiones() as db:
+        return {f"{tipo}s": await sincronizar(db, tipo) for tipo in MODELOS}
+
+
+def expandir_consulta(query: Select) -> Select:
+    """Añadir a una consulta de citas los datos replicados de su cliente y su barbero"""
+    return (
+        query.add_columns(ClienteReplica, BarberoReplica)
+        .outerjoin(ClienteReplica, ClienteReplica.id == Cita.cliente_id)
+        .outerjoin(BarberoReplica, BarberoReplica.id == Cita.barbero_id)
+    )
+
+
+def citas_expandidas(filas: Sequence[Any]) -> List[CitaExpandida]:
+    """Convertir filas (cita, cliente, barbero) en citas con sus datos embebidos"""
+    resultado = []
+    for cita, cliente, barbero in filas:
+        expandida = CitaExpandida.model_validate(cita)
+        expandida.cliente = ClienteResumen.model_validate(cliente) if cliente is not None else None
+        expandida.barbero = BarberoResumen.model_validate(barbero) if barbero is not None else None
+        resultado.append(expandida)
+    return resultado
@@ -1,14 +1,20 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date, time
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
+from .horarios import DURACION_MAXIMA_MINUTOS
+
 class EstadoCita(str, Enum):
     PENDIENTE = "pendiente"
     CONFIRMADA = "confirmada"
     COMPLETADA = "completada"
     CANCELADA = "cancelada"
 
+class TipoEntidad(str, Enum):
+    CLIENTE = "cliente"
+    BARBERO = "barbero"
+
 class CitaBase(BaseModel):
     cliente_id: int
     barbero_id: int
@@ -16,6 +22,8 @@ class CitaBase(BaseModel):
     hora: time
     servicio: str
     estado: EstadoCita = EstadoCita.PENDIENTE
+    # Si no se indica, se usa la duración por defecto del servicio
+    duracion_minutos: Optional[int] = Field(None, gt=0, le=DURACION_MAXIMA_MINUTOS)
 
 class CitaCreate(CitaBase):
     pass
@@ -27,6 +35,7 @@ class CitaUpdate(BaseModel):
     hora: Optional[time] = None
     servicio: Optional[str] = None
     estado: Optional[EstadoCita] = None
+    duracion_minutos: Optional[int] = Field(None, gt=0, le=DURACION_MAXIMA_MINUTOS)
 
 class CitaResponse(CitaBase):
     id: int
@@ -34,3 +43,70 @@ class CitaResponse(CitaBase):
     class Config:
         from_attributes = True
 
+
+class ResultadoCitaLote(BaseModel):
+    indice: int
+    creada: bool
+    cita: Optional[CitaResponse] = None
+    detalle: Optional[str] = None
+
+class CitaLoteResponse(BaseModel):
+    creadas: int
+    rechazadas: int
+    resultados: List[ResultadoCitaLote]
+
+
+class IntervaloLibre(BaseModel):
+    desde: str
+    hasta: str
+
+class DisponibilidadBarbero(BaseModel):
+    barbero_id: int
+    nombre: Optional[str] = None
+    especialidad: Optional[str] = None
+    libre: List[IntervaloLibre]
+
+
+class EventoEntrante(BaseModel):
+    id: int
+    tipo: str
+    entidad_id: int
+    datos: Optional[dict] = None
+    creado_en: Optional[str] = None
+
+class LoteEventos(BaseModel):
+    origen: str
+    eventos: List[EventoEntrante]
+
+class ResultadoEventos(BaseModel):
+    procesados: int
+    ignorados: int
+
+
+class ClienteResumen(BaseModel):
+    id: int
+    nombre: str
+    telefono: Optional[str] = None
+    activo: bool
+
+    class Config:
+        from_attributes = True
+
+class BarberoResumen(BaseModel):
+    id: int
+    nombre: str
+    especialidad: Optional[str] = None
+    telefono: Optional[str] = None
+    activo: bool
+
+    class Config:
+        from_attributes = True
+
+class CitaExpandida(CitaResponse):
+    # Solo presentes con expandir=true; None si el cliente o barbero aún no está replicado
+    cliente: Optional[ClienteResumen] = None
+    barbero: Optional[BarberoResumen] = None
+
+class ResultadoSincronizacion(BaseModel):
+    clientes: Optional[int] = None
+    barberos: Optional[int] = None
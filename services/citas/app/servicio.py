@@ -0,0 +1,10 @@
+"""Datos propios de este servicio que usan los módulos compartidos (ver compartido/)"""
+
+NOMBRE = "citas"
+
+# Bases creadas antes de las migraciones (con Base.metadata.create_all) ya
+# tienen estas tablas: se marcan con la revisión inicial en lugar de recrearlas
+TABLAS_INICIALES = ("citas",)
+
+# Clave del advisory lock de Postgres para que solo un proceso migre a la vez
+CLAVE_BLOQUEO_MIGRACIONES = 8003
@@ -0,0 +1,76 @@
+import asyncio
+import os
+from typing import Awaitable, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+from .circuit_breaker import fail_closed
+
+# Plazo compartido (en segundos) para todas las verificaciones remotas de una petición
+VALIDACION_DEADLINE = float(os.getenv("VALIDACION_DEADLINE", 6.0))
+
+
+async def validar_en_paralelo(
+    validaciones: List[Tuple[Awaitable[bool], str]],
+    deadline: float = VALIDACION_DEADLINE
+) -> None:
+    """Ejecutar verificaciones remotas de forma concurrente.
+
+    Cada validación es una corrutina que devuelve ``True`` si la entidad existe
+    y el mensaje de error a usar si no existe. En cuanto una falla se cancelan
+    las demás y se responde 400. Si vence el plazo compartido, las pendientes se
+    cancelan y se tratan como servicio no disponible según el modo de fallo
+    configurado (fail-open: se permite la operación; fail-closed: 503).
+    """
+    tareas = {asyncio.ensure_future(coro): mensaje for coro, mensaje in validaciones}
+    pendientes = set(tareas)
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + deadline
+    try:
+        while pendientes:
+            restante = limite - loop.time()
+            if restante <= 0:
+                if fail_closed():
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Los servicios dependientes no respondieron a tiempo"
+                    )
+                break
+            hechas, pendientes = await asyncio.wait(
+                pendientes, timeout=restante, return_when=asyncio.FIRST_COMPLETED
+            )
+            for tarea in hechas:
+                if not tarea.result():
+                    raise HTTPException(status_code=400, detail=tareas[tarea])
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+        if pendientes:
+            await asyncio.gather(*pendientes, return_exceptions=True)
+
+
+async def consultar_en_paralelo(
+    *consultas: Awaitable[Dict[int, bool]],
+    deadline: float = VALIDACION_DEADLINE
+) -> List[Dict[int, bool]]:
+    """Ejecutar verificaciones en lote de forma concurrente con el plazo compartido.
+
+    Si vence el plazo se aplica el modo de fallo: con fail-open se devuelven
+    resultados vacíos (las entidades sin respuesta se dan por existentes).
+    """
+    tareas = [asyncio.ensure_future(consulta) for consulta in consultas]
+    try:
+        return list(await asyncio.wait_for(asyncio.gather(*tareas), deadline))
+    except asyncio.TimeoutError:
+        if fail_closed():
+            raise HTTPException(
+                status_code=503,
+                detail="Los servicios dependientes no respondieron a tiempo"
+            )
+        return [{} for _ in tareas]
+    finally:
+        pendientes = [tarea for tarea in tareas if not tarea.done()]
+        for tarea in pendientes:
+            tarea.cancel()
+        if pendientes:
+            await asyncio.gather(*pendientes, return_exceptions=True)
@@ -0,0 +1,69 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.database import Base, DATABASE_URL
+from app import models  # noqa: F401  (registra los modelos en Base.metadata)
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configurar_logging", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+VERSION_TABLE = config.get_main_option("version_table", "alembic_version")
+
+
+def incluir_nombre(nombre, tipo, padre) -> bool:
+    """Ignorar tablas de otros servicios cuando comparten la misma base de datos"""
+    return tipo != "table" or nombre in target_metadata.tables
+
+
+def obtener_url() -> str:
+    """URL de la base de datos (la de la aplicación salvo que se indique otra)"""
+    return config.attributes.get("url") or DATABASE_URL
+
+
+def run_migrations_offline() -> None:
+    """Generar el SQL de las migraciones sin conectarse a la base de datos"""
+    context.configure(
+        url=obtener_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        version_table=VERSION_TABLE,
+        include_name=incluir_nombre,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Aplicar las migraciones sobre una conexión a la base de datos"""
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _ejecutar(connection)
+        return
+
+    connectable = create_engine(obtener_url(), poolclass=pool.NullPool)
+    with connectable.connect() as connection:
+        _ejecutar(connection)
+
+
+def _ejecutar(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        version_table=VERSION_TABLE,
+        include_name=incluir_nombre,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,34 @@
+"""Esquema inicial de citas
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-20 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "citas",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("cliente_id", sa.Integer(), nullable=False),
+        sa.Column("barbero_id", sa.Integer(), nullable=False),
+        sa.Column("fecha", sa.Date(), nullable=False),
+        sa.Column("hora", sa.Time(), nullable=False),
+        sa.Column("servicio", sa.String(), nullable=False),
+        sa.Column("estado", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_citas_id", "citas", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_citas_id", table_name="citas")
+    op.drop_table("citas")
@@ -0,0 +1,35 @@
+"""Índices de agenda y horario único para citas activas
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-11-24 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+FILTRO_ACTIVAS = sa.text("estado IN ('pendiente', 'confirmada')")
+
+
+def upgrade() -> None:
+    op.create_index("ix_citas_barbero_fecha_hora", "citas", ["barbero_id", "fecha", "hora"])
+    op.create_index("ix_citas_cliente_fecha", "citas", ["cliente_id", "fecha"])
+    op.create_index(
+        "uq_citas_barbero_horario_activo",
+        "citas",
+        ["barbero_id", "fecha", "hora"],
+        unique=True,
+        postgresql_where=FILTRO_ACTIVAS,
+        sqlite_where=FILTRO_ACTIVAS,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_citas_barbero_horario_activo", table_name="citas")
+    op.drop_index("ix_citas_cliente_fecha", table_name="citas")
+    op.drop_index("ix_citas_barbero_fecha_hora", table_name="citas")
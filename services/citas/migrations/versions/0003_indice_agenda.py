@@ -0,0 +1,21 @@
+"""Índice para ordenar y paginar la agenda por (fecha, hora, id)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-11-27 00:00:00
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_citas_fecha_hora_id", "citas", ["fecha", "hora", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_citas_fecha_hora_id", table_name="citas")
@@ -0,0 +1,94 @@
+"""Duración de las citas y exclusión de solapamientos en PostgreSQL
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-12-01 00:00:00
+"""
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+_citas = sa.table(
+    "citas",
+    sa.column("id", sa.Integer),
+    sa.column("barbero_id", sa.Integer),
+    sa.column("fecha", sa.Date),
+    sa.column("hora", sa.Time),
+    sa.column("duracion_minutos", sa.Integer),
+    sa.column("estado", sa.String),
+)
+
+
+def citas_solapadas(conexion) -> List[Tuple[int, int]]:
+    """Pares de IDs de citas activas del mismo barbero cuyos intervalos se solapan.
+
+    Antes de esta revisión solo se impedían horas de inicio idénticas, así que
+    una base en uso puede tener, p. ej., citas a las 10:00 y a las 10:15.
+    """
+    filas = conexion.execute(
+        sa.select(_citas.c.id, _citas.c.barbero_id, _citas.c.fecha, _citas.c.hora, _citas.c.duracion_minutos)
+        .where(_citas.c.estado.in_(("pendiente", "confirmada")))
+        .order_by(_citas.c.barbero_id, _citas.c.fecha, _citas.c.hora, _citas.c.id)
+    )
+    pares = []
+    barbero_actual = None
+    # Cita activa del barbero que termina más tarde entre las ya recorridas
+    ultima_id, ultimo_fin = None, None
+    for cita_id, barbero_id, fecha, hora, duracion in filas:
+        inicio = datetime.combine(fecha, hora)
+        fin = inicio + timedelta(minutes=duracion)
+        if barbero_id != barbero_actual:
+            barbero_actual, ultima_id, ultimo_fin = barbero_id, None, None
+        if ultimo_fin is not None and inicio < ultimo_fin:
+            pares.append((ultima_id, cita_id))
+        if ultimo_fin is None or fin > ultimo_fin:
+            ultima_id, ultimo_fin = cita_id, fin
+    return pares
+
+
+def verificar_sin_solapamientos(conexion) -> None:
+    """Detener la migración si hay citas activas solapadas, indicando cuáles"""
+    pares = citas_solapadas(conexion)
+    if pares:
+        detalle = ", ".join(f"{a}-{b}" for a, b in pares)
+        raise RuntimeError(
+            "No se puede crear ex_citas_barbero_solapamiento: hay citas activas solapadas "
+            f"(pares de IDs: {detalle}). Cancele o reprograme una cita de cada par y vuelva a migrar."
+        )
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("citas") as batch_op:
+        batch_op.add_column(
+            sa.Column("duracion_minutos", sa.Integer(), nullable=False, server_default=sa.text("30"))
+        )
+
+    if op.get_bind().dialect.name == "postgresql":
+        # Dos citas activas del mismo barbero no pueden solapar sus intervalos;
+        # con datos previos solapados el ALTER TABLE fallaría sin decir qué filas
+        verificar_sin_solapamientos(op.get_bind())
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(
+            """
+            ALTER TABLE citas ADD CONSTRAINT ex_citas_barbero_solapamiento
+            EXCLUDE USING gist (
+                barbero_id WITH =,
+                tsrange(fecha + hora, fecha + hora + duracion_minutos * interval '1 minute') WITH &&
+            ) WHERE (estado IN ('pendiente', 'confirmada'))
+            """
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE citas DROP CONSTRAINT IF EXISTS ex_citas_barbero_solapamiento")
+    with op.batch_alter_table("citas") as batch_op:
+        batch_op.drop_column("duracion_minutos")
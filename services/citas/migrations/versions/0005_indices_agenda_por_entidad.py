@@ -0,0 +1,27 @@
+"""Índices de agenda por barbero y por cliente con el orden completo (fecha, hora, id)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-12-03 00:00:00
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_citas_barbero_agenda", "citas", ["barbero_id", "fecha", "hora", "id"])
+    op.create_index("ix_citas_cliente_agenda", "citas", ["cliente_id", "fecha", "hora", "id"])
+    op.drop_index("ix_citas_barbero_fecha_hora", table_name="citas")
+    op.drop_index("ix_citas_cliente_fecha", table_name="citas")
+
+
+def downgrade() -> None:
+    op.create_index("ix_citas_cliente_fecha", "citas", ["cliente_id", "fecha"])
+    op.create_index("ix_citas_barbero_fecha_hora", "citas", ["barbero_id", "fecha", "hora"])
+    op.drop_index("ix_citas_cliente_agenda", table_name="citas")
+    op.drop_index("ix_citas_barbero_agenda", table_name="citas")
@@ -0,0 +1,47 @@
+"""Réplicas locales de clientes y barberos para expandir los listados de citas
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-12-06 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def _columnas_comunes():
+    return [
+        sa.Column("activo", sa.Boolean(), server_default=sa.true(), nullable=False),
+        sa.Column("evento_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("actualizado_en", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "citas_clientes_replica",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("nombre", sa.String(), nullable=False),
+        sa.Column("telefono", sa.String(), nullable=True),
+        *_columnas_comunes(),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "citas_barberos_replica",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("nombre", sa.String(), nullable=False),
+        sa.Column("especialidad", sa.String(), nullable=True),
+        sa.Column("telefono", sa.String(), nullable=True),
+        *_columnas_comunes(),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("citas_barberos_replica")
+    op.drop_table("citas_clientes_replica")
@@ -1,46 +1,55 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 from datetime import date, time
 from unittest.mock import patch, AsyncMock
 
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_db, get_sesiones
 from app.models import Cita
 
 # Configurar base de datos de prueba en memoria
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+async def _crear_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.create_all)
+
+async def _eliminar_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.drop_all)
+
+# Secreto de POST /eventos en las pruebas
+TOKEN_EVENTOS = "secreto-de-prueba"
+CABECERA_EVENTOS = {"X-Eventos-Token": TOKEN_EVENTOS}
 
 @pytest.fixture
 def db_session():
-    """Crear una sesión de base de datos de prueba"""
-    Base.metadata.create_all(bind=engine)
-    session = TestingSessionLocal()
+    """Crear las tablas de prueba y devolver la fábrica de sesiones"""
+    asyncio.run(_crear_tablas())
     try:
-        yield session
+        yield TestingSessionLocal
     finally:
-        session.close()
-        Base.metadata.drop_all(bind=engine)
+        asyncio.run(_eliminar_tablas())
 
 @pytest.fixture
 def client(db_session):
     """Cliente de prueba para FastAPI"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    async def override_get_db():
+        async with db_session() as session:
+            yield session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_sesiones] = lambda: db_session
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -49,7 +58,11 @@ def test_health_check(client):
     """Probar el endpoint de health check"""
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy", "service": "citas"}
+    data = response.json()
+    assert data["status"] == "healthy"
+    assert data["service"] == "citas"
+    assert data["dependencias"]["clientes"]["estado"] == "cerrado"
+    assert data["dependencias"]["barberos"]["estado"] == "cerrado"
 
 @patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
 @patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
@@ -210,6 +223,50 @@ def test_actualizar_cita(mock_barbero, mock_cliente, client):
     data = response.json()
     assert data["estado"] == "confirmada"
 
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_actualizar_cita_no_existente(mock_barbero, mock_cliente, client):
+    """Probar que una cita inexistente responde 404 aunque clientes o barberos tampoco existan"""
+    from app import main
+
+    mock_cliente.return_value = False
+    mock_barbero.return_value = False
+
+    for cambios in ({"cliente_id": 999}, {"cliente_id": 999, "barbero_id": 999, "hora": "15:00:00"}):
+        response = client.put("/citas/999", json=cambios)
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Cita no encontrada"
+
+    # Con la cita existente, un cliente inválido se rechaza sin llegar a emitir el UPDATE
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    cita = client.post("/citas/", json={
+        "cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "14:00:00", "servicio": "Corte"
+    }).json()
+    orden = []
+    actualizar_fila = main.actualizar_fila
+
+    async def validar_cliente(cliente_id):
+        orden.append("validacion")
+        return cliente_id != 999
+
+    async def actualizar(*args):
+        orden.append("update")
+        return await actualizar_fila(*args)
+
+    mock_cliente.side_effect = validar_cliente
+    with patch("app.main.actualizar_fila", side_effect=actualizar):
+        response = client.put(f"/citas/{cita['id']}", json={"cliente_id": 999})
+        assert response.status_code == 400
+        assert orden == ["validacion"]
+        assert client.get(f"/citas/{cita['id']}").json()["cliente_id"] == 1
+
+        # Si las validaciones pasan, el UPDATE ... RETURNING se emite después
+        response = client.put(f"/citas/{cita['id']}", json={"cliente_id": 2})
+        assert response.status_code == 200
+        assert orden == ["validacion", "validacion", "update"]
+    assert response.json()["cliente_id"] == 2
+
 @patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
 @patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
 def test_eliminar_cita(mock_barbero, mock_cliente, client):
@@ -235,3 +292,938 @@ def test_eliminar_cita(mock_barbero, mock_cliente, client):
     assert get_response.status_code == 200
     assert get_response.json()["estado"] == "cancelada"
 
+
+def test_cliente_http_compartido(client):
+    """Probar que el pool HTTP se reutiliza entre verificaciones"""
+    from app.http_client import obtener_cliente_http
+
+    primero = obtener_cliente_http()
+    segundo = obtener_cliente_http()
+    assert primero is segundo
+    assert not primero.is_closed
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_crear_cita_validaciones_en_paralelo(mock_barbero, mock_cliente, client):
+    """Probar que un barbero inexistente cancela la verificación lenta del cliente"""
+    import asyncio
+    import time
+
+    cancelada = []
+
+    async def cliente_lento(cliente_id):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelada.append(cliente_id)
+            raise
+        return True
+
+    mock_cliente.side_effect = cliente_lento
+    mock_barbero.return_value = False
+
+    cita_data = {
+        "cliente_id": 1,
+        "barbero_id": 99,
+        "fecha": "2025-12-10",
+        "hora": "14:00:00",
+        "servicio": "Corte de cabello"
+    }
+    inicio = time.monotonic()
+    response = client.post("/citas/", json=cita_data)
+    assert response.status_code == 400
+    assert "barbero especificado no existe" in response.json()["detail"]
+    assert time.monotonic() - inicio < 2
+    assert cancelada == [1]
+
+def test_cache_existencia_ttl_y_lru():
+    """Probar expiración, límite LRU y contadores del cache de existencia"""
+    from app.cache import CacheExistencia
+
+    async def escenario():
+        cache = CacheExistencia(ttl_positivo=60, ttl_negativo=0, max_entradas=2)
+        await cache.guardar("cliente", 1, True)
+        await cache.guardar("cliente", 2, True)
+        await cache.guardar("barbero", 9, False)  # TTL negativo 0: no se guarda
+        assert await cache.obtener("cliente", 1) is True
+        await cache.guardar("cliente", 3, True)  # expulsa al menos usado (cliente 2)
+        assert await cache.obtener("cliente", 2) is None
+        assert await cache.obtener("barbero", 9) is None
+        assert cache.estadisticas() == {"entradas": 2, "hits": 1, "misses": 2}
+
+    asyncio.run(escenario())
+
+def test_verificacion_usa_cache_e_invalida(client):
+    """Probar que una segunda verificación no llama al servicio y que se puede invalidar"""
+    import asyncio
+    import httpx
+    from app import main
+    from app.cache import cache_existencia
+    from app.http_client import obtener_cliente_http
+
+    cache_existencia.limpiar()
+    llamadas = []
+
+    async def fake_request(metodo, url, **kwargs):
+        llamadas.append(url)
+        return httpx.Response(200)
+
+    with patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        assert asyncio.run(main.verificar_cliente_existe(7)) is True
+        assert asyncio.run(main.verificar_cliente_existe(7)) is True
+        assert len(llamadas) == 1
+
+        with patch("app.main.EVENTOS_TOKEN", TOKEN_EVENTOS):
+            response = client.delete("/cache/cliente/7", headers=CABECERA_EVENTOS)
+        assert response.status_code == 204
+        assert asyncio.run(main.verificar_cliente_existe(7)) is True
+        assert len(llamadas) == 2
+
+    assert client.get("/cache/estadisticas").json()["hits"] == 1
+    cache_existencia.limpiar()
+
+def test_circuit_breaker_abre_y_se_recupera():
+    """Probar las transiciones cerrado -> abierto -> semiabierto -> cerrado"""
+    from app.circuit_breaker import CircuitBreaker, EstadoCircuito
+
+    breaker = CircuitBreaker("prueba", umbral_fallos=2, tiempo_recuperacion=0.05, max_pruebas=1)
+    breaker.registrar_fallo()
+    assert breaker.estado == EstadoCircuito.CERRADO
+    breaker.registrar_fallo()
+    assert breaker.estado == EstadoCircuito.ABIERTO
+    assert breaker.permitir() is False
+
+    import time
+    time.sleep(0.06)
+    assert breaker.permitir() is True
+    assert breaker.permitir() is False  # solo una prueba en semiabierto
+    breaker.registrar_exito()
+    assert breaker.estado == EstadoCircuito.CERRADO
+
+def test_dependencia_caida_fail_closed(client):
+    """Probar que con el circuito abierto y fail-closed se responde 503 sin llamar al servicio"""
+    from app import circuit_breaker
+    from app.cache import cache_existencia
+    from app.circuit_breaker import breakers
+
+    cache_existencia.limpiar()
+    breaker = breakers["cliente"]
+    for _ in range(breaker.umbral_fallos):
+        breaker.registrar_fallo()
+
+    cita_data = {
+        "cliente_id": 1,
+        "barbero_id": 1,
+        "fecha": "2025-12-10",
+        "hora": "14:00:00",
+        "servicio": "Corte de cabello"
+    }
+    try:
+        with patch.object(circuit_breaker, "DEPENDENCIAS_FAIL_MODE", "closed"), \
+                patch('app.main.verificar_barbero_existe', new_callable=AsyncMock) as mock_barbero:
+            mock_barbero.return_value = True
+            response = client.post("/citas/", json=cita_data)
+        assert response.status_code == 503
+        assert client.get("/health").json()["dependencias"]["clientes"]["estado"] == "abierto"
+    finally:
+        breaker.reiniciar()
+
+def test_verificar_clientes_en_lote(client):
+    """Probar que la verificación en lote usa una sola llamada /exists y el cache"""
+    import asyncio
+    import httpx
+    from app import main
+    from app.cache import cache_existencia
+    from app.http_client import obtener_cliente_http
+
+    cache_existencia.limpiar()
+    asyncio.run(cache_existencia.guardar("cliente", 1, True))
+    llamadas = []
+
+    async def fake_request(metodo, url, **kwargs):
+        llamadas.append((metodo, url, kwargs["json"]))
+        return httpx.Response(200, json={"existentes": [2], "faltantes": [3]})
+
+    with patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        resultado = asyncio.run(main.verificar_clientes_existen([1, 2, 3, 2]))
+
+    assert resultado == {1: True, 2: True, 3: False}
+    assert len(llamadas) == 1
+    assert llamadas[0][1].endswith("/clientes/exists")
+    assert llamadas[0][2] == {"ids": [2, 3]}
+    cache_existencia.limpiar()
+
+def test_verificar_en_lote_con_redis_usa_pocos_viajes():
+    """Probar que la verificación en lote lee y escribe el cache compartido con MGET y pipeline, no por ID"""
+    import httpx
+    from app import dependencias
+    from app.cache import CacheExistencia
+    from app.cache_compartido import BackendRedis, CacheCompartido
+    from app.http_client import obtener_cliente_http
+
+    redis = RedisFalso()
+    cache = CacheExistencia(cache=CacheCompartido(BackendRedis(redis), prefijo="prueba"))
+    ids = list(range(1, 1001))
+
+    async def fake_request(metodo, url, **kwargs):
+        pedidos = kwargs["json"]["ids"]
+        return httpx.Response(200, json={"existentes": [i for i in pedidos if i % 2], "faltantes": []})
+
+    with patch.object(dependencias, "cache_existencia", cache), \
+            patch.object(obtener_cliente_http(), "request", side_effect=fake_request) as request:
+        resultado = asyncio.run(dependencias.verificar_entidades("cliente", ids))
+        # Versión del espacio (creación incluida), MGET, versión y pipeline
+        assert redis.viajes <= 6
+        assert resultado == {i: bool(i % 2) for i in ids}
+
+        viajes = redis.viajes
+        assert asyncio.run(dependencias.verificar_entidades("cliente", ids)) == resultado
+        assert request.call_count == 1
+        assert redis.viajes - viajes == 2
+    assert (cache.hits, cache.misses) == (1000, 1000)
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_horario_unico_solo_para_citas_activas(mock_barbero, mock_cliente, client):
+    """Probar que el índice único permite reutilizar el horario de una cita cancelada"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+
+    cita_data = {
+        "cliente_id": 1,
+        "barbero_id": 1,
+        "fecha": "2025-12-10",
+        "hora": "14:00:00",
+        "servicio": "Corte de cabello"
+    }
+    primera = client.post("/citas/", json=cita_data).json()
+    client.delete(f"/citas/{primera['id']}")
+
+    segunda = client.post("/citas/", json=cita_data)
+    assert segunda.status_code == 201
+
+    # Reactivar la cita cancelada chocaría con la nueva
+    response = client.put(f"/citas/{primera['id']}", json={"estado": "pendiente"})
+    assert response.status_code == 400
+    assert "ya tiene una cita en ese horario" in response.json()["detail"]
+
+    # Mover la segunda a otro horario libera el original
+    otra = client.put(f"/citas/{segunda.json()['id']}", json={"hora": "15:00:00"})
+    assert otra.status_code == 200
+    assert client.put(f"/citas/{primera['id']}", json={"estado": "pendiente"}).status_code == 200
+
+def test_migraciones_coinciden_con_modelos(tmp_path):
+    """Probar que las migraciones crean el mismo esquema que los modelos"""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from app.migrate import migrar
+
+    url = f"sqlite:///{tmp_path / 'migrado.db'}"
+    migrar(url)
+    migrar(url)  # idempotente
+
+    def solo_tablas_del_servicio(nombre, tipo, padre):
+        return tipo != "table" or nombre in Base.metadata.tables
+
+    motor = create_engine(url)
+    with motor.connect() as conexion:
+        contexto = MigrationContext.configure(conexion, opts={"include_name": solo_tablas_del_servicio})
+        diferencias = compare_metadata(contexto, Base.metadata)
+    motor.dispose()
+    assert diferencias == []
+
+def test_migraciones_adoptan_base_existente(tmp_path):
+    """Probar que una base creada antes de las migraciones se marca y actualiza sin recrear tablas"""
+    from sqlalchemy import inspect, text
+    from app.migrate import migrar, REVISION_INICIAL, configuracion_alembic
+
+    url = f"sqlite:///{tmp_path / 'existente.db'}"
+    version_table = configuracion_alembic().get_main_option("version_table")
+
+    # Simular una base creada con create_all: esquema inicial sin tabla de versiones
+    migrar(url, revision=REVISION_INICIAL)
+    motor = create_engine(url)
+    with motor.begin() as conexion:
+        conexion.execute(text(f"DROP TABLE {version_table}"))
+
+    migrar(url)
+    with motor.connect() as conexion:
+        assert version_table in inspect(conexion).get_table_names()
+        assert conexion.execute(text(f"SELECT version_num FROM {version_table}")).scalar() is not None
+    motor.dispose()
+
+def test_migracion_solapamientos_detecta_citas_existentes(tmp_path):
+    """Probar que la revisión 0004 lista las citas activas solapadas antes de crear la exclusión"""
+    from alembic.script import ScriptDirectory
+    from sqlalchemy import text
+    from app.migrate import migrar, configuracion_alembic
+
+    url = f"sqlite:///{tmp_path / 'solapadas.db'}"
+    migrar(url)
+    motor = create_engine(url)
+    with motor.begin() as conexion:
+        conexion.execute(text(
+            "INSERT INTO citas (id, cliente_id, barbero_id, fecha, hora, servicio, duracion_minutos, estado) VALUES "
+            "(1, 1, 1, '2025-12-10', '10:00:00.000000', 'Corte', 30, 'pendiente'),"
+            "(2, 1, 1, '2025-12-10', '10:15:00.000000', 'Corte', 30, 'confirmada'),"
+            "(3, 1, 1, '2025-12-10', '10:30:00.000000', 'Corte', 30, 'pendiente'),"
+            "(4, 1, 1, '2025-12-10', '10:40:00.000000', 'Corte', 30, 'cancelada'),"
+            "(5, 1, 2, '2025-12-10', '10:15:00.000000', 'Corte', 30, 'pendiente')"
+        ))
+
+    revision = ScriptDirectory.from_config(configuracion_alembic()).get_revision("0004").module
+    with motor.connect() as conexion:
+        assert revision.citas_solapadas(conexion) == [(1, 2), (2, 3)]
+        with pytest.raises(RuntimeError, match="1-2, 2-3"):
+            revision.verificar_sin_solapamientos(conexion)
+        conexion.execute(text("UPDATE citas SET estado = 'cancelada' WHERE id = 2"))
+        revision.verificar_sin_solapamientos(conexion)
+    motor.dispose()
+
+def test_estado_pool(client):
+    """Probar el endpoint con las estadísticas del pool de conexiones"""
+    response = client.get("/health/pool")
+    assert response.status_code == 200
+    assert "clase" in response.json()
+
+def test_opciones_engine_postgres():
+    """Probar que la configuración del pool se aplica a Postgres y no a SQLite"""
+    from app import database
+
+    with patch.object(database, "DB_POOL_SIZE", 20), patch.object(database, "DB_STATEMENT_TIMEOUT_MS", 5000):
+        opciones = database.opciones_engine("postgresql+asyncpg://u:p@db/barberia")
+    assert opciones["pool_size"] == 20
+    assert opciones["pool_pre_ping"] is True
+    assert opciones["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert "pool_size" not in database.opciones_engine("sqlite+aiosqlite:///./local.db")
+    assert database.url_async("postgresql://u:p@db/barberia") == "postgresql+asyncpg://u:p@db/barberia"
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_listar_citas_con_cursor(mock_barbero, mock_cliente, client):
+    """Probar que el cursor recorre la agenda en orden (fecha, hora, id)"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+
+    horarios = [("2025-12-11", "09:00:00"), ("2025-12-10", "15:00:00"), ("2025-12-10", "14:00:00")]
+    for fecha, hora in horarios:
+        client.post("/citas/", json={
+            "cliente_id": 1, "barbero_id": 1, "fecha": fecha, "hora": hora, "servicio": "Corte"
+        })
+
+    primera = client.get("/citas/?limit=2")
+    assert [(c["fecha"], c["hora"]) for c in primera.json()] == sorted(horarios)[:2]
+
+    segunda = client.get(f"/citas/?limit=2&after={primera.headers['X-Next-Cursor']}")
+    assert [(c["fecha"], c["hora"]) for c in segunda.json()] == sorted(horarios)[2:]
+    assert "X-Next-Cursor" not in segunda.headers
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_exportar_citas_con_filtros(mock_barbero, mock_cliente, client):
+    """Probar la exportación de citas filtrada por rango de fechas y barbero"""
+    import csv
+    import io
+
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+
+    citas = [
+        {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-09", "hora": "10:00:00", "servicio": "Corte"},
+        {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"},
+        {"cliente_id": 2, "barbero_id": 2, "fecha": "2025-12-10", "hora": "11:00:00", "servicio": "Barba"},
+    ]
+    for cita in citas:
+        client.post("/citas/", json=cita)
+
+    response = client.get("/citas/export?formato=csv&desde=2025-12-10&barbero_id=1")
+    assert response.status_code == 200
+    filas = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(filas) == 1
+    assert filas[0]["fecha"] == "2025-12-10"
+    assert filas[0]["barbero_id"] == "1"
+
+@patch('app.main.verificar_clientes_existen', new_callable=AsyncMock)
+@patch('app.main.verificar_barberos_existen', new_callable=AsyncMock)
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_crear_citas_en_lote(mock_barbero, mock_cliente, mock_barberos, mock_clientes, client):
+    """Probar la carga masiva con conflictos contra la base de datos y dentro del lote"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    mock_clientes.return_value = {1: True, 2: True, 3: False}
+    mock_barberos.return_value = {1: True, 2: True}
+
+    client.post("/citas/", json={
+        "cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "09:00:00", "servicio": "Corte"
+    })
+
+    lote = [
+        {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"},
+        {"cliente_id": 2, "barbero_id": 1, "fecha": "2025-12-10", "hora": "09:00:00", "servicio": "Corte"},
+        {"cliente_id": 2, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Barba"},
+        {"cliente_id": 3, "barbero_id": 2, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Barba"},
+        {"cliente_id": 2, "barbero_id": 2, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Barba"},
+    ]
+    from app.disponibilidad import espacio_dia, indice_disponibilidad
+
+    invalidar = AsyncMock(side_effect=indice_disponibilidad.cache.invalidar)
+    with patch.object(indice_disponibilidad.cache, "invalidar", invalidar):
+        response = client.post("/citas/bulk", json=lote)
+    assert response.status_code == 200
+    # Las dos citas creadas son del mismo día: una sola invalidación del cache compartido
+    assert [llamada.args for llamada in invalidar.await_args_list] == [(espacio_dia(date(2025, 12, 10)),)]
+    data = response.json()
+    assert data["creadas"] == 2
+    assert data["rechazadas"] == 3
+
+    resultados = data["resultados"]
+    assert [r["creada"] for r in resultados] == [True, False, False, False, True]
+    assert resultados[0]["cita"]["hora"] == "10:00:00"
+    assert "ya tiene una cita en ese horario" in resultados[1]["detalle"]
+    assert "conflicto con la cita 0 del lote" in resultados[2]["detalle"]
+    assert "cliente especificado no existe" in resultados[3]["detalle"]
+    assert mock_clientes.await_args.args[0] == [1, 2, 2, 3, 2]
+
+    assert len(client.get("/citas/").json()) == 3
+
+@patch('app.main.verificar_clientes_existen', new_callable=AsyncMock)
+@patch('app.main.verificar_barberos_existen', new_callable=AsyncMock)
+def test_lote_reintenta_cita_a_cita_si_otra_peticion_ocupa_el_horario(mock_barberos, mock_clientes, client):
+    """Probar que una cita guardada entre la comprobación y el INSERT solo rechaza las citas afectadas"""
+    from sqlalchemy.exc import IntegrityError
+    from app.horarios import AgendaBarberos
+
+    mock_clientes.return_value = {1: True}
+    mock_barberos.return_value = {1: True}
+    cargar_original = AgendaBarberos.cargar
+
+    async def cargar_y_ocupar(self, db, pares):
+        pares = list(pares)
+        await cargar_original(self, db, pares)
+        # Otra petición confirma una cita a las 10:00 después de la comprobación
+        barbero_id, fecha = pares[0]
+        db.add(Cita(cliente_id=9, barbero_id=barbero_id, fecha=fecha, hora=time(10, 0), servicio="Corte"))
+        await db.commit()
+
+    lote = [
+        {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"},
+        {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "11:00:00", "servicio": "Corte"},
+    ]
+    with patch.object(AgendaBarberos, "cargar", cargar_y_ocupar):
+        data = client.post("/citas/bulk", json=lote).json()
+    assert [r["creada"] for r in data["resultados"]] == [False, True]
+    assert data["resultados"][0]["detalle"] == "El barbero ya tiene una cita en ese horario"
+    assert sorted(c["cliente_id"] for c in client.get("/citas/").json()) == [1, 9]
+
+    # Otras violaciones de integridad no se confunden con un horario ocupado
+    with patch.object(AgendaBarberos, "cargar", cargar_y_ocupar), \
+            patch("app.lote.es_conflicto_horario", return_value=False):
+        with pytest.raises(IntegrityError):
+            client.post("/citas/bulk", json=[{**lote[0], "fecha": "2025-12-11"}])
+
+def test_intervalos_libres_por_bloques():
+    """Probar el cálculo de huecos a partir del mapa de bloques ocupados"""
+    from app.disponibilidad import intervalos_libres, mascara, slots_consulta
+
+    # Con bloques de 15 minutos, una cita de 30 a las 10:00 ocupa 10:00-10:30
+    ocupado = mascara(time(10, 0), 30) | mascara(time(11, 0), 30)
+    inicio, fin = slots_consulta(time(9, 0), time(12, 0))
+    assert intervalos_libres(ocupado, inicio, fin) == [(36, 40), (42, 44), (46, 48)]
+    # Un hueco de 30 minutos entre 10:30 y 11:00 cabe; uno de 45 no
+    assert intervalos_libres(ocupado, 42, 44, minimo=2) == [(42, 44)]
+    assert intervalos_libres(ocupado, 42, 44, minimo=3) == []
+
+@patch('app.main.listar_barberos_activos', new_callable=AsyncMock)
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_buscar_disponibilidad(mock_barbero, mock_cliente, mock_catalogo, client):
+    """Probar la búsqueda de barberos libres y su actualización al crear y cancelar"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    mock_catalogo.return_value = [
+        {"id": 1, "nombre": "Carlos", "especialidad": "Cortes"},
+        {"id": 2, "nombre": "Ana", "especialidad": "Barba"},
+    ]
+    consulta = {"fecha": "2025-12-10", "desde": "10:00", "hasta": "11:00"}
+
+    response = client.get("/disponibilidad", params=consulta)
+    assert response.status_code == 200
+    assert [b["barbero_id"] for b in response.json()] == [1, 2]
+
+    # Una cita ya indexada se refleja en la siguiente consulta sin recargar el día
+    cita = client.post("/citas/", json={
+        "cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10",
+        "hora": "10:00:00", "servicio": "Corte"
+    }).json()
+    client.post("/citas/", json={
+        "cliente_id": 2, "barbero_id": 2, "fecha": "2025-12-10",
+        "hora": "10:15:00", "servicio": "Barba", "duracion_minutos": 30
+    })
+    response = client.get("/disponibilidad", params={**consulta, "duracion": 15})
+    data = {b["barbero_id"]: b["libre"] for b in response.json()}
+    assert data[1] == [{"desde": "10:30", "hasta": "11:00"}]
+    assert data[2] == [{"desde": "10:00", "hasta": "10:15"}, {"desde": "10:45", "hasta": "11:00"}]
+
+    # Por defecto se piden huecos de una cita completa (30 minutos): Ana no tiene
+    response = client.get("/disponibilidad", params=consulta)
+    assert [b["barbero_id"] for b in response.json()] == [1]
+    response = client.get("/disponibilidad", params={**consulta, "duracion": 15, "especialidad": "barba"})
+    assert [b["barbero_id"] for b in response.json()] == [2]
+
+    # Cancelar la cita libera sus bloques
+    client.delete(f"/citas/{cita['id']}")
+    data = {b["barbero_id"]: b["libre"] for b in client.get("/disponibilidad", params=consulta).json()}
+    assert data[1] == [{"desde": "10:00", "hasta": "11:00"}]
+
+    response = client.get("/disponibilidad", params={"fecha": "2025-12-10", "desde": "12:00", "hasta": "11:00"})
+    assert response.status_code == 400
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_mover_cita_de_dia_libera_el_dia_anterior_en_otros_workers(mock_barbero, mock_cliente, client):
+    """Probar que mover una cita a otro día invalida el día anterior aunque este worker no lo tuviera cargado"""
+    from app.disponibilidad import IndiceDisponibilidad, indice_disponibilidad
+
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    cita = client.post("/citas/", json={
+        "cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"
+    }).json()
+
+    # Otro worker (mismo cache compartido) ya tiene cargado el día de la cita
+    worker_b = IndiceDisponibilidad(indice_disponibilidad.cache)
+
+    async def ocupacion(fecha):
+        async with TestingSessionLocal() as sesion:
+            return (await worker_b.dia(sesion, fecha)).ocupacion(1)
+
+    assert asyncio.run(ocupacion(date(2025, 12, 10))) != 0
+    assert asyncio.run(ocupacion(date(2025, 12, 11))) == 0
+
+    # El worker que atiende el cambio no conoce la cita en su índice
+    indice_disponibilidad.limpiar()
+    response = client.put(f"/citas/{cita['id']}", json={"fecha": "2025-12-11"})
+    assert response.status_code == 200
+
+    assert asyncio.run(ocupacion(date(2025, 12, 10))) == 0
+    assert asyncio.run(ocupacion(date(2025, 12, 11))) != 0
+
+@patch('app.main.verificar_clientes_existen', new_callable=AsyncMock)
+@patch('app.main.verificar_barberos_existen', new_callable=AsyncMock)
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_citas_solapadas_por_duracion(mock_barbero, mock_cliente, mock_barberos, mock_clientes, client):
+    """Probar que una cita no puede empezar mientras dura otra del mismo barbero"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    mock_clientes.return_value = {1: True}
+    mock_barberos.return_value = {1: True}
+    base = {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10"}
+
+    # Un corte dura 30 minutos por defecto: 10:00-10:30
+    corte = client.post("/citas/", json={**base, "hora": "10:00:00", "servicio": "Corte de cabello"})
+    assert corte.json()["duracion_minutos"] == 30
+
+    barba = client.post("/citas/", json={**base, "hora": "10:15:00", "servicio": "Barba"})
+    assert barba.status_code == 400
+    assert "ya tiene una cita en ese horario" in barba.json()["detail"]
+    assert client.post("/citas/", json={**base, "hora": "10:30:00", "servicio": "Barba"}).status_code == 201
+
+    # Alargar el corte lo haría chocar con la barba de las 10:30
+    response = client.put(f"/citas/{corte.json()['id']}", json={"duracion_minutos": 45})
+    assert response.status_code == 400
+
+    response = client.post("/citas/", json={**base, "hora": "23:45:00", "servicio": "Corte"})
+    assert response.status_code == 400
+    assert "mismo día" in response.json()["detail"]
+
+    # En el lote, una cita larga pisa a la siguiente aunque empiecen a distinta hora
+    lote = [
+        {**base, "hora": "12:00:00", "servicio": "Tinte", "duracion_minutos": 90},
+        {**base, "hora": "13:00:00", "servicio": "Corte"},
+        {**base, "hora": "09:45:00", "servicio": "Barba"},
+        {**base, "hora": "09:45:00", "servicio": "Barba", "duracion_minutos": 30},
+    ]
+    resultados = client.post("/citas/bulk", json=lote).json()["resultados"]
+    assert [r["creada"] for r in resultados] == [True, False, True, False]
+    assert "conflicto con la cita 0 del lote" in resultados[1]["detalle"]
+    assert "conflicto con la cita 2 del lote" in resultados[3]["detalle"]
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_agenda_de_barbero_filtrada_y_paginada(mock_barbero, mock_cliente, client):
+    """Probar los filtros de fecha y estado y el cursor en la agenda de un barbero"""
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+
+    for fecha, hora in [("2025-12-11", "09:00:00"), ("2025-12-10", "16:00:00"),
+                        ("2025-12-10", "10:00:00"), ("2025-12-12", "11:00:00")]:
+        client.post("/citas/", json={
+            "cliente_id": 1, "barbero_id": 1, "fecha": fecha, "hora": hora, "servicio": "Corte"
+        })
+    client.post("/citas/", json={
+        "cliente_id": 2, "barbero_id": 2, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"
+    })
+    client.put("/citas/2", json={"estado": "confirmada"})
+
+    primera = client.get("/citas/barbero/1", params={"hasta": "2025-12-11", "limit": 2})
+    assert [(c["fecha"], c["hora"]) for c in primera.json()] == [
+        ("2025-12-10", "10:00:00"), ("2025-12-10", "16:00:00")
+    ]
+    siguiente = client.get("/citas/barbero/1", params={
+        "hasta": "2025-12-11", "limit": 2, "after": primera.headers["X-Next-Cursor"]
+    })
+    assert [c["fecha"] for c in siguiente.json()] == ["2025-12-11"]
+    assert "X-Next-Cursor" not in siguiente.headers
+
+    response = client.get("/citas/barbero/1", params={"desde": "2025-12-11", "estado": "pendiente"})
+    assert [c["id"] for c in response.json()] == [1, 4]
+    response = client.get("/citas/cliente/1", params={"estado": "confirmada"})
+    assert [c["id"] for c in response.json()] == [2]
+
+class RedisFalso:
+    """Sustituto mínimo de redis.asyncio (get/set/incr/delete/mget/pipeline) compartido entre 'procesos'.
+
+    ``viajes`` cuenta las idas y vueltas al servidor.
+    """
+
+    def __init__(self):
+        self.datos = {}
+        self.viajes = 0
+
+    def _fijar(self, clave, valor, nx=False):
+        if nx and clave in self.datos:
+            return None
+        self.datos[clave] = valor if isinstance(valor, bytes) else str(valor).encode()
+        return True
+
+    async def get(self, clave):
+        self.viajes += 1
+        return self.datos.get(clave)
+
+    async def mget(self, claves):
+        self.viajes += 1
+        return [self.datos.get(clave) for clave in claves]
+
+    async def set(self, clave, valor, nx=False, px=None):
+        self.viajes += 1
+        return self._fijar(clave, valor, nx)
+
+    async def incr(self, clave):
+        self.viajes += 1
+        self.datos[clave] = str(int(self.datos.get(clave, b"0")) + 1).encode()
+        return int(self.datos[clave])
+
+    async def delete(self, clave):
+        self.viajes += 1
+        self.datos.pop(clave, None)
+
+    def pipeline(self, transaction=True):
+        return PipelineFalso(self)
+
+class PipelineFalso:
+    """Acumula los SET y los envía en un solo viaje al ejecutar"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.comandos = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *error):
+        self.comandos = []
+
+    def set(self, clave, valor, nx=False, px=None):
+        self.comandos.append((clave, valor, nx))
+        return self
+
+    async def execute(self):
+        self.redis.viajes += 1
+        return [self.redis._fijar(*comando) for comando in self.comandos]
+
+def test_cache_compartido_con_backend_redis():
+    """Probar single-flight, TTL e invalidación por espacio entre dos procesos con Redis"""
+    from app.cache_compartido import BackendRedis, CacheCompartido
+
+    redis = RedisFalso()
+    proceso_a = CacheCompartido(BackendRedis(redis), prefijo="prueba")
+    proceso_b = CacheCompartido(BackendRedis(redis), prefijo="prueba")
+    calculos = []
+
+    async def calcular():
+        calculos.append(1)
+        await asyncio.sleep(0.01)
+        return {"barberos": [1, 2]}
+
+    async def escenario():
+        # Diez peticiones simultáneas del mismo valor lo calculan una sola vez
+        valores = await asyncio.gather(*[
+            proceso_a.obtener_o_calcular("catalogo", "activos", calcular, ttl=60) for _ in range(10)
+        ])
+        assert valores == [{"barberos": [1, 2]}] * 10
+        assert len(calculos) == 1
+
+        # El otro proceso lo lee del backend compartido
+        assert await proceso_b.obtener_o_calcular("catalogo", "activos", calcular, ttl=60) == {"barberos": [1, 2]}
+        assert len(calculos) == 1
+
+        # Invalidar el espacio en un proceso lo invalida para ambos
+        version = await proceso_a.version("catalogo")
+        assert await proceso_b.invalidar("catalogo") == version + 1
+        assert await proceso_a.obtener("catalogo", "activos") is None
+        await proceso_a.obtener_o_calcular("catalogo", "activos", calcular, ttl=60)
+        assert len(calculos) == 2
+
+    asyncio.run(escenario())
+
+def test_eventos_requieren_token(client):
+    """Probar que POST /eventos solo acepta lotes con el token configurado y se desactiva sin él"""
+    lote = {"origen": "clientes", "eventos": [{"id": 1, "tipo": "cliente.creado", "entidad_id": 5}]}
+
+    with patch("app.main.EVENTOS_TOKEN", ""):
+        assert client.post("/eventos", json=lote, headers=CABECERA_EVENTOS).status_code == 503
+    with patch("app.main.EVENTOS_TOKEN", TOKEN_EVENTOS):
+        assert client.post("/eventos", json=lote).status_code == 401
+        assert client.post("/eventos", json=lote, headers={"X-Eventos-Token": "falso"}).status_code == 401
+        assert client.post("/eventos", json=lote, headers=CABECERA_EVENTOS).status_code == 200
+
+def test_endpoints_internos_requieren_token(client):
+    """Probar que la resincronización de réplicas y la invalidación de caches exigen EVENTOS_TOKEN"""
+    peticiones = [("POST", "/replicas/sincronizar"), ("DELETE", "/cache/barbero"), ("DELETE", "/cache/cliente/7")]
+
+    with patch("app.main.EVENTOS_TOKEN", ""):
+        for metodo, ruta in peticiones:
+            assert client.request(metodo, ruta, headers=CABECERA_EVENTOS).status_code == 503
+    with patch("app.main.EVENTOS_TOKEN", TOKEN_EVENTOS), \
+            patch("app.main.sincronizar_todo", new_callable=AsyncMock) as sincronizar:
+        sincronizar.return_value = {"clientes": 0, "barberos": 0}
+        for metodo, ruta in peticiones:
+            assert client.request(metodo, ruta).status_code == 401
+            assert client.request(metodo, ruta, headers={"X-Eventos-Token": "falso"}).status_code == 401
+        sincronizar.assert_not_called()
+
+        assert client.post("/replicas/sincronizar", headers=CABECERA_EVENTOS).status_code == 200
+        assert client.delete("/cache/barbero", headers=CABECERA_EVENTOS).status_code == 204
+        assert client.delete("/cache/cliente/7", headers=CABECERA_EVENTOS).status_code == 204
+    # Las estadísticas son de solo lectura
+    assert client.get("/cache/estadisticas").status_code == 200
+
+@patch("app.main.EVENTOS_TOKEN", TOKEN_EVENTOS)
+def test_eventos_actualizan_caches(client):
+    """Probar que los eventos de clientes y barberos actualizan el cache sin consultar los servicios"""
+    import httpx
+    from app import main
+    from app.cache import cache_existencia
+    from app.http_client import obtener_cliente_http
+
+    cache_existencia.limpiar()
+    asyncio.run(cache_existencia.guardar("cliente", 5, False))
+    asyncio.run(cache_existencia.guardar("cliente", 6, True))
+
+    response = client.post("/eventos", headers=CABECERA_EVENTOS, json={"origen": "clientes", "eventos": [
+        {"id": 1, "tipo": "cliente.creado", "entidad_id": 5},
+        {"id": 2, "tipo": "cliente.eliminado", "entidad_id": 6},
+        {"id": 3, "tipo": "cliente.fusionado", "entidad_id": 7},
+    ]})
+    assert response.json() == {"procesados": 2, "ignorados": 1}
+
+    llamadas = []
+
+    async def fake_request(metodo, url, **kwargs):
+        llamadas.append(url)
+        return httpx.Response(200)
+
+    with patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        assert asyncio.run(main.verificar_cliente_existe(5)) is True
+        assert asyncio.run(main.verificar_cliente_existe(6)) is False
+    assert llamadas == []
+    cache_existencia.limpiar()
+
+@patch("app.main.EVENTOS_TOKEN", TOKEN_EVENTOS)
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_agenda_expandida_con_replicas(mock_barbero, mock_cliente, client):
+    """Probar que los eventos y la sincronización mantienen las réplicas y que expandir=true las une"""
+    import httpx
+    from app.http_client import obtener_cliente_http
+    from app.replicas import sincronizar
+
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    for cliente_id, hora in [(1, "09:00:00"), (2, "10:00:00"), (3, "11:00:00")]:
+        client.post("/citas/", json={
+            "cliente_id": cliente_id, "barbero_id": 1, "fecha": "2025-12-10", "hora": hora, "servicio": "Corte"
+        })
+
+    client.post("/eventos", headers=CABECERA_EVENTOS, json={"origen": "clientes", "eventos": [
+        {"id": 1, "tipo": "cliente.creado", "entidad_id": 1, "datos": {"nombre": "Ana", "telefono": "300"}},
+        {"id": 3, "tipo": "cliente.actualizado", "entidad_id": 1,
+         "datos": {"campos": ["telefono"], "nombre": "Ana", "telefono": "301"}},
+        # Llega tarde: es más antiguo que el último aplicado y se descarta
+        {"id": 2, "tipo": "cliente.actualizado", "entidad_id": 1,
+         "datos": {"campos": ["nombre"], "nombre": "Anita", "telefono": "300"}},
+        {"id": 4, "tipo": "cliente.creado", "entidad_id": 2, "datos": {"nombre": "Luis", "telefono": "302"}},
+        {"id": 5, "tipo": "cliente.eliminado", "entidad_id": 2},
+    ]})
+
+    # Barbero borrado en su servicio sin que llegara el evento: la sincronización lo desactiva
+    client.post("/eventos", headers=CABECERA_EVENTOS, json={"origen": "barberos", "eventos": [
+        {"id": 1, "tipo": "barbero.creado", "entidad_id": 2,
+         "datos": {"nombre": "Pedro", "especialidad": "Barba", "telefono": "320", "activo": True}},
+    ]})
+
+    async def fake_request(metodo, url, **kwargs):
+        assert url.endswith("/barberos/")
+        return httpx.Response(200, json=[
+            {"id": 1, "nombre": "Carlos", "especialidad": "Cortes", "telefono": "310", "activo": True}
+        ])
+
+    async def sincronizar_barberos():
+        async with TestingSessionLocal() as db:
+            return await sincronizar(db, "barbero")
+
+    with patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        assert asyncio.run(sincronizar_barberos()) == 1
+    client.post("/citas/", json={
+        "cliente_id": 1, "barbero_id": 2, "fecha": "2025-12-10", "hora": "09:00:00", "servicio": "Corte"
+    })
+    barbero_borrado = client.get("/citas/barbero/2", params={"expandir": "true"}).json()[0]["barbero"]
+    assert (barbero_borrado["nombre"], barbero_borrado["activo"]) == ("Pedro", False)
+
+    response = client.get("/citas/barbero/1", params={"expandir": "true", "limit": 2})
+    citas = response.json()
+    assert [(c["cliente"]["nombre"], c["cliente"]["telefono"], c["cliente"]["activo"]) for c in citas] == [
+        ("Ana", "301", True), ("Luis", "302", False)
+    ]
+    assert citas[0]["barbero"]["nombre"] == "Carlos"
+    siguiente = client.get("/citas/barbero/1", params={
+        "expandir": "true", "after": response.headers["X-Next-Cursor"]
+    })
+    # Cliente aún no replicado
+    assert siguiente.json()[0]["cliente"] is None
+
+    # Sin expandir la respuesta no cambia
+    assert "cliente" not in client.get("/citas/barbero/1").json()[0]
+
+def test_metricas_prometheus(client):
+    """Probar que /metrics expone peticiones por plantilla de ruta, consultas SQL por petición y llamadas salientes"""
+    import httpx
+    from app import metricas
+    from app.dependencias import llamar_servicio
+    from app.http_client import obtener_cliente_http
+
+    metricas.instrumentar_engine(engine)
+    antes = metricas.PETICIONES.valor("GET", "/citas/{cita_id}", "404")
+    peticiones_antes = metricas.CONSULTAS_POR_PETICION.conteo("/citas/{cita_id}")
+    consultas_antes = metricas.CONSULTAS_POR_PETICION.suma("/citas/{cita_id}")
+    client.get("/citas/999")
+    client.get("/citas/998")
+
+    async def fake_request(metodo, url, **kwargs):
+        return httpx.Response(404)
+
+    with patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        asyncio.run(llamar_servicio("cliente", "GET", "/clientes/1"))
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    texto = response.text
+    assert metricas.PETICIONES.valor("GET", "/citas/{cita_id}", "404") == antes + 2
+    assert f'http_requests_total{{method="GET",route="/citas/{{cita_id}}",status="404"}} {int(antes) + 2}' in texto
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/citas/{cita_id}",le="+Inf"}' in texto
+    assert metricas.CONSULTAS_POR_PETICION.conteo("/citas/{cita_id}") == peticiones_antes + 2
+    # Cada GET de una cita hace una consulta
+    assert metricas.CONSULTAS_POR_PETICION.suma("/citas/{cita_id}") == consultas_antes + 2
+    assert 'http_client_request_duration_seconds_count{dependency="clientes",outcome="404"}' in texto
+    assert "# TYPE http_requests_in_progress gauge" in texto
+
+@patch('app.main.verificar_cliente_existe', new_callable=AsyncMock)
+@patch('app.main.verificar_barbero_existe', new_callable=AsyncMock)
+def test_perfilado_sql_por_peticion(mock_barbero, mock_cliente, client):
+    """Probar que el perfilado SQL informa cuántas consultas hace cada petición y detecta repeticiones"""
+    from app import metricas
+    from app.perfilado import PerfilSQL
+
+    mock_cliente.return_value = True
+    mock_barbero.return_value = True
+    metricas.instrumentar_engine(engine)
+    cita = {"cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"}
+
+    # Desactivado: sin cabeceras de perfilado
+    assert "X-Consultas-SQL" not in client.post("/citas/", json=cita).headers
+
+    with patch("app.perfilado.PERFILADO_SQL", "cabecera"):
+        sin_cabecera = client.get("/citas/1")
+        response = client.post("/citas/", json={**cita, "hora": "11:00:00"}, headers={"X-Perfilar-SQL": "1"})
+    assert "X-Consultas-SQL" not in sin_cabecera.headers
+    assert response.status_code == 201
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    # Límite de consultas al crear una cita: solapamiento e INSERT ... RETURNING, sin relectura
+    assert response.headers["X-Consultas-SQL"] == "2"
+
+    perfil = PerfilSQL()
+    for _ in range(3):
+        perfil.registrar("SELECT * FROM citas\n WHERE id = ?", 0.001)
+    perfil.registrar("INSERT INTO citas VALUES (?)", 0.005)
+    assert perfil.repetidas() == [("SELECT * FROM citas WHERE id = ?", 3)]
+    assert perfil.lentas(1) == [("INSERT INTO citas VALUES (?)", 0.005)]
+
+def test_trazas_distribuidas(client, tmp_path):
+    """Probar que la traza recibida continúa en los spans de BD y en las llamadas a clientes y barberos"""
+    import json
+    import httpx
+    from app import trazas
+    from app.cache import cache_existencia
+    from app.http_client import obtener_cliente_http
+
+    trazas.instrumentar_engine(engine)
+    cache_existencia.limpiar()
+    trace_id, padre_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    enviadas = []
+
+    async def fake_request(metodo, url, **kwargs):
+        enviadas.append(kwargs["headers"]["traceparent"])
+        return httpx.Response(200, json={})
+
+    with patch.object(trazas.exportador, "tipo", "memoria"), \
+            patch.object(trazas.exportador, "spans", []), \
+            patch.object(obtener_cliente_http(), "request", side_effect=fake_request):
+        response = client.post("/citas/", headers={"traceparent": f"00-{trace_id}-{padre_id}-01"}, json={
+            "cliente_id": 1, "barbero_id": 1, "fecha": "2025-12-10", "hora": "10:00:00", "servicio": "Corte"
+        })
+        spans = list(trazas.exportador.spans)
+
+    assert response.status_code == 201
+    assert response.headers["X-Trace-Id"] == trace_id
+    assert {span["trace_id"] for span in spans} == {trace_id}
+    servidor = next(span for span in spans if span["tipo"] == "servidor")
+    assert servidor["nombre"] == "POST /citas/"
+    assert servidor["padre_id"] == padre_id
+    assert servidor["atributos"]["http.status_code"] == 201
+
+    salientes = [span for span in spans if span["nombre"] in ("GET clientes", "GET barberos")]
+    assert len(salientes) == 2
+    assert all(span["padre_id"] == servidor["span_id"] for span in salientes)
+    # El servicio llamado recibe como padre el span de la llamada saliente
+    assert sorted(enviadas) == sorted(f"00-{trace_id}-{span['span_id']}-01" for span in salientes)
+    assert any(span["atributos"].get("db.statement", "").startswith("INSERT INTO citas") for span in spans)
+
+    # Exportador a archivo (colector local)
+    ruta = tmp_path / "trazas.jsonl"
+    exportador = trazas.Exportador("archivo", str(ruta), tamano_lote=10)
+    exportador.exportar(trazas.crear_span("prueba"))
+    assert not ruta.exists()
+    exportador.vaciar()
+    assert json.loads(ruta.read_text())["nombre"] == "prueba"
+
+def test_listados_de_citas_limitan_el_tamano_de_pagina(client):
+    """Probar que limit se acota entre 1 y MAX_LIMIT en todos los listados de citas"""
+    from app.paginacion import MAX_LIMIT
+
+    for ruta in ("/citas/", "/citas/barbero/1", "/citas/cliente/1"):
+        assert client.get(ruta, params={"limit": MAX_LIMIT}).status_code == 200
+        assert client.get(ruta, params={"limit": 100000000}).status_code == 422
+        assert client.get(ruta, params={"limit": 0}).status_code == 422
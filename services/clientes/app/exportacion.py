@@ -0,0 +1,88 @@
+# Copia de compartido/exportacion.py: editar el original y ejecutar python compartido/sincronizar.py
+import csv
+import io
+import os
+from enum import Enum
+from typing import Any, AsyncIterator, Type
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+# Filas que se traen del cursor del servidor en cada viaje a la base de datos
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", 500))
+# Tamaño aproximado (en caracteres) de cada bloque enviado al cliente
+EXPORT_TAMANO_BLOQUE = 64 * 1024
+
+
+class FormatoExportacion(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+TIPOS_CONTENIDO = {
+    FormatoExportacion.NDJSON: "application/x-ndjson",
+    FormatoExportacion.CSV: "text/csv; charset=utf-8",
+}
+
+
+async def _lineas_ndjson(filas: AsyncIterator[Any], esquema: Type[BaseModel]) -> AsyncIterator[str]:
+    bloque = []
+    tamano = 0
+    async for fila in filas:
+        linea = esquema.model_validate(fila).model_dump_json() + "\n"
+        bloque.append(linea)
+        tamano += len(linea)
+        if tamano >= EXPORT_TAMANO_BLOQUE:
+            yield "".join(bloque)
+            bloque, tamano = [], 0
+    if bloque:
+        yield "".join(bloque)
+
+
+async def _lineas_csv(filas: AsyncIterator[Any], esquema: Type[BaseModel]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=list(esquema.model_fields))
+    escritor.writeheader()
+    async for fila in filas:
+        escritor.writerow(esquema.model_validate(fila).model_dump(mode="json"))
+        if buffer.tell() >= EXPORT_TAMANO_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def exportar(
+    sesiones: async_sessionmaker,
+    query: Select,
+    esquema: Type[BaseModel],
+    formato: FormatoExportacion,
+    nombre: str
+) -> StreamingResponse:
+    """Enviar el resultado de la consulta fila a fila con un cursor del servidor.
+
+    La memoria usada no depende del número de filas: solo se mantiene en
+    memoria un lote de ``EXPORT_YIELD_PER`` filas y el bloque en construcción.
+    La sesión se abre dentro del generador porque el streaming continúa después
+    de que el handler (y la sesión de ``get_db``) hayan terminado.
+    """
+
+    async def contenido() -> AsyncIterator[str]:
+        async with sesiones() as db:
+            resultado = await db.stream_scalars(query.execution_options(yield_per=EXPORT_YIELD_PER))
+            try:
+                lineas = _lineas_csv if formato == FormatoExportacion.CSV else _lineas_ndjson
+                async for bloque in lineas(resultado, esquema):
+                    yield bloque
+            finally:
+                await resultado.close()
+
+    extension = "csv" if formato == FormatoExportacion.CSV else "ndjson"
+    return StreamingResponse(
+        contenido(),
+        media_type=TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'}
+    )
@@ -0,0 +1,151 @@
+import codecs
+import csv
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Cliente
+from .outbox import TipoEvento, instantanea, registrar_eventos
+from .schemas import ClienteCreate, EstadoImportacion, ResultadoImportacion
+
+# Filas que se validan, consultan e insertan juntas (una transacción por lote)
+IMPORTACION_TAMANO_LOTE = int(os.getenv("IMPORTACION_TAMANO_LOTE", 500))
+
+COLUMNAS_CSV = ("nombre", "telefono", "email")
+
+
+class Importacion:
+    """Importación masiva de clientes por lotes con resultado por fila"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.resultados: List[ResultadoImportacion] = []
+        self._emails_vistos: Set[str] = set()
+        self._pendientes: List[Tuple[int, Dict[str, Any]]] = []
+
+    async def agregar(self, indice: int, datos: Dict[str, Any]) -> None:
+        """Validar una fila y encolarla; se procesa al completar un lote"""
+        try:
+            cliente = ClienteCreate.model_validate(datos)
+        except ValidationError as error:
+            detalle = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+            self._resultado(indice, EstadoImportacion.INVALIDO, detalle=detalle)
+            return
+
+        if cliente.email in self._emails_vistos:
+            self._resultado(indice, EstadoImportacion.DUPLICADO_EN_LOTE, email=cliente.email)
+            return
+        self._emails_vistos.add(cliente.email)
+
+        self._pendientes.append((indice, cliente.model_dump()))
+        if len(self._pendientes) >= IMPORTACION_TAMANO_LOTE:
+            await self.vaciar()
+
+    async def vaciar(self) -> None:
+        """Insertar las filas pendientes (emails ya registrados se omiten)"""
+        if not self._pendientes:
+            return
+        pendientes, self._pendientes = self._pendientes, []
+
+        emails = [fila["email"] for _, fila in pendientes]
+        registrados = set(await self.db.scalars(select(Cliente.email).where(Cliente.email.in_(emails))))
+        nuevas = [(indice, fila) for indice, fila in pendientes if fila["email"] not in registrados]
+
+        insertados: Dict[str, int] = {}
+        if nuevas:
+            sentencia = _insert_ignorando_emails_duplicados(
+                self.db.get_bind().dialect.name, [fila for _, fila in nuevas]
+            )
+            insertados = {email: cliente_id for cliente_id, email in await self.db.execute(sentencia)}
+            await registrar_eventos(self.db, TipoEvento.CREADO, [
+                (insertados[fila["email"]], instantanea(fila))
+                for _, fila in nuevas if fila["email"] in insertados
+            ])
+            await self.db.commit()
+
+        for indice, fila in pendientes:
+            email = fila["email"]
+            if email in insertados:
+                self._resultado(indice, EstadoImportacion.CREADO, email=email, cliente_id=insertados[email])
+            else:
+                # Ya existía, o lo registró otra petición entre la consulta y el INSERT
+                self._resultado(indice, EstadoImportacion.EMAIL_REGISTRADO, email=email)
+
+    def _resultado(
+        self,
+        indice: int,
+        estado: EstadoImportacion,
+        email: Optional[str] = None,
+        cliente_id: Optional[int] = None,
+        detalle: Optional[str] = None
+    ) -> None:
+        self.resultados.append(
+            ResultadoImportacion(indice=indice, estado=estado, id=cliente_id, email=email, detalle=detalle)
+        )
+
+    def resumen(self) -> Dict[str, Any]:
+        """Totales y resultados ordenados por fila"""
+        self.resultados.sort(key=lambda resultado: resultado.indice)
+        creados = sum(1 for r in self.resultados if r.estado == EstadoImportacion.CREADO)
+        return {
+            "creados": creados,
+            "rechazados": len(self.resultados) - creados,
+            "resultados": self.resultados,
+        }
+
+
+def _insert_ignorando_emails_duplicados(dialecto: str, filas: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT (email) DO NOTHING RETURNING id, email"""
+    modulo = postgresql if dialecto == "postgresql" else sqlite
+    return (
+        modulo.insert(Cliente)
+        .values(filas)
+        .on_conflict_do_nothing(index_elements=[Cliente.email])
+        .returning(Cliente.id, Cliente.email)
+    )
+
+
+async def registros_csv(fragmentos: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """Leer un CSV en streaming y devolver sus registros uno a uno.
+
+    Un registro puede ocupar varias líneas si tiene campos entre comillas con
+    saltos de línea: se acumulan líneas hasta que las comillas estén cerradas.
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+    registro = ""
+
+    async def lineas() -> AsyncIterator[str]:
+        nonlocal resto
+        async for fragmento in fragmentos:
+            resto += decodificador.decode(fragmento)
+            *completas, resto = resto.split("\n")
+            for linea in completas:
+                yield linea + "\n"
+        resto += decodificador.decode(b"", final=True)
+        if resto:
+            yield resto
+
+    async for linea in lineas():
+        registro += linea
+        if registro.count('"') % 2:
+            continue
+        campos = next(csv.reader([registro]), [])
+        registro = ""
+        if campos:
+            yield campos
+    if registro:
+        yield next(csv.reader([registro]), [])
+
+
+def validar_encabezado_csv(encabezado: Iterable[str]) -> List[str]:
+    """Normalizar y validar el encabezado del CSV"""
+    columnas = [columna.strip().lower() for columna in encabezado]
+    faltantes = [columna for columna in COLUMNAS_CSV if columna not in columnas]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el CSV: {', '.join(faltantes)}")
+    return columnas
@@ -1,89 +1,238 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import Any, Awaitable, Dict, List, Optional
+from contextlib import asynccontextmanager
 import os
 
-from .database import engine, get_db, Base
+from .database import SessionLocal, actualizar_fila, engine, get_db, get_sesiones, estadisticas_pool
 from .models import Cliente
-from .schemas import ClienteCreate, ClienteUpdate, ClienteResponse
+from .cache_http import cache_respuestas, clave_peticion, responder, serializar
+from .exportacion import FormatoExportacion, exportar
+from .importacion import Importacion, registros_csv, validar_encabezado_csv
+from .metricas import TIPO_CONTENIDO, MiddlewareMetricas, instrumentar_engine, registrar_pool, registro
+from .perfilado import MiddlewarePerfilado
+from . import trazas
+from .trazas import MiddlewareTrazas
+from .outbox import Despachador, TipoEvento, instantanea, registrar_evento
+from .paginacion import CABECERA_CURSOR, MAX_LIMIT, decodificar_cursor_id, obtener_pagina, validar_paginacion
+from .schemas import (
+    ClienteCreate, ClienteUpdate, ClienteResponse, ExistenciaRequest, ExistenciaResponse, ImportacionResponse
+)
+
+# Las tablas se crean con las migraciones (python -m app.migrate), no al importar
 
-# Crear las tablas
-Base.metadata.create_all(bind=engine)
+# Entrega de los eventos del outbox al servicio de citas (si OUTBOX_WEBHOOK_URL está configurada)
+# y purga de los antiguos
+despachador = Despachador(SessionLocal)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arrancar el despachador del outbox al iniciar y detenerlo al apagar"""
+    await despachador.iniciar()
+    yield
+    await despachador.detener()
+    trazas.exportador.vaciar()
 
 app = FastAPI(
     title="Servicio de Clientes - Barbería",
     description="API para gestionar clientes de la barbería",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# El perfilado queda dentro de las métricas, que crean el acumulador de consultas;
+# las trazas envuelven a ambos para que sus logs lleven el trace_id
+app.add_middleware(MiddlewarePerfilado)
+app.add_middleware(MiddlewareMetricas)
+app.add_middleware(MiddlewareTrazas)
+instrumentar_engine(engine)
+trazas.instrumentar_engine(engine)
+registrar_pool(estadisticas_pool)
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "clientes"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return PlainTextResponse(registro.exponer(), media_type=TIPO_CONTENIDO)
+
+@app.get("/health/pool")
+def estado_pool():
+    """Uso del pool de conexiones a la base de datos"""
+    return estadisticas_pool()
+
+# Máximo de IDs aceptados en las consultas por lote
+MAX_IDS_LOTE = 1000
+
+def _parsear_ids(ids: str) -> List[int]:
+    """Convertir un parámetro "1,2,3" en una lista de enteros"""
+    try:
+        valores = [int(valor) for valor in ids.split(",") if valor.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El parámetro ids debe ser una lista de enteros separados por comas")
+    if len(valores) > MAX_IDS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Se admiten como máximo {MAX_IDS_LOTE} ids por consulta")
+    return valores
+
+def _es_email_duplicado(error: IntegrityError) -> bool:
+    """Indica si el error proviene del índice único de email (Postgres lo nombra, SQLite cita la columna)"""
+    mensaje = str(error.orig)
+    return "ix_clientes_email" in mensaje or "clientes.email" in mensaje
+
+async def _guardar_con_email_unico(db: AsyncSession, escritura: Optional[Awaitable[Any]] = None) -> Any:
+    """Ejecutar la escritura (por defecto un flush) y traducir un email duplicado en un 400"""
+    try:
+        return await (escritura if escritura is not None else db.flush())
+    except IntegrityError as error:
+        await db.rollback()
+        if _es_email_duplicado(error):
+            raise HTTPException(status_code=400, detail="El email ya está registrado")
+        raise
+
 @app.get("/clientes/", response_model=List[ClienteResponse])
-def listar_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Obtener lista de todos los clientes"""
-    clientes = db.query(Cliente).offset(skip).limit(limit).all()
-    return clientes
+async def listar_clientes(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_LIMIT),
+    after: Optional[str] = None,
+    ids: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener lista de todos los clientes (o de los indicados en ids=1,2,3).
+
+    Admite paginación por desplazamiento (skip) o por cursor (after); el cursor
+    de la página siguiente se devuelve en la cabecera X-Next-Cursor. La
+    respuesta lleva ETag y se sirve desde cache mientras no haya escrituras.
+    """
+    validar_paginacion(skip, after)
+
+    async def cargar():
+        query = select(Cliente).order_by(Cliente.id)
+        if ids is not None:
+            query = query.where(Cliente.id.in_(_parsear_ids(ids)))
+        if after is not None:
+            ultimo_id = decodificar_cursor_id(after)
+            query = query.where(Cliente.id > ultimo_id)
+        clientes, siguiente = await obtener_pagina(db, query.offset(skip), limit, ["id"])
+        cabeceras = {CABECERA_CURSOR: siguiente} if siguiente is not None else None
+        return serializar(List[ClienteResponse], clientes, cabeceras)
+
+    return responder(request, await cache_respuestas.obtener(clave_peticion(request), cargar))
+
+@app.post("/clientes/exists", response_model=ExistenciaResponse)
+async def verificar_existencia_clientes(solicitud: ExistenciaRequest, db: AsyncSession = Depends(get_db)):
+    """Verificar con una sola consulta qué clientes de la lista existen"""
+    ids = set(solicitud.ids)
+    existentes = set()
+    if ids:
+        existentes = set(await db.scalars(select(Cliente.id).where(Cliente.id.in_(ids))))
+    return ExistenciaResponse(existentes=sorted(existentes), faltantes=sorted(ids - existentes))
+
+@app.get("/clientes/export")
+async def exportar_clientes(
+    formato: FormatoExportacion = FormatoExportacion.NDJSON,
+    sesiones: async_sessionmaker = Depends(get_sesiones)
+):
+    """Exportar todos los clientes en streaming (NDJSON o CSV)"""
+    query = select(Cliente).order_by(Cliente.id)
+    return exportar(sesiones, query, ClienteResponse, formato, "clientes")
 
 @app.get("/clientes/{cliente_id}", response_model=ClienteResponse)
-def obtener_cliente(cliente_id: int, db: Session = Depends(get_db)):
-    """Obtener un cliente por su ID"""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
-    if cliente is None:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    return cliente
+async def obtener_cliente(cliente_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Obtener un cliente por su ID (con ETag; If-None-Match responde 304)"""
+    async def cargar():
+        cliente = await db.get(Cliente, cliente_id)
+        if cliente is None:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        return serializar(ClienteResponse, cliente)
+
+    return responder(request, await cache_respuestas.obtener(clave_peticion(request), cargar))
 
 @app.post("/clientes/", response_model=ClienteResponse, status_code=status.HTTP_201_CREATED)
-def crear_cliente(cliente: ClienteCreate, db: Session = Depends(get_db)):
+async def crear_cliente(cliente: ClienteCreate, db: AsyncSession = Depends(get_db)):
     """Crear un nuevo cliente"""
-    # Verificar si el email ya existe
-    db_cliente = db.query(Cliente).filter(Cliente.email == cliente.email).first()
-    if db_cliente:
-        raise HTTPException(status_code=400, detail="El email ya está registrado")
-
     nuevo_cliente = Cliente(**cliente.model_dump())
     db.add(nuevo_cliente)
-    db.commit()
-    db.refresh(nuevo_cliente)
+    # El índice único de email detecta los duplicados sin una consulta previa;
+    # el INSERT ... RETURNING devuelve el ID en el mismo viaje
+    await _guardar_con_email_unico(db)
+    registrar_evento(db, TipoEvento.CREADO, nuevo_cliente.id, instantanea(nuevo_cliente))
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return nuevo_cliente
 
+@app.post("/clientes/bulk", response_model=ImportacionResponse)
+async def importar_clientes(filas: List[Dict[str, Any]], db: AsyncSession = Depends(get_db)):
+    """Importar clientes en lote desde una lista JSON, con resultado por fila"""
+    importacion = Importacion(db)
+    for indice, datos in enumerate(filas):
+        await importacion.agregar(indice, datos)
+    await importacion.vaciar()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
+    return importacion.resumen()
+
+@app.post("/clientes/bulk/csv", response_model=ImportacionResponse)
+async def importar_clientes_csv(request: Request, db: AsyncSession = Depends(get_db)):
+    """Importar clientes desde un CSV (nombre,telefono,email) enviado como cuerpo text/csv.
+
+    El cuerpo se lee en streaming y se procesa por lotes, sin cargar el archivo completo.
+    """
+    registros = registros_csv(request.stream())
+    encabezado = await anext(registros, None)
+    if encabezado is None:
+        raise HTTPException(status_code=400, detail="El CSV está vacío")
+    try:
+        columnas = validar_encabezado_csv(encabezado)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    importacion = Importacion(db)
+    indice = 0
+    async for campos in registros:
+        await importacion.agregar(indice, dict(zip(columnas, campos)))
+        indice += 1
+    await importacion.vaciar()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
+    return importacion.resumen()
+
 @app.put("/clientes/{cliente_id}", response_model=ClienteResponse)
-def actualizar_cliente(cliente_id: int, cliente: ClienteUpdate, db: Session = Depends(get_db)):
+async def actualizar_cliente(cliente_id: int, cliente: ClienteUpdate, db: AsyncSession = Depends(get_db)):
     """Actualizar un cliente existente"""
-    db_cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
-    if db_cliente is None:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-
     # Actualizar solo los campos proporcionados
     update_data = cliente.model_dump(exclude_unset=True)
 
-    # Verificar si el email ya existe (si se está actualizando)
-    if "email" in update_data:
-        existing = db.query(Cliente).filter(
-            Cliente.email == update_data["email"],
-            Cliente.id != cliente_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="El email ya está registrado")
-
-    for field, value in update_data.items():
-        setattr(db_cliente, field, value)
+    db_cliente = await _guardar_con_email_unico(db, actualizar_fila(db, Cliente, cliente_id, update_data))
+    if db_cliente is None:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-    db.commit()
-    db.refresh(db_cliente)
+    registrar_evento(
+        db, TipoEvento.ACTUALIZADO, cliente_id, {"campos": sorted(update_data), **instantanea(db_cliente)}
+    )
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return db_cliente
 
 @app.delete("/clientes/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
-def eliminar_cliente(cliente_id: int, db: Session = Depends(get_db)):
+async def eliminar_cliente(cliente_id: int, db: AsyncSession = Depends(get_db)):
     """Eliminar un cliente"""
-    db_cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    db_cliente = await db.get(Cliente, cliente_id)
     if db_cliente is None:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-    db.delete(db_cliente)
-    db.commit()
+    await db.delete(db_cliente)
+    registrar_evento(db, TipoEvento.ELIMINADO, cliente_id)
+    await db.commit()
+    await cache_respuestas.invalidar()
+    despachador.avisar()
     return None
 
 if __name__ == "__main__":
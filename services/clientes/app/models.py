@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, func, text
 from .database import Base
 
 class Cliente(Base):
@@ -9,3 +9,25 @@ class Cliente(Base):
     telefono = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
 
+_FILTRO_PENDIENTES = text("enviado_en IS NULL")
+
+class EventoOutbox(Base):
+    """Cambios de clientes pendientes de notificar a otros servicios (outbox transaccional)"""
+    __tablename__ = "clientes_outbox"
+    __table_args__ = (
+        # El despachador solo recorre los eventos aún no enviados, en orden
+        Index(
+            "ix_clientes_outbox_pendientes",
+            "id",
+            postgresql_where=_FILTRO_PENDIENTES,
+            sqlite_where=_FILTRO_PENDIENTES
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String, nullable=False)
+    entidad_id = Column(Integer, nullable=False)
+    datos = Column(JSON, nullable=True)
+    creado_en = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    enviado_en = Column(DateTime(timezone=True), nullable=True)
+    intentos = Column(Integer, nullable=False, default=0, server_default=text("0"))
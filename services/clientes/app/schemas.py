@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, Field, EmailStr
+from typing import List, Optional
+from enum import Enum
 
 class ClienteBase(BaseModel):
     nombre: str
@@ -20,3 +21,28 @@ class ClienteResponse(ClienteBase):
     class Config:
         from_attributes = True
 
+
+class ExistenciaRequest(BaseModel):
+    ids: List[int] = Field(..., max_length=1000)
+
+class ExistenciaResponse(BaseModel):
+    existentes: List[int]
+    faltantes: List[int]
+
+class EstadoImportacion(str, Enum):
+    CREADO = "creado"
+    DUPLICADO_EN_LOTE = "duplicado_en_lote"
+    EMAIL_REGISTRADO = "email_registrado"
+    INVALIDO = "invalido"
+
+class ResultadoImportacion(BaseModel):
+    indice: int
+    estado: EstadoImportacion
+    id: Optional[int] = None
+    email: Optional[str] = None
+    detalle: Optional[str] = None
+
+class ImportacionResponse(BaseModel):
+    creados: int
+    rechazados: int
+    resultados: List[ResultadoImportacion]
@@ -0,0 +1,16 @@
+"""Datos propios de este servicio que usan los módulos compartidos (ver compartido/)"""
+
+NOMBRE = "clientes"
+
+# Bases creadas antes de las migraciones (con Base.metadata.create_all) ya
+# tienen estas tablas: se marcan con la revisión inicial en lugar de recrearlas
+TABLAS_INICIALES = ("clientes",)
+
+# Clave del advisory lock de Postgres para que solo un proceso migre a la vez
+CLAVE_BLOQUEO_MIGRACIONES = 8001
+
+# Entidad de los eventos del outbox (cliente.creado, cliente.actualizado, cliente.eliminado)
+ENTIDAD = "cliente"
+
+# Campos que otros servicios replican localmente (citas los usa para expandir agendas)
+CAMPOS_REPLICADOS = ("nombre", "telefono")
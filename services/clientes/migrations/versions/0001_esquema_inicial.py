@@ -0,0 +1,33 @@
+"""Esquema inicial de clientes
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-20 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "clientes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nombre", sa.String(), nullable=False),
+        sa.Column("telefono", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_clientes_id", "clientes", ["id"])
+    op.create_index("ix_clientes_email", "clientes", ["email"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_clientes_email", table_name="clientes")
+    op.drop_index("ix_clientes_id", table_name="clientes")
+    op.drop_table("clientes")
@@ -1,45 +1,54 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
+from unittest.mock import patch
 
-from app.main import app
-from app.database import Base, get_db
+from app.main import app, despachador
+from app.database import Base, get_db, get_sesiones
 from app.models import Cliente
+from app.cache_compartido import cache_compartido
 
 # Configurar base de datos de prueba en memoria
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+async def _crear_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.create_all)
+
+async def _eliminar_tablas():
+    async with engine.begin() as conexion:
+        await conexion.run_sync(Base.metadata.drop_all)
 
 @pytest.fixture
 def db_session():
-    """Crear una sesión de base de datos de prueba"""
-    Base.metadata.create_all(bind=engine)
-    session = TestingSessionLocal()
+    """Crear las tablas de prueba y devolver la fábrica de sesiones"""
+    asyncio.run(_crear_tablas())
     try:
-        yield session
+        yield TestingSessionLocal
     finally:
-        session.close()
-        Base.metadata.drop_all(bind=engine)
+        asyncio.run(_eliminar_tablas())
 
 @pytest.fixture
 def client(db_session):
     """Cliente de prueba para FastAPI"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    async def override_get_db():
+        async with db_session() as session:
+            yield session
 
     app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as test_client:
+    app.dependency_overrides[get_sesiones] = lambda: db_session
+    cache_compartido.limpiar()
+    # El despachador del outbox (la purga corre siempre) usa la base de prueba
+    with patch.object(despachador, "sesiones", db_session), TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
 
@@ -158,3 +167,397 @@ def test_eliminar_cliente_no_existente(client):
     response = client.delete("/clientes/999")
     assert response.status_code == 404
 
+
+def test_verificar_existencia_lote(client):
+    """Probar la verificación de existencia de varios clientes en una sola llamada"""
+    creado = client.post("/clientes/", json={
+        "nombre": "Juan Pérez", "telefono": "3001234567", "email": "juan@example.com"
+    }).json()
+
+    response = client.post("/clientes/exists", json={"ids": [creado["id"], 999, creado["id"]]})
+    assert response.status_code == 200
+    assert response.json() == {"existentes": [creado["id"]], "faltantes": [999]}
+
+def test_listar_clientes_por_ids(client):
+    """Probar la consulta masiva de clientes con ids=1,2,3"""
+    ids = []
+    for i in range(3):
+        ids.append(client.post("/clientes/", json={
+            "nombre": f"Cliente {i}", "telefono": "3001234567", "email": f"cliente{i}@example.com"
+        }).json()["id"])
+
+    response = client.get(f"/clientes/?ids={ids[0]},{ids[2]},999")
+    assert response.status_code == 200
+    assert [c["id"] for c in response.json()] == [ids[0], ids[2]]
+
+    assert client.get("/clientes/?ids=1,a").status_code == 400
+
+def test_migraciones_coinciden_con_modelos(tmp_path):
+    """Probar que las migraciones crean el mismo esquema que los modelos"""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from app.migrate import migrar
+
+    url = f"sqlite:///{tmp_path / 'migrado.db'}"
+    migrar(url)
+    migrar(url)  # idempotente
+
+    def solo_tablas_del_servicio(nombre, tipo, padre):
+        return tipo != "table" or nombre in Base.metadata.tables
+
+    motor = create_engine(url)
+    with motor.connect() as conexion:
+        contexto = MigrationContext.configure(conexion, opts={"include_name": solo_tablas_del_servicio})
+        diferencias = compare_metadata(contexto, Base.metadata)
+    motor.dispose()
+    assert diferencias == []
+
+def test_migraciones_adoptan_base_existente(tmp_path):
+    """Probar que una base creada antes de las migraciones se marca y actualiza sin recrear tablas"""
+    from sqlalchemy import inspect, text
+    from app.migrate import migrar, REVISION_INICIAL, configuracion_alembic
+
+    url = f"sqlite:///{tmp_path / 'existente.db'}"
+    version_table = configuracion_alembic().get_main_option("version_table")
+
+    # Simular una base creada con create_all: esquema inicial sin tabla de versiones
+    migrar(url, revision=REVISION_INICIAL)
+    motor = create_engine(url)
+    with motor.begin() as conexion:
+        conexion.execute(text(f"DROP TABLE {version_table}"))
+
+    migrar(url)
+    with motor.connect() as conexion:
+        assert version_table in inspect(conexion).get_table_names()
+        assert conexion.execute(text(f"SELECT version_num FROM {version_table}")).scalar() is not None
+    motor.dispose()
+
+def test_estado_pool(client):
+    """Probar el endpoint con las estadísticas del pool de conexiones"""
+    response = client.get("/health/pool")
+    assert response.status_code == 200
+    assert "clase" in response.json()
+
+def test_opciones_engine_postgres():
+    """Probar que la configuración del pool se aplica a Postgres y no a SQLite"""
+    from app import database
+
+    with patch.object(database, "DB_POOL_SIZE", 20), patch.object(database, "DB_STATEMENT_TIMEOUT_MS", 5000):
+        opciones = database.opciones_engine("postgresql+asyncpg://u:p@db/barberia")
+    assert opciones["pool_size"] == 20
+    assert opciones["pool_pre_ping"] is True
+    assert opciones["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert "pool_size" not in database.opciones_engine("sqlite+aiosqlite:///./local.db")
+    assert database.url_async("postgresql://u:p@db/barberia") == "postgresql+asyncpg://u:p@db/barberia"
+
+def test_listar_clientes_con_cursor(client):
+    """Probar la paginación por cursor con la cabecera X-Next-Cursor"""
+    for i in range(5):
+        client.post("/clientes/", json={
+            "nombre": f"Cliente {i}", "telefono": "3001234567", "email": f"cliente{i}@example.com"
+        })
+
+    vistos = []
+    response = client.get("/clientes/?limit=2")
+    vistos += [c["id"] for c in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        response = client.get(f"/clientes/?limit=2&after={response.headers['X-Next-Cursor']}")
+        assert response.status_code == 200
+        vistos += [c["id"] for c in response.json()]
+
+    assert len(vistos) == 5
+    assert vistos == sorted(vistos)
+    assert client.get("/clientes/?after=no-es-un-cursor").status_code == 400
+    assert client.get("/clientes/?skip=1&after=MQ").status_code == 400
+
+def test_exportar_clientes(client):
+    """Probar la exportación en streaming en NDJSON y CSV"""
+    import json
+
+    for i in range(3):
+        client.post("/clientes/", json={
+            "nombre": f"Cliente {i}", "telefono": "3001234567", "email": f"cliente{i}@example.com"
+        })
+
+    response = client.get("/clientes/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["nombre"] for f in filas] == ["Cliente 0", "Cliente 1", "Cliente 2"]
+
+    response = client.get("/clientes/export?formato=csv")
+    assert response.status_code == 200
+    lineas = response.text.splitlines()
+    assert lineas[0] == "nombre,telefono,email,id"
+    assert len(lineas) == 4
+
+    # El streaming abre su propia sesión y no usa la de get_db, que se cierra con el handler
+    def sin_sesion_de_peticion():
+        raise AssertionError("la exportación no debe usar get_db")
+
+    app.dependency_overrides[get_db] = sin_sesion_de_peticion
+    response = client.get("/clientes/export")
+    assert len(response.text.splitlines()) == 3
+
+def test_importar_clientes_json(client):
+    """Probar la importación masiva con duplicados, emails registrados y filas inválidas"""
+    client.post("/clientes/", json={"nombre": "Existente", "telefono": "1", "email": "existe@example.com"})
+
+    filas = [
+        {"nombre": "Ana", "telefono": "2", "email": "ana@example.com"},
+        {"nombre": "Ana bis", "telefono": "3", "email": "ana@example.com"},
+        {"nombre": "Otro", "telefono": "4", "email": "existe@example.com"},
+        {"nombre": "Sin email", "telefono": "5"},
+        {"nombre": "Luis", "telefono": "6", "email": "luis@example.com"},
+    ]
+    response = client.post("/clientes/bulk", json=filas)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["creados"] == 2
+    assert data["rechazados"] == 3
+    assert [r["estado"] for r in data["resultados"]] == [
+        "creado", "duplicado_en_lote", "email_registrado", "invalido", "creado"
+    ]
+    assert len(client.get("/clientes/").json()) == 3
+
+def test_importar_clientes_csv(client):
+    """Probar la importación masiva desde un CSV enviado en streaming"""
+    contenido = (
+        "nombre,telefono,email\n"
+        "Ana,300,ana@example.com\n"
+        '"Pérez, Luis","301\n302",luis@example.com\n'
+        "Repetida,303,ana@example.com\n"
+    ).encode()
+
+    def fragmentos():
+        for inicio in range(0, len(contenido), 7):
+            yield contenido[inicio:inicio + 7]
+
+    response = client.post("/clientes/bulk/csv", content=fragmentos(), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["creados"] == 2
+    assert [r["estado"] for r in data["resultados"]] == ["creado", "creado", "duplicado_en_lote"]
+
+    nombres = sorted(c["nombre"] for c in client.get("/clientes/").json())
+    assert nombres == ["Ana", "Pérez, Luis"]
+
+    response = client.post("/clientes/bulk/csv", content=b"nombre,email\n", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+
+def test_etag_y_get_condicional(client):
+    """Probar el ETag, la respuesta 304 y la invalidación del cache al escribir"""
+    cliente = client.post("/clientes/", json={
+        "nombre": "Ana", "telefono": "3001112233", "email": "ana@email.com"
+    }).json()
+
+    primera = client.get(f"/clientes/{cliente['id']}")
+    etag = primera.headers["ETag"]
+    assert primera.headers["Cache-Control"].startswith("private")
+
+    # Sin cambios, la respuesta se sirve desde el cache y el cliente puede reutilizar la suya
+    guardada = asyncio.run(cache_compartido.obtener("respuestas", f"/clientes/{cliente['id']}?"))
+    assert guardada["etag"] == etag
+    response = client.get(f"/clientes/{cliente['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    lista = client.get("/clientes/")
+    assert client.get("/clientes/", headers={"If-None-Match": lista.headers["ETag"]}).status_code == 304
+
+    # Una escritura invalida el cache: cambian el cuerpo y el ETag
+    client.put(f"/clientes/{cliente['id']}", json={"nombre": "Ana María"})
+    response = client.get(f"/clientes/{cliente['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["nombre"] == "Ana María"
+    assert response.headers["ETag"] != etag
+    response = client.get("/clientes/", headers={"If-None-Match": lista.headers["ETag"]})
+    assert response.status_code == 200
+
+def test_outbox_registra_y_despacha_eventos(client):
+    """Probar que cada cambio deja un evento en el outbox y que el despachador los entrega"""
+    from app.outbox import despachar_pendientes
+
+    cliente = client.post("/clientes/", json={
+        "nombre": "Ana", "telefono": "3001112233", "email": "ana@email.com"
+    }).json()
+    client.post("/clientes/bulk", json=[{"nombre": "Luis", "telefono": "3002223344", "email": "luis@email.com"}])
+    client.put(f"/clientes/{cliente['id']}", json={"telefono": "3009998877"})
+    client.delete(f"/clientes/{cliente['id']}")
+    # Un cambio rechazado no deja evento
+    client.post("/clientes/", json={"nombre": "Otra", "telefono": "1", "email": "ana2@email.com"})
+    client.post("/clientes/", json={"nombre": "Otra", "telefono": "1", "email": "ana2@email.com"})
+
+    enviados = []
+
+    async def enviar(eventos):
+        enviados.extend(eventos)
+
+    async def fallar(eventos):
+        raise RuntimeError("consumidor caído")
+
+    # Si el consumidor falla, los eventos siguen pendientes
+    with pytest.raises(RuntimeError):
+        asyncio.run(despachar_pendientes(TestingSessionLocal, fallar))
+    assert asyncio.run(despachar_pendientes(TestingSessionLocal, enviar, tamano_lote=3)) == 3
+    assert asyncio.run(despachar_pendientes(TestingSessionLocal, enviar)) == 2
+    assert asyncio.run(despachar_pendientes(TestingSessionLocal, enviar)) == 0
+
+    assert [(e["tipo"], e["entidad_id"]) for e in enviados] == [
+        ("cliente.creado", cliente["id"]),
+        ("cliente.creado", cliente["id"] + 1),
+        ("cliente.actualizado", cliente["id"]),
+        ("cliente.eliminado", cliente["id"]),
+        ("cliente.creado", cliente["id"] + 2),
+    ]
+    # Los eventos llevan los campos que citas replica
+    assert enviados[1]["datos"] == {"nombre": "Luis", "telefono": "3002223344"}
+    assert enviados[2]["datos"] == {"campos": ["telefono"], "nombre": "Ana", "telefono": "3009998877"}
+
+def test_metricas_prometheus(client):
+    """Probar que /metrics agrupa las peticiones por plantilla de ruta y cuenta sus consultas SQL"""
+    from app import metricas
+
+    metricas.instrumentar_engine(engine)
+    ruta = "/clientes/{cliente_id}"
+    antes = metricas.PETICIONES.valor("GET", ruta, "404")
+    consultas_antes = metricas.CONSULTAS_POR_PETICION.suma(ruta)
+    client.get("/clientes/999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert metricas.PETICIONES.valor("GET", ruta, "404") == antes + 1
+    assert metricas.CONSULTAS_POR_PETICION.suma(ruta) == consultas_antes + 1
+    assert f'http_requests_total{{method="GET",route="{ruta}",status="404"}}' in response.text
+    assert "# TYPE db_query_duration_seconds histogram" in response.text
+
+def test_actualizar_cliente_email_duplicado(client):
+    """Probar que el índice único de email rechaza duplicados al actualizar, con y sin UPDATE ... RETURNING"""
+    client.post("/clientes/", json={"nombre": "Ana", "telefono": "3001", "email": "ana@example.com"})
+    luis = client.post("/clientes/", json={"nombre": "Luis", "telefono": "3002", "email": "luis@example.com"}).json()
+
+    response = client.put(f"/clientes/{luis['id']}", json={"email": "ana@example.com"})
+    assert response.status_code == 400
+    assert "email ya está registrado" in response.json()["detail"]
+
+    # Motores sin UPDATE ... RETURNING (SQLite < 3.35): se lee la fila y se actualiza con el ORM
+    with patch.object(engine.sync_engine.dialect, "update_returning", False):
+        assert client.put(f"/clientes/{luis['id']}", json={"email": "ana@example.com"}).status_code == 400
+        response = client.put(f"/clientes/{luis['id']}", json={"telefono": "3003"})
+    assert response.status_code == 200
+    assert response.json() == {**luis, "telefono": "3003"}
+    assert client.get(f"/clientes/{luis['id']}").json()["email"] == "luis@example.com"
+
+def test_otras_violaciones_de_integridad_no_son_email_duplicado():
+    """Probar que solo el índice único de email se traduce en 400; el resto de errores se propaga"""
+    from fastapi import HTTPException
+    from sqlalchemy.exc import IntegrityError
+    from app.main import _guardar_con_email_unico
+
+    async def guardar(mensaje):
+        async def escritura():
+            raise IntegrityError("INSERT", {}, Exception(mensaje))
+
+        async with TestingSessionLocal() as sesion:
+            await _guardar_con_email_unico(sesion, escritura())
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(guardar("UNIQUE constraint failed: clientes.email"))
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        asyncio.run(guardar('duplicate key value violates unique constraint "ix_clientes_email"'))
+    with pytest.raises(IntegrityError):
+        asyncio.run(guardar("NOT NULL constraint failed: clientes.nombre"))
+
+def test_despachador_exige_token_con_webhook():
+    """Probar que el outbox no arranca un webhook sin EVENTOS_TOKEN y lo envía en cada lote"""
+    import httpx
+    from app.outbox import Despachador
+
+    with pytest.raises(RuntimeError, match="EVENTOS_TOKEN"):
+        asyncio.run(Despachador(TestingSessionLocal, url="http://citas/eventos", token="").iniciar())
+
+    despachador = Despachador(TestingSessionLocal, url="http://citas/eventos", token="secreto")
+    cabeceras = {}
+
+    async def enviar():
+        async def responder(peticion):
+            cabeceras.update(peticion.headers)
+            return httpx.Response(200, json={"procesados": 0, "ignorados": 0})
+
+        despachador._cliente = httpx.AsyncClient(transport=httpx.MockTransport(responder))
+        await despachador.enviar([])
+        await despachador._cliente.aclose()
+
+    asyncio.run(enviar())
+    assert cabeceras["x-eventos-token"] == "secreto"
+
+def test_despachador_registra_los_fallos_del_webhook(client, caplog):
+    """Probar que un webhook que falla queda en el log y en las métricas en lugar de ignorarse"""
+    import httpx
+    from app.outbox import ERRORES, Despachador
+
+    client.post("/clientes/", json={"nombre": "Ana", "telefono": "3001", "email": "ana@example.com"})
+    antes = ERRORES.valor("despacho")
+
+    async def despachar():
+        despachador = Despachador(TestingSessionLocal, url="http://citas/eventos", intervalo=0.01, token="secreto")
+        await despachador.iniciar()
+        await despachador._cliente.aclose()
+        despachador._cliente = httpx.AsyncClient(transport=httpx.MockTransport(lambda peticion: httpx.Response(401)))
+        await asyncio.sleep(0.1)
+        await despachador.detener()
+
+    asyncio.run(despachar())
+    assert ERRORES.valor("despacho") > antes
+    assert "No se pudieron despachar los eventos del outbox a http://citas/eventos" in caplog.text
+
+def test_outbox_se_purga_sin_webhook(client):
+    """Probar que sin OUTBOX_WEBHOOK_URL la purga sigue corriendo y elimina también los pendientes antiguos"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import func, select, update
+    from app.models import EventoOutbox
+    from app.outbox import Despachador
+
+    for indice in range(3):
+        client.post("/clientes/", json={"nombre": "Ana", "telefono": "3001", "email": f"ana{indice}@example.com"})
+
+    async def envejecer(evento_id, horas, enviado=False):
+        hace = datetime.now(timezone.utc) - timedelta(hours=horas)
+        async with TestingSessionLocal() as sesion:
+            await sesion.execute(
+                update(EventoOutbox).where(EventoOutbox.id == evento_id)
+                .values(creado_en=hace, enviado_en=hace if enviado else None)
+            )
+            await sesion.commit()
+
+    async def restantes():
+        async with TestingSessionLocal() as sesion:
+            return await sesion.scalar(select(func.count()).select_from(EventoOutbox))
+
+    asyncio.run(envejecer(1, 48, enviado=True))
+    asyncio.run(envejecer(2, 48))
+
+    # Con webhook, un pendiente de dos días aún puede entregarse
+    assert asyncio.run(Despachador(TestingSessionLocal, url="http://citas/eventos", token="x").purgar()) == 1
+    assert asyncio.run(restantes()) == 2
+    # Sin webhook nadie lo enviará: se purga con la retención de los enviados
+    assert asyncio.run(Despachador(TestingSessionLocal, url="").purgar()) == 1
+    assert asyncio.run(restantes()) == 1
+
+    async def arrancar_sin_webhook():
+        despachador = Despachador(TestingSessionLocal, url="", token="")
+        await despachador.iniciar()
+        assert len(despachador._tareas) == 1
+        await despachador.detener()
+
+    asyncio.run(arrancar_sin_webhook())
+
+def test_listado_limita_el_tamano_de_pagina(client):
+    """Probar que limit se acota entre 1 y MAX_LIMIT"""
+    from app.paginacion import MAX_LIMIT
+
+    assert client.get("/clientes/", params={"limit": MAX_LIMIT}).status_code == 200
+    assert client.get("/clientes/", params={"limit": MAX_LIMIT + 1}).status_code == 422
+    assert client.get("/clientes/", params={"limit": 0}).status_code == 422
@@ -30,7 +30,7 @@ Write-Host "  → Iniciando servicio de CLIENTES (puerto 8001)..." -ForegroundCo
 Start-Process powershell -ArgumentList @(
     "-NoExit",
     "-Command",
-    "cd '$PWD\services\clientes'; Write-Host 'Servicio de Clientes' -ForegroundColor Green; .\venv\Scripts\Activate.ps1; python -m uvicorn app.main:app --reload --port 8001"
+    "cd '$PWD\services\clientes'; Write-Host 'Servicio de Clientes' -ForegroundColor Green; .\venv\Scripts\Activate.ps1; python -m app.migrate; python -m uvicorn app.main:app --reload --port 8001"
 )
 
 Start-Sleep -Seconds 2
@@ -40,7 +40,7 @@ Write-Host "  → Iniciando servicio de BARBEROS (puerto 8002)..." -ForegroundCo
 Start-Process powershell -ArgumentList @(
     "-NoExit",
     "-Command",
-    "cd '$PWD\services\barberos'; Write-Host 'Servicio de Barberos' -ForegroundColor Green; .\venv\Scripts\Activate.ps1; python -m uvicorn app.main:app --reload --port 8002"
+    "cd '$PWD\services\barberos'; Write-Host 'Servicio de Barberos' -ForegroundColor Green; .\venv\Scripts\Activate.ps1; python -m app.migrate; python -m uvicorn app.main:app --reload --port 8002"
 )
 
 Start-Sleep -Seconds 2
@@ -50,7 +50,7 @@ Write-Host "  → Iniciando servicio de CITAS (puerto 8003)..." -ForegroundColor
 Start-Process powershell -ArgumentList @(
     "-NoExit",
     "-Command",
-    "cd '$PWD\services\citas'; Write-Host 'Servicio de Citas' -ForegroundColor Green; `$env:CLIENTES_SERVICE_URL='http://localhost:8001'; `$env:BARBEROS_SERVICE_URL='http://localhost:8002'; .\venv\Scripts\Activate.ps1; python -m uvicorn app.main:app --reload --port 8003"
+    "cd '$PWD\services\citas'; Write-Host 'Servicio de Citas' -ForegroundColor Green; `$env:CLIENTES_SERVICE_URL='http://localhost:8001'; `$env:BARBEROS_SERVICE_URL='http://localhost:8002'; .\venv\Scripts\Activate.ps1; python -m app.migrate; python -m uvicorn app.main:app --reload --port 8003"
 )
 
 Start-Sleep -Seconds 3